@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Conversation, Message, Transaction, PendingTransaction, Customer, Vendor
+from .models import Conversation, Message, Transaction, PendingTransaction, Customer, Vendor, SyncOutbox
 
 # Register your models here.
 admin.site.register(Transaction)
@@ -8,5 +8,6 @@ admin.site.register(Conversation)
 admin.site.register(Message)
 admin.site.register(Customer)
 admin.site.register(Vendor)
+admin.site.register(SyncOutbox)
 
 
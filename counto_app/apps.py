@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class CountoAppConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "counto_app"
+
+    def ready(self):
+        # Registers the ledger rollup and data version handlers
+        from counto_app import signals  # noqa: F401
@@ -0,0 +1,51 @@
+import functools
+import hashlib
+
+from django.utils import timezone
+from django.utils.cache import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from counto_app.services.data_version import data_version
+
+
+def data_etag(request, dated: bool = False) -> str:
+    """
+    A strong ETag for a GET from the user's data version and the requested URL
+
+    Every write that can change these responses bumps the version, so the tag
+    changes exactly when the payload can. Responses that also depend on today's
+    date (overdue flags, "this month") pass dated=True.
+    """
+    version = data_version(request.user)
+    request.data_version = version
+    parts = [str(request.user.pk), str(version), request.get_full_path()]
+    if dated:
+        parts.append(timezone.now().date().isoformat())
+    return '"%s"' % hashlib.sha1(':'.join(parts).encode()).hexdigest()
+
+
+def conditional_on_data_version(dated: bool = False):
+    """
+    Serve an APIView GET with an ETag and answer a matching If-None-Match with 304
+
+    The comparison happens before the view runs, so an unchanged poll costs the one
+    version lookup. Only 200 responses are tagged.
+    """
+    def decorator(view_method):
+        @functools.wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            etag = data_etag(request, dated=dated)
+            if_none_match = parse_etags(request.headers.get('If-None-Match', ''))
+            if etag in if_none_match or '*' in if_none_match:
+                response = Response(status=status.HTTP_304_NOT_MODIFIED)
+            else:
+                response = view_method(self, request, *args, **kwargs)
+                if response.status_code != status.HTTP_200_OK:
+                    return response
+            response['ETag'] = etag
+            # Let the browser keep the body but always revalidate it
+            response['Cache-Control'] = 'private, no-cache'
+            return response
+        return wrapper
+    return decorator
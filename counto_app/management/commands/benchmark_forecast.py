@@ -0,0 +1,68 @@
+import time
+from datetime import date, timedelta
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from counto_app.services.forecasting import HISTORY_DAYS, build_forecast, forecast_for_user
+
+# The forecast should stay comfortably inside a dashboard request
+TARGET_MS = 100.0
+
+
+def synthetic_ledger(transactions: int, days: int, seed: int = 7):
+    """Raw transaction arrays for a busy tenant: weekday-heavy sales, monthly rent, daily small expenses"""
+    rng = np.random.default_rng(seed)
+    day_numbers = rng.integers(0, days, size=transactions)
+    is_income = rng.random(transactions) < 0.45
+    amounts = np.where(is_income, rng.gamma(2.0, 900.0, transactions), rng.gamma(1.5, 600.0, transactions))
+    weekend = (day_numbers % 7) >= 5
+    amounts[is_income & weekend] *= 0.4
+    month_start = (day_numbers % 30) == 0
+    amounts[~is_income & month_start] += 25000.0
+    return day_numbers, amounts.round(2), is_income
+
+
+class Command(BaseCommand):
+    help = 'Times the cash-flow forecast over a synthetic 100k-transaction tenant.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--transactions', type=int, default=100000, help='Synthetic transactions to forecast from.')
+        parser.add_argument('--iterations', type=int, default=20, help='Timed forecast runs.')
+        parser.add_argument('--username', help='Also time the uncached database path for this user.')
+
+    def handle(self, *args, **options):
+        transactions = options['transactions']
+        iterations = options['iterations']
+        history_start = date.today() - timedelta(days=HISTORY_DAYS - 1)
+        day_numbers, amounts, is_income = synthetic_ledger(transactions, HISTORY_DAYS)
+        known = (np.array([3, 17, 45]), np.array([15000.0, 8200.0, 30000.0]))
+
+        timings = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            forecast = build_forecast(day_numbers, amounts, is_income, history_start, HISTORY_DAYS, known, known)
+            timings.append((time.perf_counter() - start) * 1000)
+
+        median, worst = float(np.median(timings)), max(timings)
+        self.stdout.write(f"{transactions} transactions: median {median:.2f} ms, worst {worst:.2f} ms")
+        for horizon in forecast['horizons']:
+            self.stdout.write(
+                f"  next {horizon['days']} days: income {horizon['income']:.2f}, "
+                f"expenses {horizon['expenses']:.2f}, net {horizon['net']:.2f}"
+            )
+
+        if options['username']:
+            try:
+                user = User.objects.get(username=options['username'])
+            except User.DoesNotExist:
+                raise CommandError(f"User '{options['username']}' does not exist")
+            start = time.perf_counter()
+            forecast_for_user(user, use_cache=False)
+            self.stdout.write(f"Database path for {user.username}: {(time.perf_counter() - start) * 1000:.2f} ms")
+
+        if worst <= TARGET_MS:
+            self.stdout.write(self.style.SUCCESS(f"Within the {TARGET_MS:.0f} ms target"))
+        else:
+            self.stdout.write(self.style.WARNING(f"Slower than the {TARGET_MS:.0f} ms target"))
@@ -0,0 +1,68 @@
+import re
+import time
+
+from django.core.management.base import BaseCommand
+
+from counto_app.services.intent_classifier import (
+    CUSTOMER_KEYWORDS, QUERY_KEYWORDS, TRANSACTION_KEYWORDS, VENDOR_KEYWORDS, classify_intent
+)
+
+SAMPLE_MESSAGES = [
+    "paid 500 to Raju for cogs via UPI",
+    "received 12000 from Prakash Traders",
+    "How much did I spend last month?",
+    "Add a new customer named ABC Corp, email abc@corp.in",
+    "show me all vendors in Delhi",
+    "what is the outstanding balance for Suman & Co",
+    "create vendor record for Smith & Co with GST 29ABCDE1234F1Z5",
+    "hello, what can you do?",
+    "list my customers",
+    "spent 1250 on groceries yesterday by card",
+]
+
+
+def legacy_classify(user_message):
+    """The per-keyword substring scans plus query regex loop that classify_intent replaced"""
+    user_msg_lower = user_message.lower()
+    transaction_count = sum(1 for keyword in TRANSACTION_KEYWORDS if keyword in user_msg_lower)
+    customer_count = sum(1 for keyword in CUSTOMER_KEYWORDS if keyword in user_msg_lower)
+    vendor_count = sum(1 for keyword in VENDOR_KEYWORDS if keyword in user_msg_lower)
+    max_count = max(transaction_count, customer_count, vendor_count)
+    if max_count == 0:
+        intent = "UNKNOWN"
+    elif transaction_count == max_count:
+        intent = "TRANSACTION"
+    elif customer_count == max_count:
+        intent = "CUSTOMER"
+    else:
+        intent = "VENDOR"
+    is_query = any(re.search(pattern, user_message.lower()) for pattern in QUERY_KEYWORDS)
+    return intent, is_query
+
+
+class Command(BaseCommand):
+    help = 'Times the compiled intent classifier against the legacy keyword scans.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20000, help='Passes over the sample messages.')
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        total = iterations * len(SAMPLE_MESSAGES)
+
+        mismatches = [m for m in SAMPLE_MESSAGES if legacy_classify(m)[0] != classify_intent(m).intent]
+        for message in mismatches:
+            self.stdout.write(self.style.WARNING(f"Intent differs from legacy scan: {message!r}"))
+
+        for name, classify in (('legacy keyword scan', legacy_classify), ('compiled classifier', classify_intent)):
+            start = time.perf_counter()
+            for _ in range(iterations):
+                for message in SAMPLE_MESSAGES:
+                    classify(message)
+            elapsed = time.perf_counter() - start
+            self.stdout.write(f"{name:22} {elapsed * 1e6 / total:8.2f} µs/message ({total} messages)")
+
+        confident = sum(1 for m in SAMPLE_MESSAGES if classify_intent(m).confident)
+        self.stdout.write(self.style.SUCCESS(
+            f"{confident}/{len(SAMPLE_MESSAGES)} sample messages classified confidently"
+        ))
@@ -0,0 +1,79 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from counto_app.services.sheets_services import GoogleSheetsService
+
+
+class CountingResource:
+    """Wraps a Sheets API resource and counts the requests executed through it"""
+
+    def __init__(self, resource, counter):
+        self._resource = resource
+        self._counter = counter
+
+    def __getattr__(self, name):
+        attribute = getattr(self._resource, name)
+        if not callable(attribute):
+            return attribute
+
+        def call(*args, **kwargs):
+            result = attribute(*args, **kwargs)
+            if hasattr(result, 'execute'):
+                return CountingRequest(result, self._counter)
+            return CountingResource(result, self._counter)
+        return call
+
+
+class CountingRequest:
+    def __init__(self, request, counter):
+        self._request = request
+        self._counter = counter
+
+    def execute(self, *args, **kwargs):
+        self._counter['requests'] += 1
+        return self._request.execute(*args, **kwargs)
+
+
+class Command(BaseCommand):
+    help = 'Counts Sheets API round trips and times reading transactions, customers and vendors for one query.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=5, help='Timed runs of each read strategy.')
+
+    def handle(self, *args, **options):
+        try:
+            service = GoogleSheetsService()
+        except Exception as e:
+            raise CommandError(f"Google Sheets is not configured: {e}")
+
+        counter = {'requests': 0}
+        service.sheet = CountingResource(service.sheet, counter)
+        ranges = [service.transactions_range, service.customers_range, service.vendors_range]
+
+        def expire_mirrors():
+            for mirror in service._mirrors.values():
+                mirror.expire()
+
+        strategies = [
+            ('one request per range', None, lambda: [service._get_values(range_name) for range_name in ranges]),
+            ('get_ranges', None, lambda: service.get_ranges(ranges)),
+            ('get_all_records, cold mirrors', lambda: service._mirrors.clear(), service.get_all_records),
+            ('get_all_records, stale mirrors', expire_mirrors, service.get_all_records),
+            ('get_all_records, fresh mirrors', None, service.get_all_records),
+        ]
+
+        for label, prepare, read in strategies:
+            timings, requests = [], []
+            for _ in range(options['iterations']):
+                if prepare:
+                    prepare()
+                counter['requests'] = 0
+                start = time.perf_counter()
+                read()
+                timings.append((time.perf_counter() - start) * 1000)
+                requests.append(counter['requests'])
+            self.stdout.write(
+                f"{label}: {np.mean(requests):.1f} requests per query, median {float(np.median(timings)):.1f} ms"
+            )
@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from counto_app.services.sync_outbox import DEFAULT_MAX_ATTEMPTS, process_outbox
+
+
+class Command(BaseCommand):
+    help = 'Drains the sync outbox, pushing queued records to Tally and Google Sheets and refreshing chat summaries.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50, help='Number of outbox entries to claim per batch.')
+        parser.add_argument('--max-attempts', type=int, default=DEFAULT_MAX_ATTEMPTS,
+                            help='Attempts before an entry is marked FAILED.')
+        parser.add_argument('--sleep', type=float, default=5.0, help='Seconds to wait when the outbox is empty.')
+        parser.add_argument('--once', action='store_true',
+                            help='Drain everything that is due, flushing waiting Sheets rows now, then exit.')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        max_attempts = options['max_attempts']
+
+        self.stdout.write('Processing sync outbox...')
+        try:
+            while True:
+                stats = process_outbox(batch_size=batch_size, max_attempts=max_attempts, flush_sheets=options['once'])
+                if stats['claimed']:
+                    self.stdout.write(
+                        f"Claimed {stats['claimed']}: {stats['done']} done, "
+                        f"{stats['retried']} rescheduled, {stats['failed']} failed"
+                    )
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping outbox worker.')
+
+        self.stdout.write(self.style.SUCCESS('Sync outbox drained.'))
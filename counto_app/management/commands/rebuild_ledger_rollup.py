@@ -0,0 +1,23 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from counto_app.services.ledger_rollup import rebuild_ledger_rollup
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the daily and period ledger rollups from the Transaction table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', help='Only rebuild this user\'s rollup rows.')
+
+    def handle(self, *args, **options):
+        user = None
+        if options['username']:
+            try:
+                user = User.objects.get(username=options['username'])
+            except User.DoesNotExist:
+                raise CommandError(f"User '{options['username']}' does not exist")
+
+        self.stdout.write('Rebuilding ledger rollups...')
+        written = rebuild_ledger_rollup(user=user)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} rollup rows.'))
@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from counto_app.services.olap_store import OlapStore, prune_ledger_changes
+
+
+class Command(BaseCommand):
+    help = 'Brings the per-user OLAP sidecar files under OLAP_DATA_DIR up to date with the main database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', help='Only refresh this user\'s sidecar.')
+        parser.add_argument('--rebuild', action='store_true', help='Copy every transaction again instead of applying changes.')
+        parser.add_argument('--prune', action='store_true', help='Delete change log rows older than OLAP_CHANGE_RETENTION_DAYS afterwards.')
+
+    def handle(self, *args, **options):
+        if not settings.OLAP_DATA_DIR:
+            raise CommandError('OLAP_DATA_DIR is not set')
+
+        users = User.objects.filter(transaction__isnull=False).distinct()
+        if options['username']:
+            users = User.objects.filter(username=options['username'])
+            if not users.exists():
+                raise CommandError(f"User '{options['username']}' does not exist")
+
+        for user in users.order_by('id'):
+            store = OlapStore(user.pk)
+            if options['rebuild']:
+                count = store.rebuild()
+                self.stdout.write(f'{user.username}: rebuilt with {count} transactions')
+            else:
+                count = store.refresh()
+                self.stdout.write(f'{user.username}: {count} transactions updated')
+
+        if options['prune']:
+            self.stdout.write(f'Pruned {prune_ledger_changes()} change log rows.')
+        self.stdout.write(self.style.SUCCESS('OLAP sidecars are up to date.'))
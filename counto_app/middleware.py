@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.db import connection
+
+
+class QueryCountHeaderMiddleware:
+    """In DEBUG, report the number of database queries a request ran in an X-DB-Query-Count header"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.DEBUG:
+            return self.get_response(request)
+
+        count = 0
+
+        def count_query(execute, sql, params, many, context):
+            nonlocal count
+            count += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count_query):
+            response = self.get_response(request)
+        # Streaming bodies run after this point, so their queries are not included
+        response['X-DB-Query-Count'] = str(count)
+        return response
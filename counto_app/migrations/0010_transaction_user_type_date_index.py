@@ -0,0 +1,20 @@
+# Generated by Django 4.2.7 on 2026-10-16 20:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("counto_app", "0009_conversation_summary"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="transaction",
+            index=models.Index(
+                fields=["user", "transaction_type", "date"],
+                name="counto_app__user_id_5b4b16_idx",
+            ),
+        ),
+    ]
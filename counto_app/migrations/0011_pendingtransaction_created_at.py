@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-16 20:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("counto_app", "0010_transaction_user_type_date_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="pendingtransaction",
+            name="created_at",
+            field=models.DateTimeField(auto_now_add=True, null=True),
+        ),
+    ]
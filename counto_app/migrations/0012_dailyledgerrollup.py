@@ -0,0 +1,86 @@
+# Generated by Django 4.2.7 on 2026-10-16 20:59
+
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_rollup(apps, schema_editor):
+    Transaction = apps.get_model("counto_app", "Transaction")
+    DailyLedgerRollup = apps.get_model("counto_app", "DailyLedgerRollup")
+    rows = (
+        Transaction.objects.values("user_id", "date", "transaction_type", "category")
+        .annotate(total=models.Sum("amount"), count=models.Count("id"))
+        .order_by()
+    )
+    DailyLedgerRollup.objects.bulk_create(
+        [
+            DailyLedgerRollup(
+                user_id=row["user_id"],
+                date=row["date"],
+                transaction_type=row["transaction_type"],
+                category=row["category"] or "",
+                total_amount=row["total"],
+                txn_count=row["count"],
+            )
+            for row in rows.iterator()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("counto_app", "0011_pendingtransaction_created_at"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DailyLedgerRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField()),
+                (
+                    "transaction_type",
+                    models.CharField(
+                        choices=[("INCOME", "Income"), ("EXPENSE", "Expense")],
+                        max_length=7,
+                    ),
+                ),
+                ("category", models.CharField(blank=True, default="", max_length=100)),
+                (
+                    "total_amount",
+                    models.DecimalField(
+                        decimal_places=2, default=Decimal("0.00"), max_digits=14
+                    ),
+                ),
+                ("txn_count", models.PositiveIntegerField(default=0)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="dailyledgerrollup",
+            constraint=models.UniqueConstraint(
+                fields=("user", "date", "transaction_type", "category"),
+                name="unique_daily_ledger_rollup",
+            ),
+        ),
+        migrations.RunPython(backfill_rollup, migrations.RunPython.noop),
+    ]
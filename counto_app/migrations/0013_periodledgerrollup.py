@@ -0,0 +1,111 @@
+# Generated by Django 4.2.7 on 2026-10-16 21:02
+
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from datetime import timedelta
+
+
+def backfill_periods(apps, schema_editor):
+    DailyLedgerRollup = apps.get_model("counto_app", "DailyLedgerRollup")
+    PeriodLedgerRollup = apps.get_model("counto_app", "PeriodLedgerRollup")
+    starts = {
+        "WEEK": lambda day: day - timedelta(days=day.weekday()),
+        "MONTH": lambda day: day.replace(day=1),
+        "YEAR": lambda day: day.replace(month=1, day=1),
+    }
+    periods = {}
+    for row in DailyLedgerRollup.objects.all().iterator():
+        for level, start in starts.items():
+            key = (row.user_id, level, start(row.date), row.transaction_type, row.category)
+            total, count = periods.get(key, (Decimal("0"), 0))
+            periods[key] = (total + row.total_amount, count + row.txn_count)
+    PeriodLedgerRollup.objects.bulk_create(
+        [
+            PeriodLedgerRollup(
+                user_id=user_id,
+                granularity=level,
+                period_start=period_start,
+                transaction_type=transaction_type,
+                category=category,
+                total_amount=total,
+                txn_count=count,
+            )
+            for (user_id, level, period_start, transaction_type, category), (total, count) in periods.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("counto_app", "0012_dailyledgerrollup"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PeriodLedgerRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "granularity",
+                    models.CharField(
+                        choices=[
+                            ("WEEK", "Week"),
+                            ("MONTH", "Month"),
+                            ("YEAR", "Year"),
+                        ],
+                        max_length=5,
+                    ),
+                ),
+                ("period_start", models.DateField()),
+                (
+                    "transaction_type",
+                    models.CharField(
+                        choices=[("INCOME", "Income"), ("EXPENSE", "Expense")],
+                        max_length=7,
+                    ),
+                ),
+                ("category", models.CharField(blank=True, default="", max_length=100)),
+                (
+                    "total_amount",
+                    models.DecimalField(
+                        decimal_places=2, default=Decimal("0.00"), max_digits=14
+                    ),
+                ),
+                ("txn_count", models.PositiveIntegerField(default=0)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="periodledgerrollup",
+            constraint=models.UniqueConstraint(
+                fields=(
+                    "user",
+                    "granularity",
+                    "period_start",
+                    "transaction_type",
+                    "category",
+                ),
+                name="unique_period_ledger_rollup",
+            ),
+        ),
+        migrations.RunPython(backfill_periods, migrations.RunPython.noop),
+    ]
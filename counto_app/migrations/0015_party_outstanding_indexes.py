@@ -0,0 +1,42 @@
+# Generated by Django 4.2.7 on 2026-10-16 21:05
+
+from django.db import migrations, models
+import django.db.models.expressions
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("counto_app", "0014_userdataversion"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="customer",
+            index=models.Index(
+                models.F("user"),
+                models.OrderBy(
+                    django.db.models.expressions.CombinedExpression(
+                        models.F("total_receivable"), "-", models.F("total_received")
+                    ),
+                    descending=True,
+                ),
+                condition=models.Q(("is_active", True)),
+                name="customer_outstanding_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="vendor",
+            index=models.Index(
+                models.F("user"),
+                models.OrderBy(
+                    django.db.models.expressions.CombinedExpression(
+                        models.F("total_payable"), "-", models.F("total_paid")
+                    ),
+                    descending=True,
+                ),
+                condition=models.Q(("is_active", True)),
+                name="vendor_outstanding_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-16 21:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("counto_app", "0015_party_outstanding_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="userdataversion",
+            name="ledger_epoch",
+            field=models.PositiveBigIntegerField(default=1),
+        ),
+    ]
@@ -0,0 +1,103 @@
+# Generated by Django 4.2.7 on 2026-10-16 21:12
+
+import counto_app.money
+from decimal import Decimal
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("counto_app", "0016_userdataversion_ledger_epoch"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="bill",
+            name="amount_due",
+            field=counto_app.money.MoneyField(decimal_places=2, max_digits=12),
+        ),
+        migrations.AlterField(
+            model_name="bill",
+            name="amount_paid",
+            field=counto_app.money.MoneyField(
+                decimal_places=2, default=Decimal("0.00"), max_digits=12
+            ),
+        ),
+        migrations.AlterField(
+            model_name="billpayment",
+            name="amount",
+            field=counto_app.money.MoneyField(decimal_places=2, max_digits=12),
+        ),
+        migrations.AlterField(
+            model_name="customer",
+            name="total_receivable",
+            field=counto_app.money.MoneyField(
+                decimal_places=2, default=Decimal("0.00"), max_digits=12
+            ),
+        ),
+        migrations.AlterField(
+            model_name="customer",
+            name="total_received",
+            field=counto_app.money.MoneyField(
+                decimal_places=2, default=Decimal("0.00"), max_digits=12
+            ),
+        ),
+        migrations.AlterField(
+            model_name="dailyledgerrollup",
+            name="total_amount",
+            field=counto_app.money.MoneyField(
+                decimal_places=2, default=Decimal("0.00"), max_digits=14
+            ),
+        ),
+        migrations.AlterField(
+            model_name="invoice",
+            name="amount_due",
+            field=counto_app.money.MoneyField(decimal_places=2, max_digits=12),
+        ),
+        migrations.AlterField(
+            model_name="invoice",
+            name="amount_received",
+            field=counto_app.money.MoneyField(
+                decimal_places=2, default=Decimal("0.00"), max_digits=12
+            ),
+        ),
+        migrations.AlterField(
+            model_name="invoicepayment",
+            name="amount",
+            field=counto_app.money.MoneyField(decimal_places=2, max_digits=12),
+        ),
+        migrations.AlterField(
+            model_name="pendingtransaction",
+            name="amount",
+            field=counto_app.money.MoneyField(
+                blank=True, decimal_places=2, max_digits=12, null=True
+            ),
+        ),
+        migrations.AlterField(
+            model_name="periodledgerrollup",
+            name="total_amount",
+            field=counto_app.money.MoneyField(
+                decimal_places=2, default=Decimal("0.00"), max_digits=14
+            ),
+        ),
+        migrations.AlterField(
+            model_name="transaction",
+            name="amount",
+            field=counto_app.money.MoneyField(decimal_places=2, max_digits=12),
+        ),
+        migrations.AlterField(
+            model_name="vendor",
+            name="total_paid",
+            field=counto_app.money.MoneyField(
+                decimal_places=2, default=Decimal("0.00"), max_digits=12
+            ),
+        ),
+        migrations.AlterField(
+            model_name="vendor",
+            name="total_payable",
+            field=counto_app.money.MoneyField(
+                decimal_places=2, default=Decimal("0.00"), max_digits=12
+            ),
+        ),
+    ]
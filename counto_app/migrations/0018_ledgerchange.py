@@ -0,0 +1,54 @@
+# Generated by Django 4.2.7 on 2026-10-16 21:14
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("counto_app", "0017_money_fields"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LedgerChange",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("transaction_id", models.BigIntegerField()),
+                ("created_at", models.DateTimeField(default=django.utils.timezone.now)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["user", "id"], name="counto_app__user_id_0aed35_idx"
+                    ),
+                    models.Index(
+                        fields=["user", "created_at"],
+                        name="counto_app__user_id_f08d36_idx",
+                    ),
+                    models.Index(
+                        fields=["created_at"], name="counto_app__created_6f87e3_idx"
+                    ),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.7 on 2026-10-16 22:25
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("counto_app", "0018_ledgerchange"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SheetsWrite",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("spreadsheet_id", models.CharField(max_length=100)),
+                ("sheet_name", models.CharField(max_length=100)),
+                ("row_numbers", models.JSONField(default=list)),
+                ("created_at", models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["spreadsheet_id", "sheet_name", "id"],
+                        name="counto_app__spreads_928c85_idx",
+                    ),
+                    models.Index(
+                        fields=["created_at"], name="counto_app__created_8f0905_idx"
+                    ),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-16 22:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("counto_app", "0019_sheetswrite"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="syncoutbox",
+            name="target",
+            field=models.CharField(
+                choices=[
+                    ("TALLY", "Tally"),
+                    ("SHEETS", "Google Sheets"),
+                    ("GEMINI", "Gemini"),
+                ],
+                max_length=10,
+            ),
+        ),
+    ]
@@ -1,8 +1,12 @@
-from django.db import models
+from django.db import models, transaction as db_transaction
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
+from django.utils import timezone
+from datetime import timedelta
 from decimal import Decimal
 
+from .money import MoneyField
+
 # Create your models here.
 class Conversation(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -10,6 +14,10 @@ class Conversation(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     active = models.BooleanField(default=True)
     
+    # Rolling summary of the messages that have slid out of the history window
+    summary = models.TextField(blank=True, default='')
+    summarized_through_id = models.BigIntegerField(null=True, blank=True)
+    
     def __str__(self):
         return f"Conversation {self.id} - {self.user.username}"
 
@@ -26,6 +34,9 @@ class Message(models.Model):
     
     class Meta:
         ordering = ['timestamp']
+        indexes = [
+            models.Index(fields=['conversation', 'id']),
+        ]
         
     def __str__(self):
         return f"{self.sender} message in conversation {self.conversation_id}"
@@ -36,16 +47,80 @@ class PendingTransaction(models.Model):
     date = models.DateField(null=True, blank=True)
     description = models.CharField(max_length=255, null=True, blank=True)
     category = models.CharField(max_length=100, null=True, blank=True)
-    amount = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    amount = MoneyField(null=True, blank=True)
     transaction_type = models.CharField(max_length=10, null=True, blank=True)
     payment_method = models.CharField(max_length=50, blank=True, null=True)
     reference_number = models.CharField(max_length=50, blank=True, null=True)
     party = models.CharField(max_length=100, blank=True, null=True)
+    notes = models.TextField(blank=True, null=True)
+    # {'intent': TRANSACTION/CUSTOMER/VENDOR, 'extracted_data': {...}} awaiting the user's confirmation
+    raw_data = models.JSONField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True, null=True)
     
     def __str__(self):
         return f"Pending: {self.description if self.description else 'New Transaction'}"
 
 
+# Invoices and bills older than this and not fully settled make their party overdue
+OVERDUE_AFTER_DAYS = 30
+
+
+class PartyQuerySet(models.QuerySet):
+    """Outstanding balance and overdue status for customers and vendors, computed in SQL"""
+    # Subclasses name the balance fields the outstanding amount is computed from
+    due_field = ''
+    settled_field = ''
+    # ...and the invoice or bill model, by name since it is defined further down, whose
+    # unsettled documents make the party overdue
+    document_model = ''
+    document_party_field = ''
+    document_due_field = 'amount_due'
+    document_settled_field = ''
+
+    def _overdue_documents(self, cutoff):
+        documents = self.model._meta.apps.get_model(self.model._meta.app_label, self.document_model)
+        return documents.objects.filter(**{
+            self.document_party_field: models.OuterRef('pk'),
+            'date__lt': cutoff,
+            f'{self.document_settled_field}__lt': models.F(self.document_due_field),
+        })
+
+    def outstanding_expression(self):
+        return models.ExpressionWrapper(
+            models.F(self.due_field) - models.F(self.settled_field),
+            output_field=models.DecimalField(max_digits=12, decimal_places=2)
+        )
+
+    def with_outstanding(self):
+        """Annotate outstanding, the same amount as the outstanding_balance property"""
+        return self.annotate(outstanding=self.outstanding_expression())
+
+    def with_overdue(self, today=None):
+        """Annotate has_overdue with an EXISTS subquery instead of a query per party"""
+        cutoff = (today or timezone.now().date()) - timedelta(days=OVERDUE_AFTER_DAYS)
+        return self.annotate(has_overdue=models.Exists(self._overdue_documents(cutoff)))
+
+    def top_outstanding(self, limit=5):
+        """The parties with the largest outstanding balances, ordered and limited in the database"""
+        return self.with_outstanding().order_by('-outstanding', 'id')[:limit]
+
+
+class CustomerQuerySet(PartyQuerySet):
+    due_field = 'total_receivable'
+    settled_field = 'total_received'
+    document_model = 'Invoice'
+    document_party_field = 'customer'
+    document_settled_field = 'amount_received'
+
+
+class VendorQuerySet(PartyQuerySet):
+    due_field = 'total_payable'
+    settled_field = 'total_paid'
+    document_model = 'Bill'
+    document_party_field = 'vendor'
+    document_settled_field = 'amount_paid'
+
+
 class Customer(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     name = models.CharField(max_length=255)
@@ -55,18 +130,27 @@ class Customer(models.Model):
     address = models.TextField(blank=True, null=True)
     
     # Balance tracking
-    total_receivable = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
-    total_received = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+    total_receivable = MoneyField(default=Decimal('0.00'))
+    total_received = MoneyField(default=Decimal('0.00'))
     
     # Metadata
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
 
+    objects = CustomerQuerySet.as_manager()
+
     class Meta:
         indexes = [
             models.Index(fields=['user', 'name']),
             models.Index(fields=['user', 'is_active']),
+            # Serves top_outstanding() for active customers without sorting every row
+            models.Index(
+                models.F('user'),
+                (models.F('total_receivable') - models.F('total_received')).desc(),
+                name='customer_outstanding_idx',
+                condition=models.Q(is_active=True)
+            ),
         ]
 
     def __str__(self):
@@ -75,25 +159,14 @@ class Customer(models.Model):
     @property
     def outstanding_balance(self):
         """Amount still to be received from customer"""
-        # Ensure both values are Decimal before subtraction
-        if not isinstance(self.total_receivable, Decimal):
-            total_receivable = Decimal(str(self.total_receivable or '0'))
-        else:
-            total_receivable = self.total_receivable
-            
-        if not isinstance(self.total_received, Decimal):
-            total_received = Decimal(str(self.total_received or '0'))
-        else:
-            total_received = self.total_received
-            
-        return (total_receivable - total_received).quantize(Decimal('0.00'))
+        return self.total_receivable - self.total_received
 
     @property
     def is_overdue(self):
         """Check if customer has overdue payments"""
         from django.utils import timezone
         from datetime import timedelta
-        thirty_days_ago = timezone.now().date() - timedelta(days=30)
+        thirty_days_ago = timezone.now().date() - timedelta(days=OVERDUE_AFTER_DAYS)
         
         return self.invoices.filter(
             date__lt=thirty_days_ago,
@@ -120,18 +193,27 @@ class Vendor(models.Model):
     address = models.TextField(blank=True, null=True)
     
     # Balance tracking
-    total_payable = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
-    total_paid = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+    total_payable = MoneyField(default=Decimal('0.00'))
+    total_paid = MoneyField(default=Decimal('0.00'))
     
     # Metadata
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
 
+    objects = VendorQuerySet.as_manager()
+
     class Meta:
         indexes = [
             models.Index(fields=['user', 'name']),
             models.Index(fields=['user', 'is_active']),
+            # Serves top_outstanding() for active vendors without sorting every row
+            models.Index(
+                models.F('user'),
+                (models.F('total_payable') - models.F('total_paid')).desc(),
+                name='vendor_outstanding_idx',
+                condition=models.Q(is_active=True)
+            ),
         ]
 
     def __str__(self):
@@ -140,18 +222,7 @@ class Vendor(models.Model):
     @property
     def outstanding_balance(self):
         """Amount still to be paid to vendor"""
-        # Ensure both values are Decimal before subtraction
-        if not isinstance(self.total_payable, Decimal):
-            total_payable = Decimal(str(self.total_payable or '0'))
-        else:
-            total_payable = self.total_payable
-            
-        if not isinstance(self.total_paid, Decimal):
-            total_paid = Decimal(str(self.total_paid or '0'))
-        else:
-            total_paid = self.total_paid
-            
-        return (total_payable - total_paid).quantize(Decimal('0.00'))
+        return self.total_payable - self.total_paid
 
     def update_balances(self):
         """Recalculate balance from related transactions"""
@@ -176,7 +247,7 @@ class Transaction(models.Model):
     description = models.CharField(max_length=255)
     category = models.CharField(max_length=100, blank=True)
     transaction_type = models.CharField(max_length=7, choices=TYPE_CHOICES)
-    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    amount = MoneyField()
     
     # Optional party reference (but not required)
     customer = models.ForeignKey(Customer, on_delete=models.SET_NULL, null=True, blank=True)
@@ -194,6 +265,7 @@ class Transaction(models.Model):
         indexes = [
             models.Index(fields=['user', 'date']),
             models.Index(fields=['user', 'transaction_type']),
+            models.Index(fields=['user', 'transaction_type', 'date']),
             models.Index(fields=['user', 'category']),
             models.Index(fields=['date', 'transaction_type']),
         ]
@@ -206,6 +278,15 @@ class Transaction(models.Model):
         if self.customer and self.vendor:
             raise ValidationError("Transaction cannot have both customer and vendor")
 
+    def save(self, *args, **kwargs):
+        # DailyLedgerRollup is updated by signal handlers, which run inside this atomic block
+        with db_transaction.atomic():
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with db_transaction.atomic():
+            return super().delete(*args, **kwargs)
+
 
 class Invoice(models.Model):
     """Track what customers owe"""
@@ -217,8 +298,8 @@ class Invoice(models.Model):
     due_date = models.DateField(null=True, blank=True)
     
     description = models.CharField(max_length=255)
-    amount_due = models.DecimalField(max_digits=12, decimal_places=2)
-    amount_received = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+    amount_due = MoneyField()
+    amount_received = MoneyField(default=Decimal('0.00'))
     
     created_at = models.DateTimeField(auto_now_add=True)
     
@@ -271,8 +352,8 @@ class Bill(models.Model):
     due_date = models.DateField(null=True, blank=True)
     
     description = models.CharField(max_length=255)
-    amount_due = models.DecimalField(max_digits=12, decimal_places=2)
-    amount_paid = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+    amount_due = MoneyField()
+    amount_paid = MoneyField(default=Decimal('0.00'))
     
     created_at = models.DateTimeField(auto_now_add=True)
     
@@ -319,7 +400,7 @@ class Bill(models.Model):
 class InvoicePayment(models.Model):
     """Track payments received against invoices"""
     invoice = models.ForeignKey(Invoice, on_delete=models.CASCADE, related_name='payments')
-    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    amount = MoneyField()
     date = models.DateField()
     transaction = models.ForeignKey(Transaction, on_delete=models.SET_NULL, null=True, blank=True)
     notes = models.TextField(blank=True, null=True)
@@ -333,7 +414,7 @@ class InvoicePayment(models.Model):
 class BillPayment(models.Model):
     """Track payments made against bills"""
     bill = models.ForeignKey(Bill, on_delete=models.CASCADE, related_name='payments')
-    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    amount = MoneyField()
     date = models.DateField()
     transaction = models.ForeignKey(Transaction, on_delete=models.SET_NULL, null=True, blank=True)
     notes = models.TextField(blank=True, null=True)
@@ -342,3 +423,137 @@ class BillPayment(models.Model):
 
     def __str__(self):
         return f"Payment ₹{self.amount} for {self.bill.bill_number}"
+
+
+class SyncOutbox(models.Model):
+    """Queued sync of a local record to Tally or Google Sheets, or Gemini work kept off the request path"""
+    TARGET_CHOICES = [
+        ('TALLY', 'Tally'),
+        ('SHEETS', 'Google Sheets'),
+        ('GEMINI', 'Gemini'),
+    ]
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('PROCESSING', 'Processing'),
+        ('DONE', 'Done'),
+        ('FAILED', 'Failed'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    target = models.CharField(max_length=10, choices=TARGET_CHOICES)
+    operation = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict)
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, null=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.target} {self.operation} ({self.status})"
+
+
+class DailyLedgerRollup(models.Model):
+    """Per-day transaction sums by type and category, kept in step with Transaction by counto_app.signals"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    date = models.DateField()
+    transaction_type = models.CharField(max_length=7, choices=Transaction.TYPE_CHOICES)
+    category = models.CharField(max_length=100, blank=True, default='')
+    total_amount = MoneyField(max_digits=14, default=Decimal('0.00'))
+    txn_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'date', 'transaction_type', 'category'],
+                name='unique_daily_ledger_rollup'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.transaction_type} {self.category or '-'}: ₹{self.total_amount} ({self.txn_count})"
+
+
+class PeriodLedgerRollup(models.Model):
+    """Week, month and year sums over DailyLedgerRollup, so long ranges read a few rows instead of every day"""
+    GRANULARITY_CHOICES = [
+        ('WEEK', 'Week'),
+        ('MONTH', 'Month'),
+        ('YEAR', 'Year'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    granularity = models.CharField(max_length=5, choices=GRANULARITY_CHOICES)
+    period_start = models.DateField()
+    transaction_type = models.CharField(max_length=7, choices=Transaction.TYPE_CHOICES)
+    category = models.CharField(max_length=100, blank=True, default='')
+    total_amount = MoneyField(max_digits=14, default=Decimal('0.00'))
+    txn_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'granularity', 'period_start', 'transaction_type', 'category'],
+                name='unique_period_ledger_rollup'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.granularity} {self.period_start} {self.transaction_type} {self.category or '-'}: ₹{self.total_amount}"
+
+
+class UserDataVersion(models.Model):
+    """Per-user counter bumped on every ledger write, used to key cached responses"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='data_version')
+    version = models.PositiveBigIntegerField(default=1)
+    # Bumped only when an existing transaction changes or goes away; new transactions just move version
+    ledger_epoch = models.PositiveBigIntegerField(default=1)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user} v{self.version}"
+
+
+class LedgerChange(models.Model):
+    """Transactions touched by each ledger write, read in id order by the per-user OLAP sidecars"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    # Not a foreign key: the row must outlive the deleted transaction it records
+    transaction_id = models.BigIntegerField()
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'id']),
+            models.Index(fields=['user', 'created_at']),
+            models.Index(fields=['created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} transaction {self.transaction_id} at {self.created_at}"
+
+
+class SheetsWrite(models.Model):
+    """Sheet rows a sync overwrote in place, read by every process's Sheets mirrors to re-fetch them"""
+    spreadsheet_id = models.CharField(max_length=100)
+    sheet_name = models.CharField(max_length=100)
+    row_numbers = models.JSONField(default=list)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['spreadsheet_id', 'sheet_name', 'id']),
+            models.Index(fields=['created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.sheet_name} rows {self.row_numbers} at {self.created_at}"
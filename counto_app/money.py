@@ -0,0 +1,162 @@
+import re
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from functools import total_ordering
+from typing import Any, Optional
+
+from django.db import models
+from django.db.models.query_utils import DeferredAttribute
+
+CURRENCY_NOISE = re.compile(r"[₹$€£,\s]|rs\.?|inr", re.IGNORECASE)
+
+
+@total_ordering
+class Money:
+    """
+    An amount in rupees held as integer paise
+
+    Arithmetic and comparisons are integer operations, so sums are exact and
+    cheap, and arrays of .paise values aggregate exactly in NumPy. Convert to
+    Decimal or float only at the edges: the database, API payloads and display.
+    """
+    __slots__ = ('paise',)
+
+    def __init__(self, paise: int = 0):
+        self.paise = int(paise)
+
+    @classmethod
+    def of(cls, value: Any) -> 'Money':
+        """
+        Money from rupees given as Money, Decimal, int, float or a string such as '₹1,250.50'
+
+        Fractions of a paisa round half up. A float rounds as its shortest repr does,
+        so 1.005 and '1.005' both give 1.01. Booleans and non-finite values are
+        rejected with ValueError rather than read as 1, 0 or infinity.
+        """
+        if isinstance(value, Money):
+            return value
+        if value is None or value == '':
+            return cls(0)
+        if isinstance(value, bool):
+            raise ValueError(f"Not an amount: {value!r}")
+        if isinstance(value, int):
+            return cls(value * 100)
+        if isinstance(value, float):
+            value = Decimal(repr(value))
+        elif not isinstance(value, Decimal):
+            try:
+                value = Decimal(CURRENCY_NOISE.sub('', str(value)) or '0')
+            except InvalidOperation:
+                raise ValueError(f"Not an amount: {value!r}")
+        if not value.is_finite():
+            raise ValueError(f"Not an amount: {value!r}")
+        return cls(int(value.scaleb(2).to_integral_value(rounding=ROUND_HALF_UP)))
+
+    def to_decimal(self) -> Decimal:
+        return Decimal(self.paise).scaleb(-2)
+
+    def __float__(self) -> float:
+        return self.paise / 100
+
+    def __str__(self) -> str:
+        return str(self.to_decimal())
+
+    def __repr__(self) -> str:
+        return f"Money('{self}')"
+
+    def format(self) -> str:
+        """₹1,234.50, with a leading minus for negative amounts"""
+        sign = '-' if self.paise < 0 else ''
+        rupees, paise = divmod(abs(self.paise), 100)
+        return f"{sign}₹{rupees:,}.{paise:02d}"
+
+    def __add__(self, other: 'Money') -> 'Money':
+        return Money(self.paise + Money.of(other).paise)
+
+    __radd__ = __add__
+
+    def __sub__(self, other: 'Money') -> 'Money':
+        return Money(self.paise - Money.of(other).paise)
+
+    def __rsub__(self, other: 'Money') -> 'Money':
+        return Money(Money.of(other).paise - self.paise)
+
+    def __neg__(self) -> 'Money':
+        return Money(-self.paise)
+
+    def __abs__(self) -> 'Money':
+        return Money(abs(self.paise))
+
+    def __mul__(self, factor: int) -> 'Money':
+        if not isinstance(factor, int):
+            return NotImplemented
+        return Money(self.paise * factor)
+
+    __rmul__ = __mul__
+
+    def __bool__(self) -> bool:
+        return self.paise != 0
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, Money):
+            return self.paise == other.paise
+        if isinstance(other, (int, Decimal)) and not isinstance(other, bool):
+            return self.paise == Money.of(other).paise
+        return NotImplemented
+
+    def __lt__(self, other) -> bool:
+        if isinstance(other, (Money, int, Decimal)) and not isinstance(other, bool):
+            return self.paise < Money.of(other).paise
+        return NotImplemented
+
+    def __hash__(self) -> int:
+        return hash(self.paise)
+
+
+def to_decimal(value: Any) -> Optional[Decimal]:
+    """Normalise any amount to a two-place Decimal without a string round trip for numbers"""
+    if value is None:
+        return None
+    if isinstance(value, Decimal) and value.as_tuple().exponent == -2:
+        return value
+    return Money.of(value).to_decimal()
+
+
+class MoneyAttribute(DeferredAttribute):
+    """Normalises values as they are assigned, so model code always sees a two-place Decimal"""
+
+    def __set__(self, instance, value):
+        if not hasattr(value, 'resolve_expression'):
+            try:
+                value = to_decimal(value)
+            except (TypeError, ValueError):
+                # Left as given, so full_clean() reports it the way DecimalField always has
+                pass
+        instance.__dict__[self.field.attname] = value
+
+
+class MoneyField(models.DecimalField):
+    """
+    A rupee amount column
+
+    Stored as the same DECIMAL(12, 2) column as before, so existing data and
+    aggregates are untouched. Whatever is assigned (Money, int, float, string or
+    Decimal) is normalised once on assignment to a two-place Decimal, so model
+    code adds and subtracts the values directly, without Decimal(str(...))
+    guards or a detour through Money.
+    """
+    descriptor_class = MoneyAttribute
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('max_digits', 12)
+        kwargs.setdefault('decimal_places', 2)
+        super().__init__(*args, **kwargs)
+
+    def get_prep_value(self, value):
+        if isinstance(value, Money):
+            value = value.to_decimal()
+        return super().get_prep_value(value)
+
+    def to_python(self, value):
+        if isinstance(value, Money):
+            return value.to_decimal()
+        return super().to_python(value)
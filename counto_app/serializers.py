@@ -1,6 +1,27 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
 from .models import Conversation, Message, Transaction, PendingTransaction, Customer, Vendor
+from .money import Money, MoneyField
+
+
+class MoneySerializerField(serializers.DecimalField):
+    """Decimal output as before; input may also be Money or carry currency symbols and separators"""
+
+    def to_internal_value(self, data):
+        if isinstance(data, (Money, str)):
+            try:
+                data = Money.of(data).to_decimal()
+            except ValueError:
+                self.fail('invalid')
+        return super().to_internal_value(data)
+
+
+class MoneyModelSerializer(serializers.ModelSerializer):
+    serializer_field_mapping = {
+        **serializers.ModelSerializer.serializer_field_mapping,
+        MoneyField: MoneySerializerField,
+    }
+
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -19,12 +40,12 @@ class ConversationSerializer(serializers.ModelSerializer):
         model = Conversation
         fields = ['id', 'created_at', 'updated_at', 'active', 'messages']
 
-class TransactionSerializer(serializers.ModelSerializer):
+class TransactionSerializer(MoneyModelSerializer):
     class Meta:
         model = Transaction
         fields = '__all__'
         
-class PendingTransactionSerializer(serializers.ModelSerializer):
+class PendingTransactionSerializer(MoneyModelSerializer):
     class Meta:
         model = PendingTransaction
         fields = '__all__'
@@ -52,7 +73,7 @@ class VendorSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at']
 
 
-class TransactionCreateSerializer(serializers.ModelSerializer):
+class TransactionCreateSerializer(MoneyModelSerializer):
     customer_name = serializers.CharField(write_only=True, required=False, allow_blank=True)
     vendor_name = serializers.CharField(write_only=True, required=False, allow_blank=True)
     
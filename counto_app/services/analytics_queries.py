@@ -0,0 +1,93 @@
+from bisect import bisect_right
+from datetime import date
+from decimal import Decimal
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from django.db.models import Q
+from django.utils import timezone
+
+from counto_app.models import DailyLedgerRollup, PeriodLedgerRollup, Transaction
+from counto_app.services.ledger_periods import (
+    ReportRange, Segment, bucket_label, bucket_ranges, merge_segments, plan_range
+)
+
+ZERO = Decimal('0')
+
+
+def ledger_totals(user, start_date: date, end_date: Optional[date] = None) -> Dict[str, Decimal]:
+    """Income and expenses from start_date (to end_date, or today), summed from the rollups"""
+    end_date = end_date or timezone.localdate()
+    totals = {'total_income': ZERO, 'total_expenses': ZERO}
+    for _, transaction_type, _, total in _rollup_rows(user, plan_range(start_date, end_date)):
+        totals['total_income' if transaction_type == 'INCOME' else 'total_expenses'] += total
+    return totals
+
+
+def ledger_report(user, report: ReportRange) -> Dict[str, Any]:
+    """
+    Totals for a report range and its comparison range, chart series and expense categories
+
+    Each chart bucket is planned separately, so every rollup row read lies inside
+    one bucket and the coarsest rows that fit are used. Rows for both ranges come
+    back from at most two queries, one per rollup table.
+    """
+    buckets = bucket_ranges(report.start, report.end, report.granularity)
+    segments = [segment for _, first, last in buckets for segment in plan_range(first, last)]
+    segments += plan_range(report.prev_start, report.prev_end)
+    bucket_starts = [first for _, first, _ in buckets]
+
+    totals = {'total_income': ZERO, 'total_expenses': ZERO, 'prev_income': ZERO, 'prev_expenses': ZERO}
+    series: Dict[date, Dict[str, Decimal]] = {}
+    categories: Dict[str, Decimal] = {}
+    for row_start, transaction_type, category, total in _rollup_rows(user, segments):
+        is_income = transaction_type == 'INCOME'
+        if row_start < report.start:
+            totals['prev_income' if is_income else 'prev_expenses'] += total
+            continue
+        totals['total_income' if is_income else 'total_expenses'] += total
+
+        bucket = buckets[bisect_right(bucket_starts, row_start) - 1][0]
+        sums = series.setdefault(bucket, {'INCOME': ZERO, 'EXPENSE': ZERO})
+        sums[transaction_type] += total
+        if not is_income and category:
+            categories[category] = categories.get(category, ZERO) + total
+
+    periods = sorted(series)
+    return dict(
+        totals,
+        periods=periods,
+        labels=[bucket_label(period, report.granularity) for period in periods],
+        income=[series[p]['INCOME'] for p in periods],
+        expenses=[series[p]['EXPENSE'] for p in periods],
+        categories=sorted(categories.items(), key=lambda item: item[1], reverse=True),
+    )
+
+
+def _rollup_rows(user, segments: List[Segment]) -> Iterator[Tuple[date, str, str, Decimal]]:
+    """(period start, type, category, total) for every rollup row in the planned segments"""
+    day_filter, period_filter = Q(), Q()
+    for segment in merge_segments(segments):
+        if segment.level == 'DAY':
+            day_filter |= Q(date__gte=segment.start, date__lte=segment.end)
+        else:
+            period_filter |= Q(
+                granularity=segment.level, period_start__gte=segment.start, period_start__lte=segment.end
+            )
+
+    if day_filter:
+        yield from DailyLedgerRollup.objects.filter(day_filter, user=user).values_list(
+            'date', 'transaction_type', 'category', 'total_amount'
+        )
+    if period_filter:
+        yield from PeriodLedgerRollup.objects.filter(period_filter, user=user).values_list(
+            'period_start', 'transaction_type', 'category', 'total_amount'
+        )
+
+
+def recent_transactions(user, start_date: date, end_date: date, limit: int = 5) -> List[Dict[str, Any]]:
+    """The latest transactions in a period, as plain dicts"""
+    return list(
+        Transaction.objects.filter(user=user, date__gte=start_date, date__lte=end_date)
+        .order_by('-date', '-id')
+        .values('date', 'description', 'category', 'amount', 'transaction_type')[:limit]
+    )
@@ -0,0 +1,102 @@
+import re
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Any, Dict, Optional
+
+from django.utils import timezone
+
+from counto_app.models import PendingTransaction
+from counto_app.money import to_decimal
+
+# Proposals older than this are ignored by a later "yes" and cleared on the next proposal
+PENDING_CONFIRMATION_MINUTES = 30
+
+YES_PATTERN = re.compile(
+    r"^(?:yes|y|yeah|yep|yup|sure|ok|okay|confirm(?:ed)?|correct|record it|save it|go ahead|do it|please do)"
+    r"(?:\s*(?:please|thanks|thank you|,|!|\.))*$"
+)
+NO_PATTERN = re.compile(
+    r"^(?:no|n|nope|nah|cancel|discard|skip|don'?t record(?: it)?|do not record(?: it)?|never ?mind)"
+    r"(?:\s*(?:please|thanks|thank you|,|!|\.))*$"
+)
+
+CONFIRMATION_QUESTIONS = {
+    'TRANSACTION': "Would you like me to record this transaction?",
+    'CUSTOMER': "Would you like me to record this customer?",
+    'VENDOR': "Would you like me to record this vendor?",
+}
+
+
+def parse_confirmation(message: str) -> Optional[bool]:
+    """Return True for a yes, False for a no, or None if the message is anything else"""
+    text = " ".join(message.lower().split())
+    if YES_PATTERN.match(text):
+        return True
+    if NO_PATTERN.match(text):
+        return False
+    return None
+
+
+def stage_pending(user, conversation, intent: str, extracted_data: Dict[str, Any]) -> PendingTransaction:
+    """
+    Store an extraction awaiting the user's confirmation
+
+    Only the latest proposal in a conversation can be confirmed, so any earlier
+    pending entry for the conversation is discarded.
+    """
+    PendingTransaction.objects.filter(conversation=conversation).delete()
+
+    if intent == 'TRANSACTION':
+        is_income = extracted_data.get('transaction_type') == 'INCOME'
+        fields = {
+            'date': _to_date(extracted_data.get('date')),
+            'description': (extracted_data.get('description') or '')[:255],
+            'category': (extracted_data.get('category') or '')[:100],
+            'amount': _to_decimal(extracted_data.get('amount')),
+            'transaction_type': extracted_data.get('transaction_type'),
+            'payment_method': (extracted_data.get('payment_method') or '')[:50],
+            'reference_number': (extracted_data.get('reference_number') or '')[:50],
+            'party': ((extracted_data.get('customer') if is_income else extracted_data.get('vendor')) or '')[:100],
+        }
+    else:
+        fields = {'description': (extracted_data.get('name') or '')[:255]}
+
+    return PendingTransaction.objects.create(
+        user=user,
+        conversation=conversation,
+        raw_data={'intent': intent, 'extracted_data': extracted_data},
+        **fields
+    )
+
+
+def open_pending(conversation):
+    """The conversation's pending proposal, or None if there is none or it has expired"""
+    cutoff = timezone.now() - timedelta(minutes=PENDING_CONFIRMATION_MINUTES)
+    return (
+        PendingTransaction.objects.filter(conversation=conversation, created_at__gte=cutoff)
+        .exclude(raw_data__isnull=True)
+        .order_by('-id')
+        .first()
+    )
+
+
+def with_confirmation_question(intent: str, ai_response: str) -> str:
+    """Make sure a proposal ends by asking the user to confirm it"""
+    question = CONFIRMATION_QUESTIONS[intent]
+    if question in ai_response:
+        return ai_response
+    return f"{ai_response.rstrip()}\n\n{question}"
+
+
+def _to_decimal(value) -> Optional[Decimal]:
+    try:
+        return to_decimal(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_date(value) -> Optional[date]:
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,112 @@
+import logging
+from typing import Any, Dict, List, Tuple
+
+from django.conf import settings
+
+from counto_app.models import Conversation, Message
+from counto_app.services.gemini_services import estimate_tokens
+from counto_app.services.sync_outbox import enqueue_history_summary
+
+logger = logging.getLogger(__name__)
+
+# Longest local summary kept when Gemini is unavailable to summarise
+MAX_FALLBACK_SUMMARY_CHARS = 2000
+
+
+def load_history(conversation: Conversation) -> Tuple[str, List[Dict[str, Any]]]:
+    """
+    Load a bounded history window for a conversation
+
+    Returns the rolling summary and the most recent messages (oldest first) that fit
+    within CHAT_HISTORY_MAX_MESSAGES and CHAT_HISTORY_TOKEN_BUDGET. Once
+    CHAT_SUMMARY_BATCH_SIZE messages have slid out of the window unsummarised, the
+    outbox worker is asked to fold them into ``conversation.summary``, so the cost
+    of a turn does not grow with the age of the conversation and no Gemini call is
+    made on the request path.
+    """
+    window = _window(conversation)
+    if window:
+        slid_out = Message.objects.filter(
+            conversation=conversation,
+            id__gt=conversation.summarized_through_id or 0,
+            id__lt=window[0]['id']
+        )
+        if slid_out[:settings.CHAT_SUMMARY_BATCH_SIZE].count() >= settings.CHAT_SUMMARY_BATCH_SIZE:
+            enqueue_history_summary(conversation)
+
+    return conversation.summary, window
+
+
+def fold_slid_out_messages(conversation: Conversation, gemini_service=None) -> int:
+    """
+    Fold every message between the summary and the current window into the summary
+
+    Called by the outbox worker. Messages are selected from ``summarized_through_id``
+    up to the start of the window, however far the token budget has trimmed it, and
+    folded CHAT_HISTORY_MAX_MESSAGES at a time so each summarisation prompt stays
+    bounded. Returns the number of messages folded.
+    """
+    window = _window(conversation)
+    if not window:
+        return 0
+
+    folded = 0
+    while True:
+        messages = list(
+            Message.objects.filter(
+                conversation=conversation,
+                id__gt=conversation.summarized_through_id or 0,
+                id__lt=window[0]['id']
+            )
+            .order_by('id')
+            .values('id', 'sender', 'content')[:settings.CHAT_HISTORY_MAX_MESSAGES]
+        )
+        if not messages:
+            return folded
+        _fold_into_summary(conversation, messages, gemini_service)
+        folded += len(messages)
+
+
+def _window(conversation: Conversation) -> List[Dict[str, Any]]:
+    """The most recent messages, oldest first, within the message limit and token budget"""
+    max_messages = settings.CHAT_HISTORY_MAX_MESSAGES
+    token_budget = settings.CHAT_HISTORY_TOKEN_BUDGET
+
+    recent = Message.objects.filter(conversation=conversation).order_by('-id').values('id', 'sender', 'content')
+    window = []
+    tokens_used = 0
+    for message in recent[:max_messages]:
+        cost = estimate_tokens(message['content'])
+        if window and tokens_used + cost > token_budget:
+            break
+        window.append(message)
+        tokens_used += cost
+    window.reverse()
+    return window
+
+
+def _fold_into_summary(conversation: Conversation, messages: List[Dict[str, Any]], gemini_service):
+    """Extend the conversation's rolling summary with messages that left the window"""
+    summary = None
+    if gemini_service is not None:
+        summary = gemini_service.summarize_history(conversation.summary, messages)
+    if not summary:
+        summary = _fallback_summary(conversation.summary, messages)
+
+    conversation.summary = summary
+    conversation.summarized_through_id = messages[-1]['id']
+    Conversation.objects.filter(pk=conversation.pk).update(
+        summary=conversation.summary,
+        summarized_through_id=conversation.summarized_through_id
+    )
+    logger.info(f"Folded {len(messages)} messages into summary for conversation {conversation.pk}")
+
+
+def _fallback_summary(previous_summary: str, messages: List[Dict[str, Any]]) -> str:
+    """Keep a truncated transcript when the summary cannot be generated by Gemini"""
+    lines = [previous_summary] if previous_summary else []
+    for message in messages:
+        speaker = "User" if message['sender'] == 'USER' else "Assistant"
+        lines.append(f"{speaker}: {message['content'][:200]}")
+    # Keep the most recent part of the transcript
+    return "\n".join(lines)[-MAX_FALLBACK_SUMMARY_CHARS:]
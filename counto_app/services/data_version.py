@@ -0,0 +1,40 @@
+from typing import Iterable, Tuple
+
+from django.db.models import F
+
+from counto_app.models import UserDataVersion
+
+
+def data_version(user) -> int:
+    """
+    The user's current data version
+
+    The row is created on first read, so writes only ever need an UPDATE. A write
+    before any read bumps nothing, which is fine: nothing has been cached yet.
+    """
+    record, _ = UserDataVersion.objects.get_or_create(user_id=user.pk)
+    return record.version
+
+
+def ledger_state(user) -> Tuple[int, int]:
+    """The user's (version, ledger_epoch); equal epochs mean the ledger has only grown since"""
+    record, _ = UserDataVersion.objects.get_or_create(user_id=user.pk)
+    return record.version, record.ledger_epoch
+
+
+def bump_data_version(user_id, rewrite: bool = False) -> None:
+    """
+    Invalidate everything cached for the user by moving their version on
+
+    rewrite marks a change to an existing transaction, which in-memory ledgers
+    cannot apply as an append.
+    """
+    changes = {'version': F('version') + 1}
+    if rewrite:
+        changes['ledger_epoch'] = F('ledger_epoch') + 1
+    UserDataVersion.objects.filter(user_id=user_id).update(**changes)
+
+
+def cache_key(namespace: str, user, version: int, parts: Iterable) -> str:
+    """A cache key that changes whenever the user's data does"""
+    return ':'.join([namespace, str(user.pk), f"v{version}", *(str(part) for part in parts)])
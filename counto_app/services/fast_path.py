@@ -0,0 +1,224 @@
+import re
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional
+
+from django.utils import timezone
+
+EXPENSE_VERBS = re.compile(r"\b(paid|pay|spent|spend|bought|purchased|gave)\b", re.I)
+INCOME_VERBS = re.compile(r"\b(received|receive|got|earned|collected|sold)\b", re.I)
+# Anything that looks like a question or a request for a report goes to Gemini
+QUESTION_WORDS = re.compile(r"\?|\b(how|what|when|which|who|show|list|total|report|did i|can you|should)\b", re.I)
+NEGATION = re.compile(r"\b(?:not|never|no|didnt|dont|havent|hasnt|wont|cancel(?:led)?)\b|n't\b", re.I)
+
+AMOUNT_PATTERN = re.compile(
+    r"(?:₹|rs\.?|inr)?\s*(\d[\d,]*(?:\.\d+)?)\s*(k|lakhs?|lacs?)?\b(?:\s*(?:rupees|rs|inr|/-))?", re.I
+)
+AMOUNT_MULTIPLIERS = {'k': 1000, 'lakh': 100000, 'lakhs': 100000, 'lac': 100000, 'lacs': 100000}
+
+# Phrases end at the next keyword, at punctuation or at the end of the message
+KEYWORD_END = (r"\s+(?:to|from|for|on|via|by|using|through|in|with|as|at|against|towards?|because|but|after|before"
+               r"|yesterday|today|last|\d+\s+days?\s+ago)\b")
+PHRASE_END = r"(?=" + KEYWORD_END + r"|[,.!;]|$)"
+# Party names may contain periods ("Mr. Sharma", "A. K. Traders"), so only a final one ends them
+PARTY_END = r"(?=" + KEYWORD_END + r"|[,!;]|\.\s*$|$)"
+PARTY_AFTER = {'EXPENSE': re.compile(r"\bto\s+([a-z][\w .&'-]*?)" + PARTY_END, re.I),
+               'INCOME': re.compile(r"\bfrom\s+([a-z][\w .&'-]*?)" + PARTY_END, re.I)}
+# Words a period may follow inside a party name: initials, honorifics and company abbreviations
+NAME_ABBREVIATION = re.compile(r"^(?:[a-z]|mr|mrs|ms|dr|shri|smt|sri|st|co|pvt|ltd|bros|corp|inc)$", re.I)
+CATEGORY_AFTER = re.compile(r"\b(?:for|on)\s+([a-z][\w &'-]*?)" + PHRASE_END, re.I)
+
+PAYMENT_METHODS = [
+    (re.compile(r"\b(upi|gpay|google pay|phonepe|paytm|bhim)\b", re.I), 'UPI'),
+    (re.compile(r"\b(credit card|debit card|card)\b", re.I), 'Card'),
+    (re.compile(r"\b(bank transfer|neft|imps|rtgs|net ?banking)\b", re.I), 'Bank Transfer'),
+    (re.compile(r"\b(cheque|check)\b", re.I), 'Cheque'),
+    (re.compile(r"\bcash\b", re.I), 'Cash'),
+]
+PAYMENT_WORDS = re.compile(
+    r"\b(?:via|by|using|through|in)\s+(?:upi|gpay|google pay|phonepe|paytm|bhim|credit card|debit card|card|"
+    r"bank transfer|neft|imps|rtgs|net ?banking|cheque|check|cash)\b", re.I
+)
+
+WEEKDAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+DAYS_AGO = re.compile(r"\b(\d+)\s+days?\s+ago\b", re.I)
+WEEKDAY_PATTERN = re.compile(r"\b(?:on|last)\s+(" + "|".join(WEEKDAYS) + r")\b", re.I)
+DAY_BEFORE_YESTERDAY = re.compile(r"\bday before yesterday\b", re.I)
+YESTERDAY = re.compile(r"\byesterday\b", re.I)
+TODAY = re.compile(r"\btoday\b", re.I)
+# Periods that do not name a single day are left to Gemini
+UNHANDLED_PERIOD = re.compile(
+    r"\b(?:last|this|next|previous|past)\s+(?:week|month|year|quarter)\b|\btomorrow\b"
+    r"|\b\d+\s+(?:weeks?|months?|years?)\s+ago\b", re.I
+)
+CALENDAR_DATE = re.compile(r"\b\d{1,2}[/-]\d{1,2}(?:[/-]\d{2,4})?\b|\b\d{1,2}(?:st|nd|rd|th)\b", re.I)
+
+CATEGORY_ALIASES = {
+    'cogs': 'COGS',
+    'grocery': 'Groceries',
+    'groceries': 'Groceries',
+    'food': 'Food',
+    'lunch': 'Food',
+    'dinner': 'Food',
+    'petrol': 'Fuel',
+    'diesel': 'Fuel',
+    'fuel': 'Fuel',
+    'salary': 'Salary',
+    'salaries': 'Salary',
+    'rent': 'Rent',
+}
+# Words after "for"/"on" that are not categories
+NOT_CATEGORIES = {'it', 'this', 'that', 'them', 'me', 'us', 'today', 'yesterday'} | set(WEEKDAYS)
+# Words that may surround an entry without changing what is recorded
+FILLER_WORDS = {'i', 'we', 'just', 'have', 'has', 'had', 'already', 'rs', 'inr', 'rupees', 'a', 'an', 'the', 'amount',
+                'payment', 'of', 'my', 'our'}
+
+CONFIRMATION_QUESTION = "Would you like me to record this transaction?"
+
+
+def parse_transaction_message(message: str, today: Optional[date] = None) -> Optional[Dict[str, Any]]:
+    """
+    Extract a transaction from a simple chat message without calling Gemini
+
+    Recognises messages such as "paid 500 to Raju for cogs via UPI" or
+    "received 12000 from Prakash Traders yesterday". Returns the same dict the
+    Gemini extractor produces, or None whenever the message is ambiguous: a
+    question, a negation, no or several amounts, both income and expense
+    verbs, a period other than a single day, a party name that runs on past a
+    full stop, neither a party nor a category, or any word the parser did not
+    account for ("paid Raju 500", "to Rahul as loan").
+    """
+    # Case is kept so party names match existing customers and vendors
+    text = " ".join(message.split())
+    if not text or QUESTION_WORDS.search(text) or NEGATION.search(text):
+        return None
+
+    is_expense = bool(EXPENSE_VERBS.search(text))
+    is_income = bool(INCOME_VERBS.search(text))
+    if is_expense == is_income:
+        return None
+    transaction_type = 'EXPENSE' if is_expense else 'INCOME'
+
+    today = today or timezone.now().date()
+    transaction_date, text_without_dates = _parse_date(text, today)
+    if transaction_date is None:
+        return None
+
+    amounts = [_to_amount(number, unit) for number, unit in AMOUNT_PATTERN.findall(text_without_dates)]
+    if len(amounts) != 1 or not amounts[0]:
+        return None
+    amount = amounts[0]
+
+    payment_method = 'Cash'
+    for pattern, method in PAYMENT_METHODS:
+        if pattern.search(text):
+            payment_method = method
+            break
+    # Keep "by card" or "in cash" from being read as a party or category
+    text_for_phrases = PAYMENT_WORDS.sub(' ', text_without_dates)
+
+    party = None
+    party_match = match = PARTY_AFTER[transaction_type].search(text_for_phrases)
+    if match:
+        party = _clean_phrase(match.group(1))
+        if party and not _periods_are_abbreviations(party):
+            # "to Raju. Thanks" runs on into the next sentence; leave it to Gemini
+            return None
+
+    category = None
+    category_match = match = CATEGORY_AFTER.search(text_for_phrases)
+    if match:
+        phrase = _clean_phrase(match.group(1))
+        if phrase and phrase.lower() not in NOT_CATEGORIES:
+            category = CATEGORY_ALIASES.get(phrase.lower(), phrase.title())
+
+    if not party and not category:
+        return None
+    if _leftover_words(text_for_phrases, party_match, category_match):
+        return None
+
+    return {
+        'date': transaction_date.strftime('%Y-%m-%d'),
+        'description': message.strip()[:255],
+        'category': category or 'Uncategorized',
+        'transaction_type': transaction_type,
+        'amount': amount,
+        'customer': party if transaction_type == 'INCOME' else None,
+        'vendor': party if transaction_type == 'EXPENSE' else None,
+        'payment_method': payment_method,
+        'reference_number': None,
+        'notes': None
+    }
+
+
+def confirmation_message(extracted_data: Dict[str, Any]) -> str:
+    """Describe a locally parsed transaction the way the Gemini prompt does"""
+    is_income = extracted_data['transaction_type'] == 'INCOME'
+    party = extracted_data['customer'] if is_income else extracted_data['vendor']
+    lines = [
+        f"Date: {extracted_data['date']}",
+        f"Description: {extracted_data['description']}",
+        f"Category: {extracted_data['category']}",
+        f"Amount: {extracted_data['amount']:.2f}",
+        f"Type: {'Income' if is_income else 'Expense'}",
+        f"Payment Method: {extracted_data['payment_method']}",
+    ]
+    if party:
+        lines.append(f"{'Customer' if is_income else 'Vendor'}: {party}")
+    lines.append(CONFIRMATION_QUESTION)
+    return "\n".join(lines)
+
+
+def _parse_date(text: str, today: date):
+    """Return the relative date mentioned in the message and the text with it removed"""
+    if DAY_BEFORE_YESTERDAY.search(text):
+        return today - timedelta(days=2), DAY_BEFORE_YESTERDAY.sub(' ', text)
+    if YESTERDAY.search(text):
+        return today - timedelta(days=1), YESTERDAY.sub(' ', text)
+
+    match = DAYS_AGO.search(text)
+    if match:
+        return today - timedelta(days=int(match.group(1))), DAYS_AGO.sub(' ', text)
+
+    match = WEEKDAY_PATTERN.search(text)
+    if match:
+        days_back = (today.weekday() - WEEKDAYS.index(match.group(1).lower())) % 7 or 7
+        return today - timedelta(days=days_back), WEEKDAY_PATTERN.sub(' ', text)
+
+    # Explicit calendar dates and longer periods are left to Gemini
+    if CALENDAR_DATE.search(text) or UNHANDLED_PERIOD.search(text):
+        return None, text
+
+    return today, TODAY.sub(' ', text)
+
+
+def _to_amount(number: str, unit: str) -> Optional[float]:
+    try:
+        value = float(number.replace(',', ''))
+    except ValueError:
+        return None
+    return value * AMOUNT_MULTIPLIERS.get(unit.lower(), 1)
+
+
+def _clean_phrase(phrase: str) -> Optional[str]:
+    phrase = phrase.strip(" .,'-")
+    # A phrase containing digits is more likely a second amount than a name
+    if not phrase or re.search(r"\d", phrase):
+        return None
+    # Names typed in lower case are title-cased; anything else is kept as typed
+    return phrase.title() if phrase.islower() else phrase
+
+
+def _leftover_words(text: str, *matches) -> List[str]:
+    """Words not accounted for by the verb, amount, party, category or payment method"""
+    for match in matches:
+        if match:
+            text = text.replace(match.group(0), ' ', 1)
+    text = EXPENSE_VERBS.sub(' ', INCOME_VERBS.sub(' ', AMOUNT_PATTERN.sub(' ', text)))
+    for pattern, _ in PAYMENT_METHODS:
+        text = pattern.sub(' ', text)
+    return [word for word in re.findall(r"[a-z']+", text.lower()) if word not in FILLER_WORDS]
+
+
+def _periods_are_abbreviations(phrase: str) -> bool:
+    """Whether every period in a party name follows an initial or a known abbreviation"""
+    return all(NAME_ABBREVIATION.match(word) for word in re.findall(r"([\w']*)\.", phrase))
@@ -0,0 +1,167 @@
+from datetime import date, timedelta
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+from django.core.cache import caches
+from django.db.models import DecimalField, ExpressionWrapper, F
+from django.utils import timezone
+
+from counto_app.models import Bill, DailyLedgerRollup, Invoice
+from counto_app.services.data_version import cache_key, data_version
+
+# Days of ledger history the models are fitted on
+HISTORY_DAYS = 365
+# Cumulative projections reported, in days from tomorrow
+HORIZONS = (30, 60, 90)
+# Fits on less active history than this fall back to the recent daily average
+MIN_FIT_DAYS = 28
+# Day-of-month effects are shrunk towards zero by count / (count + this), so one odd month does not repeat
+DAY_OF_MONTH_SHRINK = 2.0
+
+
+def fit_projection(series: np.ndarray, history_start: date, horizon: int) -> np.ndarray:
+    """
+    Project a daily series forward with a linear trend plus weekday and day-of-month effects
+
+    The fit starts at the first day with any activity, so a new tenant's empty
+    history does not drag the projection towards zero. Seasonal effects are the
+    mean residual per weekday and then per day of the month. Projections are
+    clipped at zero.
+    """
+    active = np.flatnonzero(series)
+    if active.size == 0:
+        return np.zeros(horizon)
+
+    first = int(active[0])
+    y = series[first:]
+    t = np.arange(first, series.size)
+    if y.size < MIN_FIT_DAYS:
+        return np.full(horizon, y.mean())
+
+    slope, intercept = np.polyfit(t, y, 1)
+    residual = y - (slope * t + intercept)
+
+    weekday = (history_start.weekday() + t) % 7
+    weekday_effect = _group_mean(weekday, residual, 7)
+    residual = residual - weekday_effect[weekday]
+
+    day_of_month = _day_of_month(history_start, t)
+    counts = np.bincount(day_of_month, minlength=31)
+    day_of_month_effect = _group_mean(day_of_month, residual, 31) * counts / (counts + DAY_OF_MONTH_SHRINK)
+
+    future = np.arange(series.size, series.size + horizon)
+    projection = (
+        slope * future + intercept
+        + weekday_effect[(history_start.weekday() + future) % 7]
+        + day_of_month_effect[_day_of_month(history_start, future)]
+    )
+    return np.clip(projection, 0, None)
+
+
+def build_forecast(day_numbers: np.ndarray, amounts: np.ndarray, is_income: np.ndarray, history_start: date,
+                   history_days: int, known_income: Tuple[np.ndarray, np.ndarray],
+                   known_expenses: Tuple[np.ndarray, np.ndarray]) -> Dict[str, Any]:
+    """
+    Forecast income and expenses from ledger rows given as parallel arrays
+
+    day_numbers count days from history_start, so the forecast starts on day
+    history_days. Known future items are (day offset from the forecast start, amount)
+    array pairs, added on top of the fitted projection.
+    """
+    horizon = max(HORIZONS)
+    income_history = np.bincount(day_numbers[is_income], weights=amounts[is_income], minlength=history_days)
+    expense_history = np.bincount(day_numbers[~is_income], weights=amounts[~is_income], minlength=history_days)
+
+    income = fit_projection(income_history, history_start, horizon)
+    expenses = fit_projection(expense_history, history_start, horizon)
+    np.add.at(income, known_income[0], known_income[1])
+    np.add.at(expenses, known_expenses[0], known_expenses[1])
+
+    windows = [(0, 30), (30, 60), (60, 90)]
+    labels = ['Last 30 Days', 'Next 30 Days', 'Days 31-60', 'Days 61-90']
+    income_windows = [float(income_history[-30:].sum())] + [float(income[a:b].sum()) for a, b in windows]
+    expense_windows = [float(expense_history[-30:].sum())] + [float(expenses[a:b].sum()) for a, b in windows]
+
+    return {
+        'labels': labels,
+        'income': [round(value, 2) for value in income_windows],
+        'expenses': [round(value, 2) for value in expense_windows],
+        'balance': [round(i - e, 2) for i, e in zip(income_windows, expense_windows)],
+        'horizons': [
+            {
+                'days': days,
+                'income': round(float(income[:days].sum()), 2),
+                'expenses': round(float(expenses[:days].sum()), 2),
+                'net': round(float(income[:days].sum() - expenses[:days].sum()), 2),
+            }
+            for days in HORIZONS
+        ],
+    }
+
+
+def forecast_for_user(user, today: Optional[date] = None, use_cache: bool = True) -> Dict[str, Any]:
+    """
+    The user's 30/60/90-day cash-flow forecast, cached per data version and day
+
+    History comes from the daily rollup, so the arrays hold one entry per day,
+    type and category however many transactions the ledger has. Open invoices and
+    bills due inside the horizon are added on their due dates; overdue ones are
+    left out, since when they will be settled is unknown.
+    """
+    today = today or timezone.now().date()
+    key = cache_key('forecast', user, data_version(user), (today,))
+    forecast_cache = caches['analytics']
+    cached = forecast_cache.get(key) if use_cache else None
+    if cached is not None:
+        return cached
+
+    history_start = today - timedelta(days=HISTORY_DAYS - 1)
+    rows = list(
+        DailyLedgerRollup.objects.filter(user=user, date__gte=history_start, date__lte=today)
+        .values_list('date', 'transaction_type', 'total_amount')
+    )
+    day_numbers = np.fromiter(((day - history_start).days for day, _, _ in rows), dtype=np.int64, count=len(rows))
+    is_income = np.fromiter((kind == 'INCOME' for _, kind, _ in rows), dtype=bool, count=len(rows))
+    amounts = np.fromiter((total for _, _, total in rows), dtype=np.float64, count=len(rows))
+
+    forecast_start = today + timedelta(days=1)
+    known_income = _open_items(
+        Invoice.objects.filter(user=user), 'amount_received', forecast_start
+    )
+    known_expenses = _open_items(
+        Bill.objects.filter(user=user), 'amount_paid', forecast_start
+    )
+
+    forecast = build_forecast(
+        day_numbers, amounts, is_income, history_start, HISTORY_DAYS, known_income, known_expenses
+    )
+    forecast_cache.set(key, forecast)
+    return forecast
+
+
+def _open_items(documents, settled_field: str, forecast_start: date) -> Tuple[np.ndarray, np.ndarray]:
+    """(day offset, unsettled amount) for invoices or bills falling due inside the forecast horizon"""
+    remaining = ExpressionWrapper(
+        F('amount_due') - F(settled_field), output_field=DecimalField(max_digits=12, decimal_places=2)
+    )
+    items = list(
+        documents.filter(
+            due_date__gte=forecast_start,
+            due_date__lt=forecast_start + timedelta(days=max(HORIZONS)),
+            **{f'{settled_field}__lt': F('amount_due')}
+        ).annotate(remaining=remaining).values_list('due_date', 'remaining')
+    )
+    offsets = np.fromiter(((due - forecast_start).days for due, _ in items), dtype=np.int64, count=len(items))
+    amounts = np.fromiter((amount for _, amount in items), dtype=np.float64, count=len(items))
+    return offsets, amounts
+
+
+def _group_mean(groups: np.ndarray, values: np.ndarray, size: int) -> np.ndarray:
+    counts = np.bincount(groups, minlength=size)
+    return np.bincount(groups, weights=values, minlength=size) / np.maximum(counts, 1)
+
+
+def _day_of_month(start: date, offsets: np.ndarray) -> np.ndarray:
+    """Zero-based day of the month for each day offset from start"""
+    days = np.datetime64(start, 'D') + offsets
+    return (days - days.astype('datetime64[M]')).astype(np.int64)
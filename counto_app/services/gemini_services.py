@@ -1,11 +1,14 @@
 import os
 import json
 import logging
-import re
+import threading
+import time
 from datetime import datetime
-from typing import Dict, Any, Tuple, List, Optional
+from typing import Dict, Any, Iterator, Tuple, List, Optional
 from django.conf import settings
 
+from counto_app.services.intent_classifier import IntentResult, classify_intent
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -25,12 +28,86 @@ except ImportError:
     GEMINI_AVAILABLE = False
     logger.warning("google.generativeai package not installed")
 
+# Tags Gemini is asked to start each response with, mapped to (intent, is_query)
+RESPONSE_TAGS = {
+    "DATA_ENTRY_TRANSACTION": ("TRANSACTION", False),
+    "DATA_ENTRY_CUSTOMER": ("CUSTOMER", False),
+    "DATA_ENTRY_VENDOR": ("VENDOR", False),
+    "QUERY_TRANSACTION": ("TRANSACTION", True),
+    "QUERY_CUSTOMER": ("CUSTOMER", True),
+    "QUERY_VENDOR": ("VENDOR", True)
+}
+
+# Tag used in structured output for replies that are not about the user's records
+GENERAL_TAG = "GENERAL"
+
+TRANSACTION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "date": {"type": "string", "description": "YYYY-MM-DD"},
+        "description": {"type": "string"},
+        "category": {"type": "string"},
+        "transaction_type": {"type": "string", "enum": ["INCOME", "EXPENSE"]},
+        "amount": {"type": "number"},
+        "customer": {"type": "string", "nullable": True},
+        "vendor": {"type": "string", "nullable": True},
+        "payment_method": {"type": "string", "nullable": True},
+        "reference_number": {"type": "string", "nullable": True},
+        "notes": {"type": "string", "nullable": True}
+    },
+    "required": ["transaction_type", "amount"]
+}
+
+PARTY_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "name": {"type": "string"},
+        "email": {"type": "string", "nullable": True},
+        "phone": {"type": "string", "nullable": True},
+        "gst_number": {"type": "string", "nullable": True},
+        "address": {"type": "string", "nullable": True}
+    },
+    "required": ["name"]
+}
+
+def response_schema(intent_type: str, tag: Optional[str] = None) -> Dict[str, Any]:
+    """JSON schema Gemini's structured output is constrained to for a given intent, or a single known tag"""
+    if intent_type == "TRANSACTION":
+        tags, data_schema = ["DATA_ENTRY_TRANSACTION", "QUERY_TRANSACTION"], TRANSACTION_SCHEMA
+    elif intent_type == "CUSTOMER":
+        tags, data_schema = ["DATA_ENTRY_CUSTOMER", "QUERY_CUSTOMER"], PARTY_SCHEMA
+    elif intent_type == "VENDOR":
+        tags, data_schema = ["DATA_ENTRY_VENDOR", "QUERY_VENDOR"], PARTY_SCHEMA
+    else:
+        tags, data_schema = list(RESPONSE_TAGS), None
+    
+    if tag:
+        tags = [tag]
+    properties = {
+        "tag": {"type": "string", "enum": tags + [GENERAL_TAG]},
+        "reply": {"type": "string"}
+    }
+    if data_schema:
+        properties["data"] = dict(data_schema, nullable=True)
+    else:
+        # Any entity may be recorded when the intent could not be guessed up front
+        properties["transaction"] = dict(TRANSACTION_SCHEMA, nullable=True)
+        properties["party"] = dict(PARTY_SCHEMA, nullable=True)
+    return {"type": "object", "properties": properties, "required": ["tag", "reply"]}
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for prompt budgeting (about four characters per token)"""
+    return len(text or "") // 4 + 1
+
 class GeminiService:
     """Service for processing financial messages using Google's Gemini API"""
     
     def __init__(self):
         """Initialize the Gemini service with the appropriate model"""
         self.model = None
+        # Result of the last health probe: None until a probe has completed
+        self.healthy = None
+        self.checked_at = time.monotonic()
         
         if not GEMINI_AVAILABLE:
             logger.warning("Gemini API not available - Service will not function")
@@ -41,17 +118,35 @@ class GeminiService:
             model_name = "gemini-1.5-flash-latest"  # Use latest model version
             logger.info(f"Initializing Gemini with model: {model_name}")
             self.model = genai.GenerativeModel(model_name)
-            
-            # Verify the model works
+        except Exception as e:
+            logger.error(f"Failed to initialize Gemini: {str(e)}")
+            self.model = None
+    
+    @property
+    def available(self) -> bool:
+        """Whether the model can be used: it was created and its health probe has not failed"""
+        return GEMINI_AVAILABLE and self.model is not None and self.healthy is not False
+    
+    def start_health_check(self):
+        """Verify the model works in a background thread so callers are not blocked"""
+        if not self.model:
+            return
+        threading.Thread(target=self._run_health_check, name="gemini-health-check", daemon=True).start()
+    
+    def _run_health_check(self):
+        try:
             test_response = self.model.generate_content("Hello")
-            if test_response and hasattr(test_response, 'text'):
+            healthy = bool(test_response and hasattr(test_response, 'text'))
+            if healthy:
                 logger.info(f"Successfully initialized Gemini")
             else:
                 logger.warning("Response from Gemini didn't have expected format")
-                self.model = None
         except Exception as e:
-            logger.error(f"Failed to initialize Gemini: {str(e)}")
-            self.model = None
+            logger.error(f"Gemini health check failed: {str(e)}")
+            healthy = False
+        # checked_at first, so the registry never sees a failure with a stale timestamp
+        self.checked_at = time.monotonic()
+        self.healthy = healthy
     
     def prepare_conversation_history(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Convert database messages to format expected by Gemini API"""
@@ -66,10 +161,15 @@ class GeminiService:
             
         return formatted_messages
     
-    def process_message(self, user_message: str, conversation_history: List[Dict[str, Any]]) -> Tuple[str, Dict, str, bool]:
+    def process_message(self, user_message: str, conversation_history: List[Dict[str, Any]],
+                        history_summary: str = "", user=None) -> Tuple[str, Dict, str, bool]:
         """
         Process a user message through Gemini AI
         
+        conversation_history holds the recent messages before this one and
+        history_summary summarises anything older. When user is given, queries
+        are answered with a budgeted extract of that user's ledger.
+        
         Returns:
             Tuple containing:
             - AI response text
@@ -77,202 +177,318 @@ class GeminiService:
             - Intent type (TRANSACTION, CUSTOMER, VENDOR, UNKNOWN)
             - Boolean indicating if this is a query (True) or data entry (False)
         """
-        if not GEMINI_AVAILABLE or not self.model:
+        if not self.available:
             logger.error("Gemini service unavailable")
             return "Sorry, the AI service is currently unavailable.", {}, "UNKNOWN", False
             
-        # Get current date for transaction processing
-        current_date = datetime.now().strftime('%B %d, %Y')
-        
-        # Determine the intent type (transaction, customer, or vendor)
-        intent_type = self._determine_intent_type(user_message)
-        
-        print("Intent type: ", intent_type)
-        # For unknown intents, handle general queries including accounting questions
-        # if intent_type == "UNKNOWN":
-        #     try:
-        #         # Enhanced prompt for accounting-related queries
-        #         print("Unknown intent")
-        #         general_prompt = f"""You are a knowledgeable accounting assistant. Please respond to the following query in a clear and concise manner.
-                
-        #         If the question is related to accounting principles, bookkeeping, financial reporting, or general financial advice, provide a helpful and accurate response.
-        #         If the question is not related to accounting or finance, simply state that you are an accounting-focused assistant and can help with financial matters.
-                
-        #         Current date: {current_date}
-        #         Query: {user_message}
-                
-        #         Response:"""
-                
-        #         response = self.model.generate_content(general_prompt)
-        #         response_text = response.text.strip()
-        #         print("General Response: ", response_text)
-        #         logger.info("Processed general query with Gemini")
-        #         return response_text, {}, "UNKNOWN", True
-        #     except Exception as e:
-        #         logger.error(f"Error processing general query: {str(e)}")
-        #         return "I'm sorry, I encountered an error processing your request. Please try again.", {}, "UNKNOWN", True
-        
-        # For known intents, proceed with the existing logic
-        # Check if this is likely a query based on the user message
-        query_patterns = [
-            r'how much', r'what is', r'what were', r'what was', r'show me', r'tell me', r'report', 
-            r'status', r'balance', r'overview', r'summary', r'total',
-            r'analyse', r'analyze', r'check', r'find', r'search', r'list'
-        ]
-        is_likely_query = any(re.search(pattern, user_message.lower()) for pattern in query_patterns)
-        
-        # Fetch relevant data for queries
-        data_for_query = []
-        if is_likely_query:
-            try:
-                # Only import here to avoid circular imports
-                from counto_app.services.sheets_services import GoogleSheetsService
-                sheets_service = GoogleSheetsService()
-                
-                if intent_type == "TRANSACTION":
-                    data_for_query = sheets_service.get_all_transactions()
-                    logger.info(f"Retrieved {len(data_for_query)} transactions for query processing")
-                elif intent_type == "CUSTOMER":
-                    data_for_query = sheets_service.get_all_customers()
-                    logger.info(f"Retrieved {len(data_for_query)} customers for query processing")
-                elif intent_type == "VENDOR":
-                    data_for_query = sheets_service.get_all_vendors()
-                    logger.info(f"Retrieved {len(data_for_query)} vendors for query processing")
-            except Exception as e:
-                logger.error(f"Error retrieving data: {e}")
+        classification = classify_intent(user_message)
         
-        # Create system prompt based on intent type
-        system_prompt = self._create_system_prompt(intent_type, current_date)
+        if getattr(settings, 'GEMINI_STRUCTURED_OUTPUT', False):
+            result = self._process_structured(user_message, conversation_history, history_summary, user, classification)
+            if result is not None:
+                return result
+            logger.warning("Structured output failed - falling back to text parsing")
         
-        # Add data to the prompt if this is a query
-        data_str = ""
-        if is_likely_query and data_for_query:
-            data_str = self._format_data_for_query(intent_type, data_for_query)
+        prompt, current_date = self._build_prompt(user_message, conversation_history, history_summary, user,
+                                                  classification=classification)
         
         try:
-            # Craft the complete prompt
-            prompt = f"{system_prompt}{data_str}\n\nUSER INPUT: {user_message}\n\n"
-            prompt += f"Your response (remember to start with the appropriate tag (DATA_ENTRY_TRANSACTION, DATA_ENTRY_CUSTOMER, DATA_ENTRY_VENDOR, QUERY_TRANSACTION, QUERY_CUSTOMER, QUERY_VENDOR) and follow the format exactly as instructed, using {current_date} as today's date):"
-            
             # Generate content with the complete prompt
             response = self.model.generate_content(prompt)
             response_text = response.text
             logger.info("Successfully received response from Gemini")
             
-            # Process the response to determine if it's a query or data entry
-            response_tags = {
-                "DATA_ENTRY_TRANSACTION": ("TRANSACTION", False),
-                "DATA_ENTRY_CUSTOMER": ("CUSTOMER", False),
-                "DATA_ENTRY_VENDOR": ("VENDOR", False),
-                "QUERY_TRANSACTION": ("TRANSACTION", True),
-                "QUERY_CUSTOMER": ("CUSTOMER", True),
-                "QUERY_VENDOR": ("VENDOR", True)
-            }
-            
-            # Determine intent and query status from response
-            detected_intent = "UNKNOWN"
-            is_query = False
-            
-            for tag, (intent, query_status) in response_tags.items():
-                if response_text.startswith(tag):
-                    detected_intent = intent
-                    is_query = query_status
-                    response_text = response_text.replace(tag, "", 1).strip()
-                    break
-            
-            logger.info(f"Response type - Intent: {detected_intent}, Query: {is_query}")
-            
-            extracted_data = {}
-            
-            # Extract data if this is a data entry
-            if not is_query:
-                if detected_intent == "TRANSACTION":
-                    extracted_data = self._extract_transaction_data(response_text)
-                elif detected_intent == "CUSTOMER":
-                    extracted_data = self._extract_customer_data(response_text)
-                elif detected_intent == "VENDOR":
-                    extracted_data = self._extract_vendor_data(response_text)
-                else:
-                    # Enhanced prompt for accounting-related queries
-                    print("Unknown intent")
-                    general_prompt = f"""You are a knowledgeable accounting assistant. Please respond to the following query in a clear and concise manner.
-                    
-                    If the question is related to accounting principles, bookkeeping, financial reporting, or general financial advice, provide a helpful and accurate response.
-                    If the question is not related to accounting or finance, simply state that you are an accounting-focused assistant and can help with financial matters.
-                    
-                    Current date: {current_date}
-                    Query: {user_message}
-                    
-                    Response:"""
-                    
-                    response = self.model.generate_content(general_prompt)
-                    response_text = response.text.strip()
-                    print("General Response: ", response_text)
-                    logger.info("Processed general query with Gemini")
-                    return response_text, {}, "UNKNOWN", True
-            
-            # Clean up formatting issues
-            if response_text.startswith(":"):
-                response_text = response_text[1:].strip()
-            
-            print("response_text", response_text)
-            return response_text, extracted_data, detected_intent, is_query
+            return self._interpret_response(response_text, user_message, current_date)
         except Exception as e:
             logger.error(f"Error in Gemini processing: {str(e)}")
             return f"Sorry, there was an error processing your request: {str(e)}", {}, "UNKNOWN", False
     
-    def _determine_intent_type(self, user_message: str) -> str:
-        """Determine if the message is about transactions, customers, or vendors"""
-        transaction_keywords = [
-            "spent", "paid", "bought", "purchased", "expense", "income", "transaction", 
-            "bill", "invoice", "payment", "receipt", "money", "cash", "card", "upi", 
-            "amount", "total", "cost", "price", "fee", "charge", "sale", "refund",
-            "profit", "loss", "balance", "budget", "account", "financial", "finance",
-            "deposit", "withdraw", "transfer", "salary", "revenue", "earnings"
-        ]
-        
-        customer_keywords = [
-            "customer", "client", "buyer", "consumer", "purchaser", "shopper",
-            "patron", "clientele", "add customer", "new customer", "customer list",
-            "client details", "buyer info", "customer contact", "client database"
-        ]
-        
-        vendor_keywords = [
-            "vendor", "supplier", "distributor", "provider", "manufacturer", "wholesaler",
-            "retailer", "dealer", "add vendor", "new vendor", "vendor list", "supplier details",
-            "distributor info", "vendor contact", "supplier database"
-        ]
-        
-        user_msg_lower = user_message.lower()
-        
-        # Count keyword matches for each category
-        transaction_count = sum(1 for keyword in transaction_keywords if keyword in user_msg_lower)
-        customer_count = sum(1 for keyword in customer_keywords if keyword in user_msg_lower)
-        vendor_count = sum(1 for keyword in vendor_keywords if keyword in user_msg_lower)
-        
-        # Determine the intent based on keyword match counts
-        total_matches = transaction_count + customer_count + vendor_count
-        
-        # If no keywords matched, return UNKNOWN
-        if total_matches == 0:
-            return "UNKNOWN"
-            
-        # If we have matches, return the category with the highest count
-        max_count = max(transaction_count, customer_count, vendor_count)
+    def stream_message(self, user_message: str, conversation_history: List[Dict[str, Any]],
+                       history_summary: str = "", user=None) -> Iterator[Tuple[str, Any]]:
+        """
+        Stream a response to a user message through Gemini AI
+        
+        Yields ("token", text) events as chunks arrive, with the leading response
+        tag held back and stripped, followed by a single ("result", tuple) event
+        carrying the same tuple process_message returns once the stream completes.
+        An untagged reply is the answer itself: it is returned as a general
+        response rather than regenerated with the general prompt, so the text
+        the user watched stream in is the text that is kept.
+        """
+        if not self.available:
+            logger.error("Gemini service unavailable")
+            yield "result", ("Sorry, the AI service is currently unavailable.", {}, "UNKNOWN", False)
+            return
         
-        # If the maximum count is too low, treat as UNKNOWN
-        if max_count < 1:
-            return "UNKNOWN"
+        classification = classify_intent(user_message)
+        prompt, current_date = self._build_prompt(user_message, conversation_history, history_summary, user,
+                                                  classification=classification)
+        
+        try:
+            chunks = []
+            # Text seen before we know whether the response starts with a tag
+            pending = ""
+            tag_resolved = False
+            tagged = False
+            
+            for chunk in self.model.generate_content(prompt, stream=True):
+                text = getattr(chunk, 'text', '') or ''
+                if not text:
+                    continue
+                chunks.append(text)
+                
+                if tag_resolved:
+                    yield "token", text
+                    continue
+                
+                pending += text
+                stripped = pending.lstrip()
+                matched_tag = next((tag for tag in RESPONSE_TAGS if stripped.startswith(tag)), None)
+                if matched_tag:
+                    tag_resolved = tagged = True
+                    remainder = stripped[len(matched_tag):].lstrip(": \n")
+                    if remainder:
+                        yield "token", remainder
+                elif not any(tag.startswith(stripped) for tag in RESPONSE_TAGS):
+                    tag_resolved = True
+                    yield "token", pending
             
-        # Return the intent with the highest count
-        if transaction_count == max_count:
-            return "TRANSACTION"
-        elif customer_count == max_count:
-            return "CUSTOMER"
+            if not tag_resolved and pending:
+                yield "token", pending
+            
+            logger.info("Successfully streamed response from Gemini")
+            if not tagged:
+                yield "result", ("".join(chunks).strip(), {}, "UNKNOWN", True)
+                return
+            yield "result", self._interpret_response("".join(chunks), user_message, current_date)
+        except Exception as e:
+            logger.error(f"Error in Gemini streaming: {str(e)}")
+            yield "result", (f"Sorry, there was an error processing your request: {str(e)}", {}, "UNKNOWN", False)
+    
+    def _build_prompt(self, user_message: str, conversation_history: List[Dict[str, Any]],
+                      history_summary: str = "", user=None, structured: bool = False,
+                      classification: Optional[IntentResult] = None) -> Tuple[str, str]:
+        """Build the full prompt for a user message, returning it with the current date string"""
+        # Get current date for transaction processing
+        current_date = datetime.now().strftime('%B %d, %Y')
+        
+        # Determine the intent type (transaction, customer, or vendor) and whether this is a query
+        classification = classification or classify_intent(user_message)
+        intent_type = classification.intent
+        is_likely_query = classification.is_query
+        
+        print("Intent type: ", intent_type)
+        
+        # Create system prompt based on intent type
+        if structured:
+            system_prompt = self._create_structured_prompt(intent_type, current_date)
         else:
-            return "VENDOR"
+            system_prompt = self._create_system_prompt(intent_type, current_date, classification)
+        
+        # Add a budgeted extract of the user's data if this is a query
+        data_str = ""
+        if is_likely_query and user is not None:
+            try:
+                # Only import here to avoid circular imports
+                from counto_app.services.query_context import build_query_context
+                data_str = build_query_context(user, intent_type, user_message)
+                logger.info(f"Built query context of ~{estimate_tokens(data_str)} tokens")
+            except Exception as e:
+                logger.error(f"Error building query context: {e}")
+        
+        # Craft the complete prompt
+        history_str = self._format_history(conversation_history, history_summary)
+        prompt = f"{system_prompt}{data_str}{history_str}\n\nUSER INPUT: {user_message}\n\n"
+        if structured:
+            return prompt, current_date
+        if classification.confident:
+            prompt += f"Your response (start with {classification.tag}, or use no tag to ask a clarifying question, and follow the format exactly as instructed, using {current_date} as today's date):"
+            return prompt, current_date
+        prompt += f"Your response (remember to start with the appropriate tag (DATA_ENTRY_TRANSACTION, DATA_ENTRY_CUSTOMER, DATA_ENTRY_VENDOR, QUERY_TRANSACTION, QUERY_CUSTOMER, QUERY_VENDOR) and follow the format exactly as instructed, using {current_date} as today's date):"
+        return prompt, current_date
+    
+    def _format_history(self, conversation_history: List[Dict[str, Any]], history_summary: str) -> str:
+        """Format the bounded conversation history for inclusion in the prompt"""
+        if not conversation_history and not history_summary:
+            return ""
+        
+        lines = ["\n\nCONVERSATION SO FAR (for context only):"]
+        if history_summary:
+            lines.append(f"Summary of earlier messages: {history_summary}")
+        for message in conversation_history:
+            speaker = "User" if message['sender'] == 'USER' else "Assistant"
+            lines.append(f"{speaker}: {message['content']}")
+        return "\n".join(lines)
+    
+    def summarize_history(self, previous_summary: str, messages: List[Dict[str, Any]]) -> Optional[str]:
+        """Fold older messages into the rolling conversation summary, or return None if unavailable"""
+        if not self.available:
+            return None
+        
+        transcript = "\n".join(
+            f"{'User' if m['sender'] == 'USER' else 'Assistant'}: {m['content']}" for m in messages
+        )
+        prompt = f"""Update the running summary of a bookkeeping chat between a user and Counto, their accounting assistant.
+        Keep recorded amounts, parties, dates and any unfinished requests. Reply with the updated summary only, in under 150 words.
+        
+        Current summary:
+        {previous_summary or "(none)"}
+        
+        New messages:
+        {transcript}
+        """
+        try:
+            response = self.model.generate_content(prompt)
+            return response.text.strip()
+        except Exception as e:
+            logger.error(f"Error summarizing conversation history: {str(e)}")
+            return None
+    
+    def _process_structured(self, user_message: str, conversation_history: List[Dict[str, Any]],
+                            history_summary: str = "", user=None,
+                            classification: Optional[IntentResult] = None) -> Optional[Tuple[str, Dict, str, bool]]:
+        """
+        Process a message with Gemini constrained to a JSON schema
+        
+        Returns the same tuple as process_message, or None if the call failed or the
+        output did not validate, so the caller can fall back to the text format.
+        """
+        classification = classification or classify_intent(user_message)
+        prompt, current_date = self._build_prompt(user_message, conversation_history, history_summary, user,
+                                                  structured=True, classification=classification)
+        try:
+            response = self.model.generate_content(
+                prompt,
+                generation_config=genai.GenerationConfig(
+                    response_mime_type="application/json",
+                    response_schema=response_schema(
+                        classification.intent, classification.tag if classification.confident else None
+                    )
+                )
+            )
+            return self._parse_structured_response(response.text)
+        except (ValueError, TypeError) as e:
+            logger.warning(f"Invalid structured response from Gemini: {str(e)}")
+        except Exception as e:
+            logger.error(f"Error in structured Gemini processing: {str(e)}")
+        return None
+    
+    def _parse_structured_response(self, response_text: str) -> Tuple[str, Dict, str, bool]:
+        """Validate a structured response; raises ValueError if it does not match the schema"""
+        payload = json.loads(response_text)
+        if not isinstance(payload, dict):
+            raise ValueError("response is not a JSON object")
+        
+        tag = payload.get('tag')
+        reply = payload.get('reply')
+        if not isinstance(reply, str) or not reply.strip():
+            raise ValueError("missing reply")
+        if tag == GENERAL_TAG:
+            return reply.strip(), {}, "UNKNOWN", True
+        if tag not in RESPONSE_TAGS:
+            raise ValueError(f"unknown tag {tag!r}")
+        
+        intent, is_query = RESPONSE_TAGS[tag]
+        extracted_data = {}
+        if not is_query:
+            data = payload.get('data')
+            if data is None:
+                data = payload.get('transaction') if intent == "TRANSACTION" else payload.get('party')
+            if not isinstance(data, dict):
+                raise ValueError(f"missing data for {tag}")
+            
+            if intent == "TRANSACTION":
+                extracted_data = self._validate_transaction_data(data)
+            else:
+                extracted_data = {field: data.get(field) or None for field in PARTY_SCHEMA['properties']}
+                if not extracted_data['name']:
+                    raise ValueError(f"missing name for {tag}")
+        
+        logger.info(f"Structured response - Intent: {intent}, Query: {is_query}")
+        return reply.strip(), extracted_data, intent, is_query
     
-    def _create_system_prompt(self, intent_type: str, current_date: str) -> str:
+    def _validate_transaction_data(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Coerce structured transaction fields into the shape the legacy parser produces"""
+        amount = data.get('amount')
+        if isinstance(amount, bool) or not isinstance(amount, (int, float)) or amount < 0:
+            raise ValueError(f"invalid amount {amount!r}")
+        transaction_type = data.get('transaction_type')
+        if transaction_type not in ('INCOME', 'EXPENSE'):
+            raise ValueError(f"invalid transaction type {transaction_type!r}")
+        
+        transaction_date = data.get('date')
+        try:
+            datetime.strptime(transaction_date or '', '%Y-%m-%d')
+        except ValueError:
+            transaction_date = datetime.now().strftime('%Y-%m-%d')
+        
+        extracted_data = {
+            'date': transaction_date,
+            'description': data.get('description') or 'No description',
+            'category': data.get('category') or 'Uncategorized',
+            'transaction_type': transaction_type,
+            'amount': float(amount),
+            'customer': data.get('customer') or None,
+            'vendor': data.get('vendor') or None,
+            'payment_method': data.get('payment_method') or None,
+            'reference_number': data.get('reference_number') or None,
+            'notes': data.get('notes') or None
+        }
+        return self._normalize_transaction_data(extracted_data)
+    
+    def _interpret_response(self, response_text: str, user_message: str, current_date: str) -> Tuple[str, Dict, str, bool]:
+        """Strip the response tag and extract data from a complete Gemini response"""
+        # Determine intent and query status from response
+        detected_intent = "UNKNOWN"
+        is_query = False
+        
+        for tag, (intent, query_status) in RESPONSE_TAGS.items():
+            if response_text.startswith(tag):
+                detected_intent = intent
+                is_query = query_status
+                response_text = response_text.replace(tag, "", 1).strip()
+                break
+        
+        logger.info(f"Response type - Intent: {detected_intent}, Query: {is_query}")
+        
+        extracted_data = {}
+        
+        # Extract data if this is a data entry
+        if not is_query:
+            if detected_intent == "TRANSACTION":
+                extracted_data = self._extract_transaction_data(response_text)
+            elif detected_intent == "CUSTOMER":
+                extracted_data = self._extract_customer_data(response_text)
+            elif detected_intent == "VENDOR":
+                extracted_data = self._extract_vendor_data(response_text)
+            else:
+                # Enhanced prompt for accounting-related queries
+                print("Unknown intent")
+                general_prompt = f"""You are a knowledgeable accounting assistant. Please respond to the following query in a clear and concise manner.
+                
+                If the question is related to accounting principles, bookkeeping, financial reporting, or general financial advice, provide a helpful and accurate response.
+                If the question is not related to accounting or finance, simply state that you are an accounting-focused assistant and can help with financial matters.
+                
+                Current date: {current_date}
+                Query: {user_message}
+                
+                Response:"""
+                
+                response = self.model.generate_content(general_prompt)
+                response_text = response.text.strip()
+                print("General Response: ", response_text)
+                logger.info("Processed general query with Gemini")
+                return response_text, {}, "UNKNOWN", True
+        
+        # Clean up formatting issues
+        if response_text.startswith(":"):
+            response_text = response_text[1:].strip()
+        
+        print("response_text", response_text)
+        return response_text, extracted_data, detected_intent, is_query
+    
+    def _create_system_prompt(self, intent_type: str, current_date: str,
+                              classification: Optional[IntentResult] = None) -> str:
         """Create a system prompt based on the intent type"""
         base_prompt = f"""
         SYSTEM: You are Counto, a financial assistant integrated into an accounting app. You have THREE primary functions:
@@ -366,7 +582,7 @@ class GeminiService:
         query_prompt = """
         FUNCTION 4: ANSWERING QUERIES ABOUT FINANCES
 
-        You will receive a list of all relevant transactions, customers, or vendors. Based on the user's query, classify it into one of the following tags:
+        You will receive a filtered summary of the user's transactions, customers, or vendors: the filters applied, totals over every matching record, and as many of the matching records as fit. Based on the user's query, classify it into one of the following tags:
         - QUERY_TRANSACTION: For income or expense-related queries
         - QUERY_CUSTOMER: For customer-related queries
         - QUERY_VENDOR: For vendor-related queries
@@ -375,21 +591,22 @@ class GeminiService:
 
         1. TIME FILTERING:
         - When users ask for time periods like "today", "yesterday", "this week", "last month", etc., filter the data accordingly.
-        - You will be given all data; apply filters based on the user's query. Current date is {current_date}
+        - The data has already been filtered to the period, direction and parties the query mentions where they could be recognised (see "Filters applied"); apply any remaining filters yourself. Current date is {current_date}
 
         2. TRANSACTION QUERIES (QUERY_TRANSACTION):     
-        - You will be provided with ALL transaction data as a list of transactions
+        - You will be provided with totals over the matching transactions and only a subset of the individual transactions
+        - Use the totals for sums and counts. A transaction missing from the listed records may still exist; never treat it as zero
         - When a user asks about "today", "yesterday", "last week", "this month", "last month", etc., filter the transaction data accordingly
         - "burn" or "spend" refers to expenses
         - Calculate and display the total amount spent/earned for the specified time period
-        - List the matching transactions
+        - List the matching transactions you were given
 
         3. CUSTOMER OR VENDOR QUERIES:
         - Return the **total count** and list relevant names or details.
         - Include relevant filters like city or category if provided.
         - contact details of the customer or vendor if asked
 
-        4. If no matching data is found, respond clearly: 
+        4. If the totals show no matching records, respond clearly: 
         - “There are no matching records in the provided dataset.”
 
         EXAMPLES:
@@ -419,10 +636,20 @@ class GeminiService:
         3. ALWAYS start responses with one of the specified tags
         4. Format data in a clear list format as shown above
         5. ALWAYS ask "Would you like me to record this [transaction/customer/vendor]?" after showing details
-        6. When the user says "yes" or "confirm" or "record it", respond with "[TRANSACTION/CUSTOMER/VENDOR]_CONFIRMED"
-        7. When the user says "no" or "cancel" or "don't record", respond with "[TRANSACTION/CUSTOMER/VENDOR]_CANCELLED"
         """
         
+        # When the message was classified confidently, only the matching function is described
+        if classification is not None and classification.confident:
+            known_prompt = f"""
+        SYSTEM: You are Counto, a financial assistant integrated into an accounting app.
+        The user's message has most likely been classified as {classification.tag}. Start your response with {classification.tag},
+        unless you need to ask the user a clarifying question first, in which case reply without any tag.
+        """
+            if classification.is_query:
+                return known_prompt + query_prompt + critical_instructions
+            entity_prompts = {"TRANSACTION": transaction_prompt, "CUSTOMER": customer_prompt, "VENDOR": vendor_prompt}
+            return known_prompt + entity_prompts[intent_type] + critical_instructions
+        
         # Combine relevant prompts based on intent type
         if intent_type == "TRANSACTION":
             return base_prompt + transaction_prompt + query_prompt + critical_instructions
@@ -434,97 +661,25 @@ class GeminiService:
             # Return all prompts if intent is unknown
             return base_prompt + transaction_prompt + customer_prompt + vendor_prompt + query_prompt + critical_instructions
     
-    def _format_data_for_query(self, intent_type: str, data: List[Dict[str, Any]]) -> str:
-        """Format data for inclusion in the query prompt"""
-        data_str = "\n\nHere is your COMPLETE DATA for querying. All amounts are in numbers only (no currency symbols):\n"
-        
-        if intent_type == "TRANSACTION":
-            data_str += "ID | DATE       | DESCRIPTION                     | AMOUNT  | CATEGORY          | TYPE    | STATUS | CUSTOMER/VENDOR\n"
-            data_str += "---|------------|--------------------------------|---------|-------------------|---------|--------|-----------------\n"
-            
-            for i, tx in enumerate(data, 1):
-                date = tx.get('date', 'Unknown date')
-                if isinstance(date, datetime):
-                    date = date.strftime('%Y-%m-%d')
-                desc = tx.get('description', 'No description')
-                
-                # Handle amount formatting
-                amount = '0.00'
-                if 'paid_amount' in tx and tx['paid_amount']:
-                    amount_str = str(tx['paid_amount'])
-                    
-                    # Handle format: ₹EXPENSE/500 or ₹INCOME/500
-                    if '/' in amount_str:
-                        # Extract the number after the last slash
-                        amount_str = amount_str.split('/')[-1]
-                    
-                    # Remove any remaining non-numeric characters except decimal point
-                    amount_str = ''.join(c for c in amount_str if c.isdigit() or c == '.')
-                    
-                    try:
-                        # Convert to float and format to 2 decimal places
-                        amount = f"{float(amount_str):.2f}" if amount_str else '0.00'
-                    except (ValueError, TypeError):
-                        amount = '0.00'
-                
-                category = tx.get('category', 'Uncategorized')
-                tx_type = tx.get('transaction_type', 'UNKNOWN')
-                status = tx.get('status', 'PAID')
-                party = tx.get('customer', '') if tx_type == 'INCOME' else tx.get('vendor', '')
-                
-                # Format in a table-like structure
-                data_str += f"{i:2d} | {date} | {desc[:30]:30} | {amount:>7} | {category[:15]:15} | {tx_type:7} | {status:6} | {party[:15]}\n"
-            
-        elif intent_type == "CUSTOMER":
-            data_str += "ID | NAME | EMAIL | PHONE | GST NUMBER | ADDRESS\n"
-            data_str += "--|------|------|-------|------------|--------\n"
-            
-            for i, customer in enumerate(data, 1):
-                name = customer.get('name', 'Unknown')
-                email = customer.get('email', '-')
-                phone = customer.get('phone', '-')
-                gst = customer.get('gst_number', '-')
-                address = customer.get('address', '-')
-                
-                data_str += f"{i} | {name} | {email} | {phone} | {gst} | {address}\n"
-                
-        elif intent_type == "VENDOR":
-            data_str += "ID | NAME | EMAIL | PHONE | GST NUMBER | ADDRESS\n"
-            data_str += "--|------|------|-------|------------|--------\n"
-            
-            for i, vendor in enumerate(data, 1):
-                name = vendor.get('name', 'Unknown')
-                email = vendor.get('email', '-')
-                phone = vendor.get('phone', '-')
-                gst = vendor.get('gst_number', '-')
-                address = vendor.get('address', '-')
-                
-                data_str += f"{i} | {name} | {email} | {phone} | {gst} | {address}\n"
-        
-        # Add explicit instructions for analysis
-        data_str += "\nWhen analyzing this data for time periods and amounts:\n"
-        data_str += "1. 'Today' refers to transactions/records on current date\n"
-        data_str += "2. 'This month' refers to the current calendar month\n"
-        data_str += "3. 'This year' refers to the current calendar year\n"
-        data_str += "4. All amounts are in numbers only (no currency symbols)\n"
-        data_str += "5. For transaction queries, calculate and show the total amount\n"
-        data_str += "6. For expense/income queries, show the total for each category\n"
-        
-        return data_str
+    def _create_structured_prompt(self, intent_type: str, current_date: str) -> str:
+        """Create the shorter system prompt used with JSON structured output"""
+        entity = intent_type.lower() if intent_type != "UNKNOWN" else "transaction, customer or vendor"
+        return f"""
+        SYSTEM: You are Counto, a financial assistant integrated into an accounting app. Today is {current_date}.
+        Reply with a JSON object matching the response schema:
+        - tag: DATA_ENTRY_* when the user mentions a {entity} to record (treat every mention as real data),
+          QUERY_* when they ask about their records, {GENERAL_TAG} for anything else.
+        - reply: the message shown to the user. For data entry, list the details and end with
+          "Would you like me to record this [transaction/customer/vendor]?". For queries, answer from the
+          DATA section, showing totals and the matching records. For {GENERAL_TAG}, answer briefly as an
+          accounting-focused assistant.
+        - data (or transaction/party): the extracted fields, only for data entry. Expenses are paid to a
+          vendor, income is received from a customer. Use {datetime.now().strftime('%Y-%m-%d')} as the date
+          unless another is mentioned; "burn" or "spend" means expenses.
+        """
     
     def _extract_transaction_data(self, response_text: str) -> Dict[str, Any]:
         """Extract transaction data from the AI response"""
-        def safe_float_convert(value):
-            """Safely convert string to float, handling various formats and optional values"""
-            if not value or value.lower() in ['', 'optional', '[optional]']:
-                return None
-            try:
-                # Remove any non-numeric characters except decimal point and minus
-                clean_value = ''.join(c for c in str(value) if c.isdigit() or c in '.-')
-                return float(clean_value) if clean_value else None
-            except (ValueError, TypeError):
-                return None
-        
         print("Extracting transaction data from response using gemini")
         extracted_data = {
             'date': datetime.now().strftime('%Y-%m-%d'),  # Always use current date
@@ -568,6 +723,23 @@ class GeminiService:
                             extracted_data[field] = value
                         break
         
+        return self._normalize_transaction_data(extracted_data)
+    
+    def _normalize_transaction_data(self, extracted_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Normalize type, amount, placeholders and party assignment of extracted transaction data"""
+        def safe_float_convert(value):
+            """Safely convert string to float, handling various formats and optional values"""
+            if isinstance(value, (int, float)):
+                return float(value)
+            if not value or value.lower() in ['', 'optional', '[optional]']:
+                return None
+            try:
+                # Remove any non-numeric characters except decimal point and minus
+                clean_value = ''.join(c for c in str(value) if c.isdigit() or c in '.-')
+                return float(clean_value) if clean_value else None
+            except (ValueError, TypeError):
+                return None
+        
         # Normalize transaction type
         if extracted_data['transaction_type']:
             tx_type = extracted_data['transaction_type'].lower()
@@ -674,7 +846,7 @@ class GeminiService:
     
     def generate_financial_insights(self, financial_data: List[Dict[str, Any]]) -> str:
         """Generate insights based on financial data using Gemini"""
-        if not GEMINI_AVAILABLE or not self.model:
+        if not self.available:
             return "Sorry, insights generation is unavailable without Gemini API access."
             
         try:
@@ -700,7 +872,7 @@ class GeminiService:
 
     def generate_actionable_insights(self, transactions: List[Dict], customers: List[Dict], vendors: List[Dict]) -> str:
         """Generate text-based summary with actionable insights"""
-        if not GEMINI_AVAILABLE or not self.model:
+        if not self.available:
             return "Financial insights unavailable at the moment. Please try again later."
         
         try:
@@ -0,0 +1,119 @@
+import re
+from typing import Dict, FrozenSet, NamedTuple
+
+TRANSACTION_KEYWORDS = [
+    "spent", "paid", "bought", "purchased", "expense", "income", "transaction",
+    "bill", "invoice", "payment", "receipt", "money", "cash", "card", "upi",
+    "amount", "total", "cost", "price", "fee", "charge", "sale", "refund",
+    "profit", "loss", "balance", "budget", "account", "financial", "finance",
+    "deposit", "withdraw", "transfer", "salary", "revenue", "earnings"
+]
+
+CUSTOMER_KEYWORDS = [
+    "customer", "client", "buyer", "consumer", "purchaser", "shopper",
+    "patron", "clientele", "add customer", "new customer", "customer list",
+    "client details", "buyer info", "customer contact", "client database"
+]
+
+VENDOR_KEYWORDS = [
+    "vendor", "supplier", "distributor", "provider", "manufacturer", "wholesaler",
+    "retailer", "dealer", "add vendor", "new vendor", "vendor list", "supplier details",
+    "distributor info", "vendor contact", "supplier database"
+]
+
+QUERY_KEYWORDS = [
+    "how much", "what is", "what were", "what was", "show me", "tell me", "report",
+    "status", "balance", "overview", "summary", "total",
+    "analyse", "analyze", "check", "find", "search", "list"
+]
+
+# Phrases that mark a message as something to record rather than a question
+ENTRY_KEYWORDS = [
+    "spent", "paid", "bought", "purchased", "received", "sold", "add ", "create ", "record "
+]
+
+INTENTS = ("TRANSACTION", "CUSTOMER", "VENDOR")
+
+# Classifications at or above this confidence tell Gemini the tag instead of asking it to pick one
+CONFIDENCE_THRESHOLD = 0.6
+
+
+class IntentResult(NamedTuple):
+    intent: str
+    is_query: bool
+    confidence: float
+
+    @property
+    def confident(self) -> bool:
+        return self.intent != "UNKNOWN" and self.confidence >= CONFIDENCE_THRESHOLD
+
+    @property
+    def tag(self) -> str:
+        return f"{'QUERY' if self.is_query else 'DATA_ENTRY'}_{self.intent}"
+
+
+def _build_labels() -> Dict[str, FrozenSet[str]]:
+    labels: Dict[str, set] = {}
+    for label, keywords in (("TRANSACTION", TRANSACTION_KEYWORDS), ("CUSTOMER", CUSTOMER_KEYWORDS),
+                            ("VENDOR", VENDOR_KEYWORDS), ("QUERY", QUERY_KEYWORDS),
+                            ("ENTRY", ENTRY_KEYWORDS)):
+        for keyword in keywords:
+            labels.setdefault(keyword, set()).add(label)
+    return {keyword: frozenset(found) for keyword, found in labels.items()}
+
+
+# keyword -> labels it counts towards ("total" is both a transaction keyword and a query marker)
+_LABELS = _build_labels()
+# keyword -> every keyword it contains, so one match of "add customer" also counts "customer"
+_IMPLIED = {keyword: frozenset(other for other in _LABELS if other in keyword) for keyword in _LABELS}
+# A zero-width lookahead tried at every position, so matches may overlap ("add vendor list" holds
+# both "add vendor" and "vendor list"). Longest alternatives first: the keyword found at a position
+# is the longest one starting there, and _IMPLIED supplies the shorter ones inside it.
+_PATTERN = re.compile("(?=(" + "|".join(re.escape(k) for k in sorted(_LABELS, key=len, reverse=True)) + "))")
+
+
+def keyword_counts(user_message: str) -> Dict[str, int]:
+    """
+    How many distinct keywords of each label the message contains
+
+    The same counts as a substring test of every keyword: every keyword occurrence is
+    either the longest keyword starting at its position or contained in it.
+    """
+    text = user_message.lower()
+    matched = set()
+    for match in _PATTERN.finditer(text):
+        matched |= _IMPLIED[match.group(1)]
+
+    counts = {label: 0 for label in INTENTS + ("QUERY", "ENTRY")}
+    for keyword in matched:
+        for label in _LABELS[keyword]:
+            counts[label] += 1
+    return counts
+
+
+def classify_intent(user_message: str) -> IntentResult:
+    """
+    Classify a chat message as a transaction, customer or vendor message in one regex pass
+
+    Keywords match as substrings, as the previous keyword scans did, overlapping ones
+    included, and each keyword counts once. The confidence is the winner's margin over
+    the runner-up, relative to the winner's count (1.0 when only one intent matched, 0.0
+    on a tie), capped at 0.5 when the message has both or neither of the query and data
+    entry markers.
+    """
+    text = user_message.lower()
+    counts = keyword_counts(text)
+    has_query = counts["QUERY"] > 0 or "?" in text
+    has_entry = counts["ENTRY"] > 0
+    is_query = has_query
+
+    # Ties resolve in INTENTS order, as before: transaction, then customer, then vendor
+    ranked = sorted(INTENTS, key=lambda intent: -counts[intent])
+    top, runner_up = counts[ranked[0]], counts[ranked[1]]
+    if top == 0:
+        return IntentResult("UNKNOWN", is_query, 0.0)
+
+    confidence = (top - runner_up) / top
+    if has_query == has_entry:
+        confidence = min(confidence, 0.5)
+    return IntentResult(ranked[0], is_query, confidence)
@@ -0,0 +1,291 @@
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from django.conf import settings
+
+from counto_app.models import Transaction
+from counto_app.money import Money
+from counto_app.services.data_version import ledger_state
+from counto_app.services.olap_store import OlapStore, olap_store
+
+EPOCH = date(1970, 1, 1)
+TYPE_CODES = {'INCOME': 0, 'EXPENSE': 1}
+TYPE_NAMES = ('INCOME', 'EXPENSE')
+NO_PARTY = -1
+
+# (id, date, amount, transaction_type, category, customer_id, vendor_id)
+LEDGER_FIELDS = ('id', 'date', 'amount', 'transaction_type', 'category', 'customer_id', 'vendor_id')
+
+# A party is ('CUSTOMER', id) or ('VENDOR', id); names are looked up only for results that need them
+PartyKey = Tuple[str, int]
+
+
+def paise_to_decimal(paise) -> Decimal:
+    return Money(paise).to_decimal()
+
+
+class LedgerColumns:
+    """
+    One user's transactions as parallel NumPy arrays
+
+    Days are int32 counts from 1970-01-01, amounts int64 paise, and type, category
+    and party are small integer codes into the dictionaries kept alongside. A
+    snapshot is never modified: extended() returns a new one, so readers on other
+    threads always see arrays of equal length.
+    """
+
+    def __init__(self, user_id: int, version: int, epoch: int):
+        self.user_id = user_id
+        self.version = version
+        self.epoch = epoch
+        self.ids = np.empty(0, dtype=np.int64)
+        self.days = np.empty(0, dtype=np.int32)
+        self.amounts = np.empty(0, dtype=np.int64)
+        self.types = np.empty(0, dtype=np.int8)
+        self.categories = np.empty(0, dtype=np.int32)
+        self.parties = np.empty(0, dtype=np.int32)
+        self.category_names: List[str] = []
+        self.party_keys: List[PartyKey] = []
+        self._category_codes: Dict[str, int] = {}
+        self._party_codes: Dict[PartyKey, int] = {}
+
+    def __len__(self) -> int:
+        return self.ids.size
+
+    @property
+    def last_id(self) -> int:
+        return int(self.ids[-1]) if self.ids.size else 0
+
+    def extended(self, rows: Sequence[tuple], version: int) -> 'LedgerColumns':
+        """A new snapshot with rows (in LEDGER_FIELDS order, ascending id) appended"""
+        ledger = LedgerColumns(self.user_id, version, self.epoch)
+        ledger.category_names = list(self.category_names)
+        ledger.party_keys = list(self.party_keys)
+        ledger._category_codes = dict(self._category_codes)
+        ledger._party_codes = dict(self._party_codes)
+
+        count = len(rows)
+        columns = (
+            np.fromiter((row[0] for row in rows), dtype=np.int64, count=count),
+            np.fromiter(((row[1] - EPOCH).days for row in rows), dtype=np.int32, count=count),
+            np.fromiter((Money.of(row[2]).paise for row in rows), dtype=np.int64, count=count),
+            np.fromiter((TYPE_CODES[row[3]] for row in rows), dtype=np.int8, count=count),
+            np.fromiter((ledger._category_code(row[4] or '') for row in rows), dtype=np.int32, count=count),
+            np.fromiter((ledger._party_code(row[5], row[6]) for row in rows), dtype=np.int32, count=count),
+        )
+        ledger.ids, ledger.days, ledger.amounts, ledger.types, ledger.categories, ledger.parties = (
+            np.concatenate((old, new)) for old, new in zip(
+                (self.ids, self.days, self.amounts, self.types, self.categories, self.parties), columns
+            )
+        )
+        return ledger
+
+    def _category_code(self, name: str) -> int:
+        code = self._category_codes.get(name)
+        if code is None:
+            code = self._category_codes[name] = len(self.category_names)
+            self.category_names.append(name)
+        return code
+
+    def _party_code(self, customer_id: Optional[int], vendor_id: Optional[int]) -> int:
+        if customer_id:
+            key = ('CUSTOMER', customer_id)
+        elif vendor_id:
+            key = ('VENDOR', vendor_id)
+        else:
+            return NO_PARTY
+        code = self._party_codes.get(key)
+        if code is None:
+            code = self._party_codes[key] = len(self.party_keys)
+            self.party_keys.append(key)
+        return code
+
+    # Filters
+
+    def mask(self, start: Optional[date] = None, end: Optional[date] = None,
+             transaction_type: Optional[str] = None) -> np.ndarray:
+        """Rows dated start..end (either end open) and, optionally, of one type"""
+        selected = np.ones(self.ids.size, dtype=bool)
+        if start is not None:
+            selected &= self.days >= (start - EPOCH).days
+        if end is not None:
+            selected &= self.days <= (end - EPOCH).days
+        if transaction_type is not None:
+            selected &= self.types == TYPE_CODES[transaction_type]
+        return selected
+
+    def category_mask(self, name: str) -> np.ndarray:
+        """Rows whose category matches name, ignoring case"""
+        codes = [code for code, category in enumerate(self.category_names) if category.lower() == name.lower()]
+        return np.isin(self.categories, codes)
+
+    def party_mask(self, customer_ids: Iterable[int] = (), vendor_ids: Iterable[int] = ()) -> np.ndarray:
+        keys = [('CUSTOMER', pk) for pk in customer_ids] + [('VENDOR', pk) for pk in vendor_ids]
+        codes = [self._party_codes[key] for key in keys if key in self._party_codes]
+        return np.isin(self.parties, codes)
+
+    # Aggregates; amounts are int64 paise
+
+    def totals(self, selected: Optional[np.ndarray] = None) -> Dict[str, int]:
+        types = self.types if selected is None else self.types[selected]
+        amounts = self.amounts if selected is None else self.amounts[selected]
+        income = int(amounts[types == 0].sum())
+        expenses = int(amounts[types == 1].sum())
+        return {'income': income, 'expenses': expenses, 'net': income - expenses, 'count': int(types.size)}
+
+    def group_by(self, column: str, selected: Optional[np.ndarray] = None) -> Dict[object, Tuple[int, int]]:
+        """{category name, party key or type name: (total paise, row count)} over the selected rows"""
+        codes, labels = self._column(column)
+        amounts = self.amounts
+        if selected is not None:
+            codes, amounts = codes[selected], amounts[selected]
+        if column == 'party':
+            has_party = codes != NO_PARTY
+            codes, amounts = codes[has_party], amounts[has_party]
+        sums = _sum_by(codes, amounts, len(labels))
+        counts = np.bincount(codes, minlength=len(labels))
+        return {labels[code]: (int(sums[code]), int(counts[code])) for code in np.flatnonzero(counts)}
+
+    def top_k(self, column: str, k: int, selected: Optional[np.ndarray] = None) -> List[Tuple[object, int]]:
+        """The k largest groups by total amount, largest first"""
+        codes, labels = self._column(column)
+        amounts = self.amounts
+        if selected is not None:
+            codes, amounts = codes[selected], amounts[selected]
+        if column == 'party':
+            has_party = codes != NO_PARTY
+            codes, amounts = codes[has_party], amounts[has_party]
+        if not codes.size:
+            return []
+        sums = _sum_by(codes, amounts, len(labels))
+        present = np.flatnonzero(np.bincount(codes, minlength=len(labels)))
+        if present.size > k:
+            present = present[np.argpartition(-sums[present], k - 1)[:k]]
+        ordered = present[np.lexsort((present, -sums[present]))]
+        return [(labels[code], int(sums[code])) for code in ordered]
+
+    def time_buckets(self, granularity: str, selected: Optional[np.ndarray] = None
+                     ) -> Tuple[List[date], np.ndarray, np.ndarray]:
+        """(bucket start dates, income paise, expense paise) per non-empty bucket, in date order"""
+        days, amounts, types = self.days, self.amounts, self.types
+        if selected is not None:
+            days, amounts, types = days[selected], amounts[selected], types[selected]
+        keys = _bucket_keys(days, granularity)
+        buckets, inverse = np.unique(keys, return_inverse=True)
+        income = _sum_by(inverse[types == 0], amounts[types == 0], buckets.size)
+        expenses = _sum_by(inverse[types == 1], amounts[types == 1], buckets.size)
+        return [_bucket_date(key, granularity) for key in buckets], income, expenses
+
+    def compare(self, start: date, end: date, prev_start: date, prev_end: date,
+                selected: Optional[np.ndarray] = None) -> Dict[str, Dict[str, int]]:
+        """Totals for a range and its comparison range"""
+        current, previous = self.mask(start, end), self.mask(prev_start, prev_end)
+        if selected is not None:
+            current &= selected
+            previous &= selected
+        return {'current': self.totals(current), 'previous': self.totals(previous)}
+
+    def _column(self, column: str):
+        if column == 'category':
+            return self.categories, self.category_names
+        if column == 'party':
+            return self.parties, self.party_keys
+        if column == 'type':
+            return self.types.astype(np.int32), TYPE_NAMES
+        raise ValueError(f"Unknown column: {column}")
+
+
+def _sum_by(codes: np.ndarray, amounts: np.ndarray, size: int) -> np.ndarray:
+    # float64 bincount is exact for totals below 2**53 paise
+    return np.rint(np.bincount(codes, weights=amounts, minlength=size)).astype(np.int64)
+
+
+def _bucket_keys(days: np.ndarray, granularity: str) -> np.ndarray:
+    """Integer bucket keys: day numbers for day/week, month numbers since 1970-01 otherwise"""
+    if granularity == 'day':
+        return days
+    if granularity == 'week':
+        # 1970-01-01 was a Thursday, so (days + 3) % 7 is the weekday with Monday as 0
+        return days - (days + 3) % 7
+    months = days.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+    if granularity == 'month':
+        return months
+    if granularity == 'quarter':
+        return months - months % 3
+    if granularity == 'year':
+        return months - months % 12
+    if granularity == 'fiscal_year':
+        # Month 3 of each year is April
+        return months - (months - 3) % 12
+    raise ValueError(f"Unknown granularity: {granularity}")
+
+
+def _bucket_date(key, granularity: str) -> date:
+    if granularity in ('day', 'week'):
+        return EPOCH + timedelta(days=int(key))
+    return date(1970 + int(key) // 12, int(key) % 12 + 1, 1)
+
+
+_ledgers: 'OrderedDict[int, LedgerColumns]' = OrderedDict()
+_lock = threading.Lock()
+
+
+def get_ledger(user) -> LedgerColumns:
+    """
+    The user's ledger columns, loaded on first use and kept in a per-process LRU
+
+    The user's data version and ledger epoch decide what to do with a cached
+    snapshot. Same version: use it. Same epoch: only new transactions were added,
+    so fetch the rows past the last id. Otherwise: reload. After an append, the
+    row count is checked against the database, because a transaction that commits
+    late with a lower id would not be picked up by the id cursor. Rows come from
+    the user's OLAP sidecar when OLAP_DATA_DIR is set.
+    """
+    version, epoch = ledger_state(user)
+    with _lock:
+        ledger = _ledgers.get(user.pk)
+        if ledger is not None:
+            _ledgers.move_to_end(user.pk)
+
+    if ledger is not None and ledger.epoch == epoch and ledger.version == version:
+        return ledger
+
+    store = olap_store(user)
+    if ledger is not None and ledger.epoch == epoch:
+        ledger = ledger.extended(_ledger_rows(user, store, ledger.last_id), version)
+        if len(ledger) != _ledger_count(user, store):
+            ledger = None
+
+    if ledger is None or ledger.epoch != epoch:
+        ledger = LedgerColumns(user.pk, version, epoch).extended(_ledger_rows(user, store), version)
+
+    with _lock:
+        _ledgers[user.pk] = ledger
+        _ledgers.move_to_end(user.pk)
+        while len(_ledgers) > settings.LEDGER_ENGINE_MAX_USERS:
+            _ledgers.popitem(last=False)
+    return ledger
+
+
+def _ledger_rows(user, store: Optional[OlapStore], after_id: int = 0) -> List[tuple]:
+    """Rows past after_id from the user's OLAP sidecar when there is one, else from the main database"""
+    if store is not None:
+        return store.ledger_rows(after_id)
+    return list(
+        Transaction.objects.filter(user_id=user.pk, id__gt=after_id).order_by('id').values_list(*LEDGER_FIELDS)
+    )
+
+
+def _ledger_count(user, store: Optional[OlapStore]) -> int:
+    if store is not None:
+        return store.count()
+    return Transaction.objects.filter(user_id=user.pk).count()
+
+
+def clear_ledgers() -> None:
+    with _lock:
+        _ledgers.clear()
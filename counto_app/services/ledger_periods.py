@@ -0,0 +1,195 @@
+import calendar
+from datetime import date, timedelta
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+# Indian financial year: 1 April to 31 March
+FISCAL_YEAR_START_MONTH = 4
+
+GRANULARITIES = ('day', 'week', 'month', 'quarter', 'year', 'fiscal_year')
+
+# Levels held in the rollup tables, coarsest first. DAY is DailyLedgerRollup, the rest PeriodLedgerRollup.
+ROLLUP_LEVELS = ('YEAR', 'MONTH', 'WEEK', 'DAY')
+PERIOD_LEVELS = ('WEEK', 'MONTH', 'YEAR')
+
+# Legacy ?period= values and the chart granularity each one used
+LEGACY_PERIODS = {
+    'month': 'day',
+    'last_month': 'day',
+    'last_3_months': 'month',
+    'last_6_months': 'month',
+    'year': 'month',
+    'fiscal_year': 'month',
+}
+
+
+class Segment(NamedTuple):
+    """A run of whole rollup periods at one level, from start to end inclusive"""
+    level: str
+    start: date
+    end: date
+
+
+class ReportRange(NamedTuple):
+    start: date
+    end: date
+    prev_start: date
+    prev_end: date
+    granularity: str
+
+
+def add_months(day: date, months: int) -> date:
+    month_index = day.month - 1 + months
+    year = day.year + month_index // 12
+    month = month_index % 12 + 1
+    return day.replace(year=year, month=month, day=min(day.day, calendar.monthrange(year, month)[1]))
+
+
+def period_start(day: date, granularity: str) -> date:
+    """First day of the period of the given granularity that contains day"""
+    if granularity == 'day':
+        return day
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    if granularity == 'quarter':
+        return day.replace(month=(day.month - 1) // 3 * 3 + 1, day=1)
+    if granularity == 'year':
+        return day.replace(month=1, day=1)
+    if granularity == 'fiscal_year':
+        year = day.year if day.month >= FISCAL_YEAR_START_MONTH else day.year - 1
+        return date(year, FISCAL_YEAR_START_MONTH, 1)
+    raise ValueError(f"Unknown granularity: {granularity}")
+
+
+def period_end(start: date, granularity: str) -> date:
+    """Last day of the period that begins on start"""
+    if granularity == 'day':
+        return start
+    if granularity == 'week':
+        return start + timedelta(days=6)
+    months = {'month': 1, 'quarter': 3, 'year': 12, 'fiscal_year': 12}[granularity]
+    return add_months(start, months) - timedelta(days=1)
+
+
+def plan_range(start: date, end: date, levels: Sequence[str] = ROLLUP_LEVELS) -> List[Segment]:
+    """
+    Cover start..end exactly with the fewest rollup rows
+
+    The coarsest level covers the whole periods that fit inside the range. The
+    partial head and tail left over are covered by the next level down, and so on
+    until days fill what remains.
+    """
+    if start > end:
+        return []
+    level, finer = levels[0], levels[1:]
+    if level == 'DAY':
+        return [Segment('DAY', start, end)]
+
+    granularity = level.lower()
+    first = period_start(start, granularity)
+    if first < start:
+        first = period_end(first, granularity) + timedelta(days=1)
+    last = period_start(end, granularity)
+    last_end = period_end(last, granularity)
+    if last_end > end:
+        last_end = last - timedelta(days=1)
+    if first > last_end:
+        return plan_range(start, end, finer)
+
+    return (
+        plan_range(start, first - timedelta(days=1), finer)
+        + [Segment(level, first, last_end)]
+        + plan_range(last_end + timedelta(days=1), end, finer)
+    )
+
+
+def bucket_ranges(start: date, end: date, granularity: str) -> List[Tuple[date, date, date]]:
+    """(bucket start, first day, last day) for each chart bucket, clipped to start..end"""
+    buckets = []
+    bucket = period_start(start, granularity)
+    while bucket <= end:
+        bucket_end = period_end(bucket, granularity)
+        buckets.append((bucket, max(bucket, start), min(bucket_end, end)))
+        bucket = bucket_end + timedelta(days=1)
+    return buckets
+
+
+def merge_segments(segments: Sequence[Segment]) -> List[Segment]:
+    """Join touching segments of the same level so each run becomes one range filter"""
+    merged: List[Segment] = []
+    for segment in sorted(segments, key=lambda s: (s.level, s.start)):
+        previous = merged[-1] if merged else None
+        if previous and previous.level == segment.level and previous.end + timedelta(days=1) >= segment.start:
+            merged[-1] = previous._replace(end=max(previous.end, segment.end))
+        else:
+            merged.append(segment)
+    return merged
+
+
+def bucket_label(bucket: date, granularity: str) -> str:
+    if granularity in ('day', 'week'):
+        return bucket.strftime('%b %d')
+    if granularity == 'quarter':
+        return f"Q{(bucket.month - 1) // 3 + 1} {bucket.year}"
+    if granularity == 'year':
+        return str(bucket.year)
+    if granularity == 'fiscal_year':
+        return f"FY {bucket.year}-{str(bucket.year + 1)[2:]}"
+    return bucket.strftime('%b %Y')
+
+
+def previous_range(start: date, end: date) -> Tuple[date, date]:
+    """The comparison range: the same number of whole months before start, or else the same number of days"""
+    if start.day == 1 and (end + timedelta(days=1)).day == 1:
+        months = (end.year - start.year) * 12 + end.month - start.month + 1
+        return add_months(start, -months), start - timedelta(days=1)
+    length = end - start
+    return start - length - timedelta(days=1), start - timedelta(days=1)
+
+
+def legacy_range(period: str, today: date) -> ReportRange:
+    """The date ranges the fixed ?period= choices have always used"""
+    granularity = LEGACY_PERIODS.get(period, 'day')
+    month_start = today.replace(day=1)
+
+    if period == 'last_month':
+        end = month_start - timedelta(days=1)
+        start = end.replace(day=1)
+        prev_start = (start - timedelta(days=31)).replace(day=1)
+        return ReportRange(start, end, prev_start, start - timedelta(days=1), granularity)
+    if period in ('last_3_months', 'last_6_months'):
+        days = 90 if period == 'last_3_months' else 180
+        start = month_start - timedelta(days=days)
+        return ReportRange(start, today, start - timedelta(days=days), start - timedelta(days=1), granularity)
+    if period == 'year':
+        start = today.replace(month=1, day=1)
+        return ReportRange(start, today, start.replace(year=start.year - 1), add_months(today, -12), granularity)
+    if period == 'fiscal_year':
+        start = period_start(today, 'fiscal_year')
+        return ReportRange(start, today, add_months(start, -12), add_months(today, -12), granularity)
+
+    # 'month' and anything unrecognised: the current month so far
+    prev_start = (month_start - timedelta(days=1)).replace(day=1)
+    return ReportRange(month_start, today, prev_start, month_start - timedelta(days=1), granularity)
+
+
+def parse_range(start: Optional[date], end: Optional[date], granularity: Optional[str], today: date) -> ReportRange:
+    """
+    A report range from explicit start/end/granularity parameters
+
+    Missing ends default to the start of the current month and today. Without a
+    granularity, ranges up to two months chart by day, up to two years by month,
+    and longer ranges by year.
+    """
+    end = end or today
+    start = start or end.replace(day=1)
+    if start > end:
+        raise ValueError("start must not be after end")
+    if granularity is None:
+        days = (end - start).days
+        granularity = 'day' if days <= 62 else 'month' if days <= 731 else 'year'
+    elif granularity not in GRANULARITIES:
+        raise ValueError(f"granularity must be one of: {', '.join(GRANULARITIES)}")
+    prev_start, prev_end = previous_range(start, end)
+    return ReportRange(start, end, prev_start, prev_end, granularity)
@@ -0,0 +1,126 @@
+from decimal import Decimal
+from typing import Dict, Tuple
+
+from django.db import IntegrityError, transaction as db_transaction
+from django.db.models import Count, F, Sum
+
+from counto_app.models import DailyLedgerRollup, PeriodLedgerRollup, Transaction
+from counto_app.services.ledger_periods import PERIOD_LEVELS, period_start
+
+# (user_id, date, transaction_type, category)
+RollupKey = Tuple[int, object, str, str]
+
+
+def rollup_key(user_id, day, transaction_type, category) -> RollupKey:
+    """Normalise a transaction's grouping fields the way DailyLedgerRollup stores them"""
+    return (
+        user_id,
+        Transaction._meta.get_field('date').to_python(day),
+        transaction_type,
+        (category or '')[:100],
+    )
+
+
+def apply_rollup_delta(key: RollupKey, amount: Decimal, count: int) -> None:
+    """
+    Add amount and count to the day's rollup row and to its week, month and year rows
+
+    All four updates run in one atomic block.
+    """
+    user_id, day, transaction_type, category = key
+    common = {'user_id': user_id, 'transaction_type': transaction_type, 'category': category}
+    with db_transaction.atomic():
+        _apply_delta(DailyLedgerRollup, dict(common, date=day), amount, count)
+        for level in PERIOD_LEVELS:
+            _apply_delta(
+                PeriodLedgerRollup,
+                dict(common, granularity=level, period_start=period_start(day, level.lower())),
+                amount, count
+            )
+
+
+def _apply_delta(model, lookup: Dict[str, object], amount: Decimal, count: int) -> None:
+    """
+    Add amount and count to one rollup row, creating it on first use
+
+    The update is an F() expression so concurrent writers to the same row do not
+    lose each other's deltas. If two writers race to create the row, the loser's
+    insert fails inside its savepoint and it falls back to the update. Rows that
+    drop to zero transactions are removed.
+    """
+    rows = model.objects.filter(**lookup)
+    delta = {'total_amount': F('total_amount') + amount, 'txn_count': F('txn_count') + count}
+
+    if rows.update(**delta):
+        if count < 0:
+            rows.filter(txn_count__lte=0).delete()
+        return
+    if count <= 0:
+        # Nothing to take the transaction out of; rebuild_ledger_rollup repairs the table
+        return
+    try:
+        with db_transaction.atomic():
+            model.objects.create(total_amount=amount, txn_count=count, **lookup)
+    except IntegrityError:
+        rows.update(**delta)
+
+
+def rebuild_ledger_rollup(user=None) -> int:
+    """
+    Recompute the daily and period rollups from Transaction, for one user or everyone
+
+    Needed after writes that skip model signals (queryset.update, bulk_create, raw SQL).
+    Returns the number of rollup rows written.
+    """
+    transactions = Transaction.objects.all()
+    daily_rows = DailyLedgerRollup.objects.all()
+    period_rows = PeriodLedgerRollup.objects.all()
+    if user is not None:
+        transactions = transactions.filter(user=user)
+        daily_rows = daily_rows.filter(user=user)
+        period_rows = period_rows.filter(user=user)
+
+    grouped = transactions.values('user_id', 'date', 'transaction_type', 'category').annotate(
+        total=Sum('amount'), count=Count('id')
+    ).order_by()
+
+    daily: Dict[RollupKey, Tuple[Decimal, int]] = {}
+    for row in grouped.iterator():
+        key = rollup_key(row['user_id'], row['date'], row['transaction_type'], row['category'])
+        _accumulate(daily, key, row['total'], row['count'])
+
+    periods: Dict[Tuple[int, str, object, str, str], Tuple[Decimal, int]] = {}
+    for (user_id, day, transaction_type, category), (total, count) in daily.items():
+        for level in PERIOD_LEVELS:
+            key = (user_id, level, period_start(day, level.lower()), transaction_type, category)
+            _accumulate(periods, key, total, count)
+
+    with db_transaction.atomic():
+        daily_rows.delete()
+        period_rows.delete()
+        DailyLedgerRollup.objects.bulk_create(
+            [
+                DailyLedgerRollup(
+                    user_id=user_id, date=day, transaction_type=transaction_type,
+                    category=category, total_amount=total, txn_count=count
+                )
+                for (user_id, day, transaction_type, category), (total, count) in daily.items()
+            ],
+            batch_size=1000
+        )
+        PeriodLedgerRollup.objects.bulk_create(
+            [
+                PeriodLedgerRollup(
+                    user_id=user_id, granularity=level, period_start=start, transaction_type=transaction_type,
+                    category=category, total_amount=total, txn_count=count
+                )
+                for (user_id, level, start, transaction_type, category), (total, count) in periods.items()
+            ],
+            batch_size=1000
+        )
+    return len(daily) + len(periods)
+
+
+def _accumulate(totals: Dict, key, amount: Decimal, count: int) -> None:
+    total, existing = totals.get(key, (Decimal('0'), 0))
+    totals[key] = (total + amount, existing + count)
@@ -0,0 +1,303 @@
+import logging
+import os
+import sqlite3
+import tempfile
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from counto_app.models import LedgerChange, Transaction
+from counto_app.money import Money
+
+logger = logging.getLogger(__name__)
+
+# Bump when the sidecar schema changes; files with another version are rebuilt
+SCHEMA_VERSION = 1
+# Changes logged this long before the last refresh are read again, in case their
+# database transaction committed after a change with a higher id had been read
+CHANGE_GRACE = timedelta(seconds=60)
+# Transactions fetched from the main database per query while applying changes
+FETCH_BATCH = 500
+
+SOURCE_FIELDS = ('id', 'date', 'amount', 'transaction_type', 'category', 'customer_id', 'vendor_id', 'description')
+
+SCHEMA = """
+CREATE TABLE transactions (
+    id INTEGER PRIMARY KEY,
+    date TEXT NOT NULL,
+    amount INTEGER NOT NULL,
+    transaction_type TEXT NOT NULL,
+    category TEXT NOT NULL,
+    customer_id INTEGER,
+    vendor_id INTEGER,
+    description TEXT NOT NULL
+);
+CREATE INDEX transactions_date ON transactions (date);
+CREATE INDEX transactions_type_date ON transactions (transaction_type, date);
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+
+def olap_enabled() -> bool:
+    return bool(settings.OLAP_DATA_DIR)
+
+
+def record_ledger_changes(user_id: int, transaction_ids: Iterable[int]) -> None:
+    """Log transactions whose stored row changed, for the sidecars to pick up"""
+    if not olap_enabled():
+        return
+    LedgerChange.objects.bulk_create(
+        [LedgerChange(user_id=user_id, transaction_id=pk) for pk in transaction_ids], batch_size=1000
+    )
+
+
+def prune_ledger_changes() -> int:
+    """Delete change rows older than the retention window; returns the number deleted"""
+    cutoff = timezone.now() - timedelta(days=settings.OLAP_CHANGE_RETENTION_DAYS)
+    deleted, _ = LedgerChange.objects.filter(created_at__lt=cutoff).delete()
+    return deleted
+
+
+class OlapStore:
+    """
+    One user's transactions in a SQLite file under OLAP_DATA_DIR
+
+    Amounts are integer paise and dates ISO strings, so sums and range filters
+    run on plain integers and text. The file is a copy: refresh() brings it up
+    to date by reading LedgerChange past the stored cursor and re-copying just
+    the transactions those changes name, and a full rebuild is written to a
+    temporary file and swapped in, so readers never see a half-built store.
+    """
+
+    def __init__(self, user_id: int, data_dir: Optional[str] = None):
+        self.user_id = user_id
+        self.data_dir = data_dir or settings.OLAP_DATA_DIR
+        self.path = os.path.join(self.data_dir, f'ledger_{user_id}.sqlite3')
+
+    # Keeping the copy current
+
+    def refresh(self) -> int:
+        """Apply changes logged since the last refresh; returns how many transactions were re-copied"""
+        if not self._is_current():
+            return self.rebuild()
+
+        connection = self._connect()
+        try:
+            connection.execute('BEGIN IMMEDIATE')
+            meta = dict(connection.execute('SELECT key, value FROM meta'))
+            cursor = int(meta['cursor'])
+            since = datetime.fromisoformat(meta['refreshed_at']) - CHANGE_GRACE
+            started = timezone.now()
+
+            changes = list(
+                LedgerChange.objects.filter(user_id=self.user_id)
+                .filter(Q(id__gt=cursor) | Q(created_at__gte=since))
+                .values_list('id', 'transaction_id')
+            )
+            changed_ids = sorted({transaction_id for _, transaction_id in changes})
+            for start in range(0, len(changed_ids), FETCH_BATCH):
+                batch = changed_ids[start:start + FETCH_BATCH]
+                rows = Transaction.objects.filter(user_id=self.user_id, id__in=batch).values_list(*SOURCE_FIELDS)
+                connection.executemany(
+                    "DELETE FROM transactions WHERE id = ?", [(pk,) for pk in batch]
+                )
+                connection.executemany(_INSERT, (_sidecar_row(row) for row in rows))
+
+            cursor = max([cursor] + [change_id for change_id, _ in changes])
+            connection.executemany(
+                'UPDATE meta SET value = ? WHERE key = ?',
+                [(str(cursor), 'cursor'), (started.isoformat(), 'refreshed_at')]
+            )
+            connection.commit()
+            return len(changed_ids)
+        finally:
+            connection.close()
+
+    def rebuild(self) -> int:
+        """Copy every transaction into a fresh file and swap it in; returns the number of rows"""
+        os.makedirs(self.data_dir, exist_ok=True)
+        # Read the cursor first, so changes made during the copy are applied again by the next refresh
+        cursor = LedgerChange.objects.aggregate(last=Max('id'))['last'] or 0
+        started = timezone.now()
+
+        handle, temp_path = tempfile.mkstemp(prefix=f'ledger_{self.user_id}.', suffix='.tmp', dir=self.data_dir)
+        os.close(handle)
+        try:
+            connection = sqlite3.connect(temp_path)
+            try:
+                connection.executescript(SCHEMA)
+                rows = (
+                    Transaction.objects.filter(user_id=self.user_id).order_by('id')
+                    .values_list(*SOURCE_FIELDS).iterator(chunk_size=2000)
+                )
+                connection.executemany(_INSERT, (_sidecar_row(row) for row in rows))
+                connection.executemany('INSERT INTO meta (key, value) VALUES (?, ?)', [
+                    ('user_id', str(self.user_id)),
+                    ('cursor', str(cursor)),
+                    ('refreshed_at', started.isoformat()),
+                ])
+                connection.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+                connection.commit()
+                count = connection.execute('SELECT COUNT(*) FROM transactions').fetchone()[0]
+            finally:
+                connection.close()
+            os.replace(temp_path, self.path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        logger.info(f"Rebuilt OLAP sidecar for user {self.user_id}: {count} transactions")
+        return count
+
+    def _is_current(self) -> bool:
+        """Whether the file exists, has this schema, and was refreshed inside the change retention window"""
+        if not os.path.exists(self.path):
+            return False
+        try:
+            connection = self._connect(read_only=True)
+            try:
+                if connection.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+                    return False
+                row = connection.execute("SELECT value FROM meta WHERE key = 'refreshed_at'").fetchone()
+            finally:
+                connection.close()
+        except sqlite3.DatabaseError:
+            return False
+        if row is None:
+            return False
+        retention = timedelta(days=settings.OLAP_CHANGE_RETENTION_DAYS)
+        return datetime.fromisoformat(row[0]) - CHANGE_GRACE > timezone.now() - retention
+
+    def _connect(self, read_only: bool = False) -> sqlite3.Connection:
+        if read_only:
+            return sqlite3.connect(f'file:{self.path}?mode=ro', uri=True)
+        return sqlite3.connect(self.path, isolation_level=None)
+
+    # Reads
+
+    def query(self, sql: str, params: Sequence = ()) -> List[tuple]:
+        """Run a read-only query against the sidecar"""
+        connection = self._connect(read_only=True)
+        try:
+            return connection.execute(sql, params).fetchall()
+        finally:
+            connection.close()
+
+    def count(self) -> int:
+        return self.query('SELECT COUNT(*) FROM transactions')[0][0]
+
+    def ledger_rows(self, after_id: int = 0) -> List[tuple]:
+        """Rows in ledger_engine.LEDGER_FIELDS order past after_id, with amounts as Money"""
+        return [
+            (pk, date.fromisoformat(day), Money(paise), transaction_type, category, customer_id, vendor_id)
+            for pk, day, paise, transaction_type, category, customer_id, vendor_id in self.query(
+                'SELECT id, date, amount, transaction_type, category, customer_id, vendor_id '
+                'FROM transactions WHERE id > ? ORDER BY id',
+                (after_id,)
+            )
+        ]
+
+    def summarize(self, start: Optional[date] = None, end: Optional[date] = None,
+                  transaction_type: Optional[str] = None, customer_ids: Optional[Sequence[int]] = None,
+                  vendor_ids: Optional[Sequence[int]] = None, top_categories: int = 10,
+                  latest: int = 500) -> Dict[str, Any]:
+        """
+        Totals, top categories and the latest rows for a filtered set of transactions
+
+        Parties filter like the chat context does: a row matches when its customer
+        is in customer_ids or its vendor is in vendor_ids. Amounts come back as
+        Decimal, as they would from the main database.
+        """
+        where, params = _where(start, end, transaction_type, customer_ids, vendor_ids)
+        connection = self._connect(read_only=True)
+        try:
+            income, expenses, count = connection.execute(
+                "SELECT SUM(CASE WHEN transaction_type = 'INCOME' THEN amount END), "
+                "SUM(CASE WHEN transaction_type = 'EXPENSE' THEN amount END), COUNT(*) "
+                f"FROM transactions WHERE {where}", params
+            ).fetchone()
+            categories = connection.execute(
+                'SELECT category, transaction_type, SUM(amount) AS total, COUNT(*) '
+                f'FROM transactions WHERE {where} GROUP BY category, transaction_type ORDER BY total DESC LIMIT ?',
+                params + [top_categories]
+            ).fetchall()
+            rows = connection.execute(
+                'SELECT date, description, amount, category, transaction_type, customer_id, vendor_id '
+                f'FROM transactions WHERE {where} ORDER BY date DESC, id DESC LIMIT ?',
+                params + [latest]
+            ).fetchall()
+        finally:
+            connection.close()
+
+        return {
+            'income': _decimal(income),
+            'expenses': _decimal(expenses),
+            'count': count,
+            'categories': [
+                (category, kind, Money(total).to_decimal(), rows_in_group)
+                for category, kind, total, rows_in_group in categories
+            ],
+            'rows': [
+                (date.fromisoformat(day), description, Money(paise).to_decimal(), category, kind, customer_id, vendor_id)
+                for day, description, paise, category, kind, customer_id, vendor_id in rows
+            ],
+        }
+
+
+_INSERT = (
+    'INSERT INTO transactions (id, date, amount, transaction_type, category, customer_id, vendor_id, description) '
+    'VALUES (?, ?, ?, ?, ?, ?, ?, ?)'
+)
+
+
+def _sidecar_row(row: tuple) -> tuple:
+    pk, day, amount, transaction_type, category, customer_id, vendor_id, description = row
+    return (pk, day.isoformat(), Money.of(amount).paise, transaction_type, category or '',
+            customer_id, vendor_id, description or '')
+
+
+def _where(start, end, transaction_type, customer_ids, vendor_ids) -> Tuple[str, List]:
+    clauses, params = ['1 = 1'], []
+    if start is not None:
+        clauses.append('date >= ?')
+        params.append(start.isoformat())
+    if end is not None:
+        clauses.append('date <= ?')
+        params.append(end.isoformat())
+    if transaction_type is not None:
+        clauses.append('transaction_type = ?')
+        params.append(transaction_type)
+    if customer_ids is not None or vendor_ids is not None:
+        customer_ids, vendor_ids = list(customer_ids or []), list(vendor_ids or [])
+        clauses.append(
+            f"(customer_id IN ({', '.join('?' * len(customer_ids)) or 'NULL'}) "
+            f"OR vendor_id IN ({', '.join('?' * len(vendor_ids)) or 'NULL'}))"
+        )
+        params.extend(customer_ids + vendor_ids)
+    return ' AND '.join(clauses), params
+
+
+def _decimal(paise: Optional[int]):
+    return Money(paise).to_decimal() if paise is not None else None
+
+
+def olap_store(user) -> Optional[OlapStore]:
+    """
+    The user's sidecar, brought up to date, or None when sidecars are off or unusable
+
+    Callers fall back to the main database on None, so a missing directory or a
+    damaged file costs a slower query, not an error.
+    """
+    if not olap_enabled():
+        return None
+    store = OlapStore(user.pk)
+    try:
+        store.refresh()
+    except (sqlite3.Error, OSError, DatabaseError) as e:
+        logger.warning(f"OLAP sidecar for user {user.pk} unavailable, reading the main database: {e}")
+        return None
+    return store
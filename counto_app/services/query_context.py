@@ -0,0 +1,218 @@
+import re
+from typing import List, Optional
+
+from django.conf import settings
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Q, Sum
+
+from counto_app.models import Customer, Transaction, Vendor
+from counto_app.services.gemini_services import estimate_tokens
+from counto_app.services.olap_store import olap_store
+from counto_app.services.query_engine import EXPENSE_WORDS, INCOME_WORDS, parse_period
+
+# Upper bound on rows pulled from the database before ranking and budgeting
+MAX_CANDIDATE_ROWS = 500
+# Number of category totals listed in the aggregates section
+TOP_CATEGORIES = 10
+
+ANALYSIS_NOTES = [
+    "",
+    "When analyzing this data:",
+    "1. Use the totals above for sums and counts; the records listed may be a subset",
+    "2. 'Today', 'this month' and 'this year' refer to the current calendar period",
+]
+
+WORD_PATTERN = re.compile(r"[a-z0-9]{3,}")
+NAME_TOKEN = re.compile(r"\w+")
+STOP_WORDS = {
+    'the', 'and', 'for', 'how', 'much', 'many', 'what', 'was', 'were', 'did', 'show', 'tell',
+    'list', 'all', 'with', 'from', 'this', 'last', 'month', 'week', 'year', 'today', 'total',
+    'spend', 'spent', 'expense', 'expenses', 'income', 'transactions', 'transaction', 'customer',
+    'customers', 'vendor', 'vendors', 'have', 'has', 'are', 'our', 'your', 'any', 'about',
+}
+
+
+def build_query_context(user, intent_type: str, user_message: str, token_budget: Optional[int] = None) -> str:
+    """
+    Build the data section of a query prompt within a token budget
+
+    Rows are pre-filtered in the database by the period, direction and party the
+    message mentions, ranked by how many of the message's keywords they contain
+    (most recent first on ties), and added until QUERY_CONTEXT_TOKEN_BUDGET is
+    reached. Aggregates over the whole filtered set are always included, so totals
+    stay correct even when rows are cut off.
+    """
+    if token_budget is None:
+        token_budget = settings.QUERY_CONTEXT_TOKEN_BUDGET
+
+    if intent_type == "TRANSACTION":
+        header, aggregates, rows = _transaction_context(user, user_message)
+    elif intent_type == "CUSTOMER":
+        header, aggregates, rows = _party_context(Customer, 'total_receivable', 'total_received', user, user_message)
+    elif intent_type == "VENDOR":
+        header, aggregates, rows = _party_context(Vendor, 'total_payable', 'total_paid', user, user_message)
+    else:
+        return ""
+
+    lines = ["\n\nHere is the relevant DATA for this query. All amounts are in numbers only (no currency symbols):"]
+    lines.extend(aggregates)
+    used = sum(estimate_tokens(line) for line in lines)
+
+    ranked = _rank(rows, user_message)
+    included = []
+    for row in ranked:
+        cost = estimate_tokens(row)
+        if used + cost > token_budget:
+            break
+        included.append(row)
+        used += cost
+
+    if included:
+        lines.append(f"Matching records ({len(included)} of {len(rows)}{'+' if len(rows) >= MAX_CANDIDATE_ROWS else ''}):")
+        lines.append(header)
+        lines.extend(included)
+    else:
+        lines.append("No individual records match this query.")
+    lines.extend(ANALYSIS_NOTES)
+    return "\n".join(lines) + "\n"
+
+
+def _transaction_context(user, user_message: str):
+    text = user_message.lower()
+    filters = []
+    lookup = {}
+
+    period = parse_period(text)
+    if period:
+        lookup.update(start=period.start, end=period.end)
+        filters.append(period.label)
+
+    is_expense = bool(EXPENSE_WORDS.search(text))
+    is_income = bool(INCOME_WORDS.search(text))
+    if is_expense != is_income:
+        lookup['transaction_type'] = 'EXPENSE' if is_expense else 'INCOME'
+        filters.append('expenses only' if is_expense else 'income only')
+
+    customers = _mentioned_names(Customer, user, text)
+    vendors = _mentioned_names(Vendor, user, text)
+    if customers or vendors:
+        lookup.update(
+            customer_ids=list(Customer.objects.filter(user=user, name__in=customers).values_list('id', flat=True)),
+            vendor_ids=list(Vendor.objects.filter(user=user, name__in=vendors).values_list('id', flat=True)),
+        )
+        filters.append('mentioned customer/vendor only')
+
+    # Heavy scans go to the user's OLAP sidecar when one is configured
+    store = olap_store(user)
+    if store is not None:
+        summary = store.summarize(top_categories=TOP_CATEGORIES, latest=MAX_CANDIDATE_ROWS, **lookup)
+    else:
+        summary = _summarize(user, **lookup)
+
+    income = summary['income'] or 0
+    expenses = summary['expenses'] or 0
+    aggregates = [
+        f"Filters applied: {', '.join(filters) if filters else 'none (all transactions)'}",
+        f"Totals: {summary['count']} transactions, income {income:.2f}, expenses {expenses:.2f}, net {income - expenses:.2f}",
+    ]
+
+    if summary['categories']:
+        aggregates.append("Totals by category:")
+        aggregates.extend(
+            f"- {category or 'Uncategorized'} ({transaction_type}): {total:.2f} over {count} transactions"
+            for category, transaction_type, total, count in summary['categories']
+        )
+
+    party_ids = {pk for *_, customer_id, vendor_id in summary['rows'] for pk in (customer_id, vendor_id) if pk}
+    names = dict(Customer.objects.filter(user=user, id__in=party_ids).values_list('id', 'name'))
+    vendor_names = dict(Vendor.objects.filter(user=user, id__in=party_ids).values_list('id', 'name'))
+
+    header = "DATE       | DESCRIPTION                    | AMOUNT   | CATEGORY        | TYPE    | CUSTOMER/VENDOR"
+    rows = [
+        f"{day:%Y-%m-%d} | {description[:30]:30} | {amount:>8.2f} | {(category or 'Uncategorized')[:15]:15} | "
+        f"{transaction_type:7} | {(names.get(customer_id) if transaction_type == 'INCOME' else vendor_names.get(vendor_id)) or ''}"
+        for day, description, amount, category, transaction_type, customer_id, vendor_id in summary['rows']
+    ]
+    return header, aggregates, rows
+
+
+def _summarize(user, start=None, end=None, transaction_type=None, customer_ids=None, vendor_ids=None):
+    """The main-database equivalent of OlapStore.summarize, used when sidecars are off"""
+    transactions = Transaction.objects.filter(user=user)
+    if start is not None:
+        transactions = transactions.filter(date__gte=start)
+    if end is not None:
+        transactions = transactions.filter(date__lte=end)
+    if transaction_type is not None:
+        transactions = transactions.filter(transaction_type=transaction_type)
+    if customer_ids is not None or vendor_ids is not None:
+        transactions = transactions.filter(Q(customer_id__in=customer_ids or []) | Q(vendor_id__in=vendor_ids or []))
+
+    totals = transactions.aggregate(
+        income=Sum('amount', filter=Q(transaction_type='INCOME')),
+        expenses=Sum('amount', filter=Q(transaction_type='EXPENSE')),
+        count=Count('id')
+    )
+    by_category = (
+        transactions.values_list('category', 'transaction_type')
+        .annotate(total=Sum('amount'), count=Count('id'))
+        .order_by('-total')[:TOP_CATEGORIES]
+    )
+    return dict(
+        totals,
+        categories=list(by_category),
+        rows=list(
+            transactions.order_by('-date', '-id').values_list(
+                'date', 'description', 'amount', 'category', 'transaction_type', 'customer_id', 'vendor_id'
+            )[:MAX_CANDIDATE_ROWS]
+        ),
+    )
+
+
+def _party_context(model, total_field: str, settled_field: str, user, user_message: str):
+    text = user_message.lower()
+    outstanding = ExpressionWrapper(F(total_field) - F(settled_field), output_field=DecimalField(max_digits=12, decimal_places=2))
+    parties = model.objects.filter(user=user, is_active=True)
+
+    names = _mentioned_names(model, user, text)
+    if names:
+        parties = parties.filter(name__in=names)
+
+    totals = parties.aggregate(count=Count('id'), total=Sum(total_field), outstanding=Sum(outstanding))
+    label = model.__name__.lower()
+    aggregates = [
+        f"Filters applied: {'mentioned ' + label + 's only' if names else 'none (all active ' + label + 's)'}",
+        f"Totals: {totals['count']} {label}s, billed {totals['total'] or 0:.2f}, outstanding {totals['outstanding'] or 0:.2f}",
+    ]
+
+    header = "NAME | EMAIL | PHONE | GST NUMBER | OUTSTANDING"
+    rows = [
+        f"{p['name']} | {p['email'] or '-'} | {p['phone'] or '-'} | {p['gst_number'] or '-'} | {p['outstanding']:.2f}"
+        for p in parties.annotate(outstanding=outstanding).order_by('-outstanding', 'name').values(
+            'name', 'email', 'phone', 'gst_number', 'outstanding'
+        )[:MAX_CANDIDATE_ROWS]
+    ]
+    return header, aggregates, rows
+
+
+def _mentioned_names(model, user, text: str) -> List[str]:
+    """Names of the user's customers or vendors that appear in the message as whole words"""
+    tokens = set(NAME_TOKEN.findall(text))
+    if not tokens:
+        return []
+    # A mentioned name starts with one of the message's words, so only those names are loaded
+    starts_with_token = Q()
+    for token in tokens:
+        starts_with_token |= Q(name__istartswith=token)
+    names = model.objects.filter(starts_with_token, user=user, is_active=True).values_list('name', flat=True)
+    return [
+        name for name in names
+        if name and re.search(r"(?<!\w)" + re.escape(name.strip().lower()) + r"(?!\w)", text)
+    ]
+
+
+def _rank(rows: List[str], user_message: str) -> List[str]:
+    """Order rows by keyword overlap with the message; sorted() keeps recency order on ties"""
+    keywords = set(WORD_PATTERN.findall(user_message.lower())) - STOP_WORDS
+    if not keywords:
+        return rows
+    return sorted(rows, key=lambda row: -sum(1 for word in keywords if word in row.lower()))
@@ -0,0 +1,245 @@
+import calendar
+import re
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import List, NamedTuple, Optional, Tuple
+
+from django.utils import timezone
+
+from counto_app.models import Customer, Vendor
+from counto_app.services.ledger_engine import TYPE_CODES, get_ledger, paise_to_decimal
+from counto_app.services.ledger_periods import add_months
+
+MONTHS = {name.lower(): number for number, name in enumerate(calendar.month_name) if name}
+MONTHS.update({name.lower(): number for number, name in enumerate(calendar.month_abbr) if name})
+
+# "total" alone also appears in entries ("paid 500 total for groceries"), so it needs a question form
+AMOUNT_QUESTION = re.compile(
+    r"\b(how much|sum of|what(?:'s| is| was| were) (?:the |my )?total|what(?:'s| is) my"
+    r"|what did i (?:spend|earn|make|receive)"
+    r"|total (?:spen[dt]|spending|expenses?|income|earn(?:ed|ings)|received|revenue|sales|profit|net))\b"
+    r"|\btotal\b.*\?$"
+)
+COUNT_QUESTION = re.compile(r"\b(how many|number of|count of|count)\b")
+EXPENSE_WORDS = re.compile(r"\b(spen[dt]|spending|expenses?|paid|pay|burn(?:ed|t)?|costs?|bought|purchases?)\b")
+INCOME_WORDS = re.compile(r"\b(income|earn(?:ed|t)?|earnings|received|receive|revenue|sales?|made)\b")
+NET_WORDS = re.compile(r"\b(net|profit|savings?)\b")
+# "did Prakash pay me" and "Raju paid" are about money coming in, not the user's spending
+UNCLEAR_DIRECTION = re.compile(
+    r"\b(?:pay|paid|spend|spent|send|sent)\s+(?:me|us)\b"
+    r"|\bdid\s+(?!(?:i|we)\s)[a-z']+\s+(?:pay|spend|send|receive|earn)\b"
+    r"|(?<![\w'])(?!(?:i|we|i've|we've|have|has|had|was|were|been|total|ever|already)\s)[a-z']+\s+paid\b"
+)
+PARTY_NOUNS = re.compile(r"\b(customers?|vendors?|clients?|suppliers?|parties|party|people|persons?)\b")
+
+MONTH_PATTERN = re.compile(r"\b(?:in|for|during)\s+(" + "|".join(sorted(MONTHS, key=len, reverse=True)) + r")\b(?:\s+(\d{4}))?")
+LAST_N_PATTERN = re.compile(r"\b(?:last|past|previous)\s+(\d+)\s+(day|week|month)s?\b")
+PARTY_PATTERN = re.compile(
+    r"\b(?:to|from|with|by)\s+([a-z0-9][\w .&'-]*?)"
+    r"(?=\s+(?:in|on|for|during|last|this|today|yesterday|since|via)\b|[?.!,]|$)"
+)
+CATEGORY_PATTERN = re.compile(
+    r"\b(?:on|for)\s+([a-z][\w &'-]*?)"
+    r"(?=\s+(?:in|to|from|during|last|this|today|yesterday|since|via)\b|[?.!,]|$)"
+)
+# Words after "on"/"for" that describe a period rather than a category
+PERIOD_WORDS = {'today', 'yesterday', 'week', 'month', 'year', 'the month', 'the week', 'the year'}
+PERIOD_MENTION = re.compile(
+    r"\b(?:today|yesterday|(?:last|past|previous)\s+\d+\s+(?:day|week|month)s?|(?:this|last)\s+(?:week|month|year)"
+    r"|(?:in|for|during)\s+(?:" + "|".join(sorted(MONTHS, key=len, reverse=True)) + r")(?:\s+\d{4})?)\b"
+)
+# Every word a supported question can contain once its period, category and party are taken out
+KNOWN_WORDS = set("""
+    a an the i i've we we've me my our us you is are was were be been have has had do does did
+    how much many what what's whats total totals sum of count number so far till until up to date now overall all
+    in on for from to with by during since show tell give get please money amount amounts transaction transactions
+    spend spent spending expense expenses pay paid burn burned burnt cost costs bought purchase purchases
+    income earn earned earnt earnings receive received revenue sale sales made make net profit saving savings
+""".split())
+WORD = re.compile(r"[a-z]+(?:'[a-z]+)?|\d+")
+
+
+class Period(NamedTuple):
+    start: Optional[date]
+    end: Optional[date]
+    label: str
+
+
+class QueryAnswer(NamedTuple):
+    text: str
+    total: Decimal
+    count: int
+    period: Period
+
+
+def parse_period(message: str, today: Optional[date] = None) -> Optional[Period]:
+    """Recognise a relative or named period in a chat message, or return None"""
+    text = message.lower()
+    today = today or timezone.now().date()
+
+    if 'today' in text:
+        return Period(today, today, 'today')
+    if 'yesterday' in text:
+        day = today - timedelta(days=1)
+        return Period(day, day, 'yesterday')
+
+    match = LAST_N_PATTERN.search(text)
+    if match:
+        n, unit = int(match.group(1)), match.group(2)
+        if unit == 'day':
+            start = today - timedelta(days=n - 1)
+        elif unit == 'week':
+            start = today - timedelta(weeks=n) + timedelta(days=1)
+        else:
+            start = add_months(today, -n) + timedelta(days=1)
+        return Period(start, today, f"in the last {n} {unit}{'s' if n != 1 else ''}")
+
+    week_start = today - timedelta(days=today.weekday())
+    if 'this week' in text:
+        return Period(week_start, today, 'this week')
+    if 'last week' in text:
+        return Period(week_start - timedelta(days=7), week_start - timedelta(days=1), 'last week')
+
+    month_start = today.replace(day=1)
+    if 'this month' in text:
+        return Period(month_start, today, 'this month')
+    if 'last month' in text:
+        end = month_start - timedelta(days=1)
+        return Period(end.replace(day=1), end, 'last month')
+
+    if 'this year' in text:
+        return Period(today.replace(month=1, day=1), today, 'this year')
+    if 'last year' in text:
+        return Period(date(today.year - 1, 1, 1), date(today.year - 1, 12, 31), 'last year')
+
+    match = MONTH_PATTERN.search(text)
+    if match:
+        month = MONTHS[match.group(1)]
+        year = int(match.group(2)) if match.group(2) else (today.year if month <= today.month else today.year - 1)
+        last_day = calendar.monthrange(year, month)[1]
+        return Period(date(year, month, 1), date(year, month, last_day), f"in {calendar.month_name[month]} {year}")
+
+    return None
+
+
+def answer_query(user, message: str, today: Optional[date] = None) -> Optional[QueryAnswer]:
+    """
+    Answer simple aggregate questions about transactions from the in-memory ledger columns
+
+    Handles totals and counts of income, expenses or net balance, optionally
+    filtered by period, category and party. Returns None whenever the question
+    has a part this engine cannot resolve, so the caller can fall back to Gemini.
+    """
+    text = message.lower().strip()
+
+    wants_count = bool(COUNT_QUESTION.search(text))
+    if not wants_count and not AMOUNT_QUESTION.search(text):
+        return None
+    if UNCLEAR_DIRECTION.search(text) or (wants_count and PARTY_NOUNS.search(text)):
+        return None
+    if len(PERIOD_MENTION.findall(text)) > 1 or _unresolved_words(text):
+        return None
+
+    is_expense = bool(EXPENSE_WORDS.search(text))
+    is_income = bool(INCOME_WORDS.search(text))
+    is_net = bool(NET_WORDS.search(text))
+    if is_net:
+        transaction_type = None
+    elif is_expense != is_income:
+        transaction_type = 'EXPENSE' if is_expense else 'INCOME'
+    else:
+        return None
+
+    period = parse_period(text, today) or Period(None, None, 'in total')
+
+    ledger = get_ledger(user)
+    selected = ledger.mask(period.start, period.end)
+
+    category = None
+    match = CATEGORY_PATTERN.search(text)
+    if match and match.group(1).strip() not in PERIOD_WORDS and not _is_period_phrase(match.group(1)):
+        category = _resolve_category(ledger.category_names, match.group(1).strip())
+        if category is None:
+            return None
+        selected &= ledger.category_mask(category)
+
+    party = None
+    match = PARTY_PATTERN.search(text)
+    if match:
+        resolved = _resolve_party(user, match.group(1).strip())
+        if resolved is None:
+            return None
+        party, customer_ids, vendor_ids = resolved
+        selected &= ledger.party_mask(customer_ids, vendor_ids)
+
+    totals = ledger.totals(selected)
+    if transaction_type:
+        total = paise_to_decimal(totals['income' if transaction_type == 'INCOME' else 'expenses'])
+        count = int((selected & (ledger.types == TYPE_CODES[transaction_type])).sum())
+    else:
+        total = paise_to_decimal(totals['net'])
+        count = totals['count']
+
+    text_out = _describe(transaction_type, wants_count, total, count, period, category, party)
+    return QueryAnswer(text_out, total, count, period)
+
+
+def _unresolved_words(text: str) -> List[str]:
+    """
+    Words the engine would ignore: anything outside the question vocabulary
+    once the period, category and party phrases are removed. A number left
+    over means the message also carries an entry or an amount filter.
+    """
+    text = PERIOD_MENTION.sub(' ', text)
+    match = CATEGORY_PATTERN.search(text)
+    if match and match.group(1).strip() not in PERIOD_WORDS and not _is_period_phrase(match.group(1)):
+        text = text.replace(match.group(0), ' ', 1)
+    match = PARTY_PATTERN.search(text)
+    if match:
+        text = text.replace(match.group(0), ' ', 1)
+    return [word for word in WORD.findall(text) if word not in KNOWN_WORDS]
+
+
+def _is_period_phrase(phrase: str) -> bool:
+    phrase = phrase.strip()
+    return phrase.split()[0] in MONTHS or phrase.startswith(('this ', 'last ', 'the last ', 'the past '))
+
+
+def _resolve_category(categories, phrase: str) -> Optional[str]:
+    """Match a category phrase against the user's existing categories"""
+    lookup = {c.lower(): c for c in categories if c}
+    for candidate in (phrase, phrase.rstrip('s'), phrase + 's'):
+        if candidate in lookup:
+            return lookup[candidate]
+    return None
+
+
+def _resolve_party(user, phrase: str) -> Optional[Tuple[str, List[int], List[int]]]:
+    """Match a party phrase against the user's customer and vendor names: (name, customer ids, vendor ids)"""
+    customers = list(Customer.objects.filter(user=user, name__iexact=phrase).values_list('id', 'name'))
+    vendors = list(Vendor.objects.filter(user=user, name__iexact=phrase).values_list('id', 'name'))
+    if not customers and not vendors:
+        return None
+    name = (customers or vendors)[0][1]
+    return name, [pk for pk, _ in customers], [pk for pk, _ in vendors]
+
+
+def _describe(transaction_type, wants_count, total, count, period, category, party) -> str:
+    scope = ""
+    if category:
+        scope += f" on {category}"
+    if party:
+        scope += f" {'from' if transaction_type == 'INCOME' else 'to'} {party}" if transaction_type else f" with {party}"
+
+    noun = 'transaction' if count == 1 else 'transactions'
+    if transaction_type is None:
+        direction = "a net surplus" if total >= 0 else "a net deficit"
+        return f"You have {direction} of ₹{abs(total):,.2f}{scope} {period.label}, across {count} {noun}."
+
+    kind = 'expense' if transaction_type == 'EXPENSE' else 'income'
+    if wants_count:
+        return f"You recorded {count} {kind} {noun}{scope} {period.label}, totalling ₹{total:,.2f}."
+
+    verb = 'spent' if transaction_type == 'EXPENSE' else 'received'
+    return f"You {verb} ₹{total:,.2f}{scope} {period.label}, across {count} {noun}."
+
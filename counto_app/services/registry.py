@@ -0,0 +1,100 @@
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# How long to wait before retrying a client that failed to initialise
+RETRY_AFTER_SECONDS = 60
+
+_lock = threading.Lock()
+_instances: Dict[str, Any] = {}
+_failures: Dict[str, float] = {}
+
+
+def _get_or_create(key: str, factory: Callable[[], Any]) -> Optional[Any]:
+    """
+    Return the shared client stored under ``key``, creating it on first use.
+
+    Clients are created at most once per worker process. If the factory raises,
+    the failure is remembered and ``None`` is returned until RETRY_AFTER_SECONDS
+    have passed, so a missing credentials file does not cost a retry on every request.
+    """
+    instance = _instances.get(key)
+    if instance is not None:
+        return instance
+
+    with _lock:
+        # Another thread may have created the client while we were waiting
+        instance = _instances.get(key)
+        if instance is not None:
+            return instance
+
+        failed_at = _failures.get(key)
+        if failed_at is not None and time.monotonic() - failed_at < RETRY_AFTER_SECONDS:
+            return None
+
+        try:
+            instance = factory()
+        except Exception as e:
+            logger.error(f"Failed to initialize {key} client: {e}")
+            _failures[key] = time.monotonic()
+            return None
+
+        _failures.pop(key, None)
+        _instances[key] = instance
+        return instance
+
+
+def _create_gemini_service():
+    from .gemini_services import GeminiService
+    service = GeminiService()
+    service.start_health_check()
+    return service
+
+
+def _create_sheets_service():
+    from .sheets_services import GoogleSheetsService
+    return GoogleSheetsService()
+
+
+def _create_tally_service():
+    from counto_app.tally.tally_integration import TallyIntegrationService
+    return TallyIntegrationService()
+
+
+def get_gemini_service():
+    """
+    Get the shared GeminiService, rebuilding it once its health probe has failed
+
+    A service whose probe failed reports itself unavailable, so requests get the
+    usual "AI service is unavailable" reply instead of calling a dead model. It
+    is rebuilt, with a fresh probe, on the first lookup RETRY_AFTER_SECONDS after
+    the failed probe.
+    """
+    service = _get_or_create('gemini', _create_gemini_service)
+    if (service is not None and service.healthy is False
+            and time.monotonic() - service.checked_at >= RETRY_AFTER_SECONDS):
+        with _lock:
+            if _instances.get('gemini') is service:
+                del _instances['gemini']
+        service = _get_or_create('gemini', _create_gemini_service)
+    return service
+
+
+def get_sheets_service():
+    """Get the shared GoogleSheetsService, or None if Sheets is not configured; each thread gets its own connection"""
+    return _get_or_create('sheets', _create_sheets_service)
+
+
+def get_tally_service():
+    """Get the shared TallyIntegrationService, or None if it could not be created"""
+    return _get_or_create('tally', _create_tally_service)
+
+
+def reset_clients():
+    """Drop all shared clients so the next lookup builds fresh ones"""
+    with _lock:
+        _instances.clear()
+        _failures.clear()
@@ -0,0 +1,168 @@
+import logging
+import re
+import threading
+import time
+from contextlib import ExitStack
+from typing import Any, Callable, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Rows per verification block
+BLOCK_SIZE = 200
+
+RANGE_PATTERN = re.compile(r"^(?P<sheet>[^!]+)!(?P<first>[A-Z]+)(?P<start>\d+):(?P<last>[A-Z]+)$")
+
+Rows = List[List[Any]]
+
+
+class SheetMirror:
+    """
+    Local copy of an open-ended sheet range such as 'Customers!A2:I'
+
+    Reads inside the staleness bound are served from memory. A refresh is one
+    batchGet covering three things: the rows past the ones already held, any
+    blocks marked written through expire(), and one more block taken in turn.
+    The last is compared with the copy, so over a cycle every block gets
+    checked. Sheets cannot return a checksum, so the block itself is
+    downloaded and compared. If a checked block differs (rows inserted, deleted
+    or edited by hand), the whole range is fetched again.
+
+    Writes by any process reach expire() through the SheetsWrite log (see
+    GoogleSheetsService), so rows the sync worker overwrites show up at the
+    next refresh. Only hand edits wait for the rotating check, up to
+    ceil(rows / block_size) refreshes.
+    """
+
+    def __init__(self, range_name: str, max_age: float, block_size: int = BLOCK_SIZE):
+        match = RANGE_PATTERN.match(range_name)
+        if match is None:
+            raise ValueError(f"Cannot mirror range '{range_name}': expected the form 'Sheet!A2:K'")
+        self.range_name = range_name
+        self.sheet_name = match['sheet']
+        self.first_column = match['first']
+        self.last_column = match['last']
+        self.start_row = int(match['start'])
+        self.max_age = max_age
+        self.block_size = block_size
+
+        self.rows: Optional[Rows] = None
+        self.fetched_at = 0.0
+        self._dirty_blocks = set()
+        self._next_block = 0
+        self._planned_blocks: Optional[List[int]] = None
+        self._lock = threading.Lock()
+
+    def read(self, get_range: Callable[[str], Rows], batch_get: Callable[[List[str]], List[Rows]]) -> Rows:
+        """The mirrored rows, refreshed first if they are older than max_age"""
+        return read_mirrors([self], get_range, batch_get)[0]
+
+    def stale(self) -> bool:
+        """Whether the next read refreshes a copy already held"""
+        return self.rows is not None and time.monotonic() - self.fetched_at >= self.max_age
+
+    def invalidate(self):
+        """Drop the copy, so the next read fetches the whole range"""
+        with self._lock:
+            self.rows = None
+            self._dirty_blocks.clear()
+
+    def expire(self, row_numbers: Iterable[int] = ()):
+        """Force a refresh on the next read, re-fetching the blocks holding these sheet rows"""
+        with self._lock:
+            self.fetched_at = 0.0
+            for row_number in row_numbers:
+                if row_number >= self.start_row:
+                    self._dirty_blocks.add((row_number - self.start_row) // self.block_size)
+
+    def _reload(self, get_range: Callable[[str], Rows]):
+        self._loaded(get_range(self.range_name))
+
+    def _loaded(self, rows: Rows):
+        self.rows = list(rows)
+        self.fetched_at = time.monotonic()
+        self._dirty_blocks.clear()
+
+    def _plan(self) -> List[str]:
+        """Ranges to fetch before the next read, empty while the copy is fresh; call with the lock held"""
+        self._planned_blocks = None
+        if self.rows is None:
+            return [self.range_name]
+        if time.monotonic() - self.fetched_at < self.max_age:
+            return []
+
+        held = len(self.rows)
+        block_count = -(-held // self.block_size)
+        checked = None
+        if block_count:
+            checked = self._next_block % block_count
+            self._next_block = checked + 1
+        self._planned_blocks = sorted({block for block in self._dirty_blocks if block < block_count} | (
+            {checked} if checked is not None else set()
+        ))
+        return [self._range(held, None)] + [
+            self._range(block * self.block_size, min((block + 1) * self.block_size, held) - 1)
+            for block in self._planned_blocks
+        ]
+
+    def _apply(self, fetched: List[Rows], get_range: Callable[[str], Rows]):
+        """Take in the values fetched for the ranges _plan() returned; call with the lock held"""
+        if self._planned_blocks is None:
+            self._loaded(fetched[0])
+            return
+
+        held = len(self.rows)
+        tail, *blocks = fetched
+        for block, values in zip(self._planned_blocks, blocks):
+            first = block * self.block_size
+            if _trimmed(values) == _trimmed(self.rows[first:min(first + self.block_size, held)]):
+                continue
+            if block in self._dirty_blocks:
+                # Written by this process: take the sheet's rendering of what was written
+                width = min(self.block_size, held - first)
+                self.rows[first:first + width] = list(values) + [[] for _ in range(width - len(values))]
+                continue
+            logger.info(f"Mirror of '{self.range_name}' differs from the sheet in block {block}; reloading it")
+            self._reload(get_range)
+            return
+
+        self.rows.extend(tail)
+        self.fetched_at = time.monotonic()
+        self._dirty_blocks.clear()
+
+    def _range(self, first_offset: int, last_offset: Optional[int]) -> str:
+        first_row = self.start_row + first_offset
+        last_row = '' if last_offset is None else self.start_row + last_offset
+        return f"{self.sheet_name}!{self.first_column}{first_row}:{self.last_column}{last_row}"
+
+
+def read_mirrors(mirrors: List[SheetMirror], get_range: Callable[[str], Rows],
+                 batch_get: Callable[[List[str]], List[Rows]]) -> List[Rows]:
+    """
+    Rows of several mirrors, refreshing every stale one with a single batchGet
+
+    Only a mirror whose checked block no longer matches costs a further call,
+    to reload that one range.
+    """
+    with ExitStack() as stack:
+        # A fixed order, so two readers of overlapping sets cannot deadlock
+        for mirror in sorted(set(mirrors), key=lambda mirror: mirror.range_name):
+            stack.enter_context(mirror._lock)
+
+        plans = [(mirror, mirror._plan()) for mirror in dict.fromkeys(mirrors)]
+        ranges = [range_name for _, planned in plans for range_name in planned]
+        if ranges:
+            fetched = batch_get(ranges)
+            offset = 0
+            for mirror, planned in plans:
+                if planned:
+                    mirror._apply(fetched[offset:offset + len(planned)], get_range)
+                    offset += len(planned)
+        return [list(mirror.rows) for mirror in mirrors]
+
+
+def _trimmed(rows: Rows) -> Rows:
+    """Rows without trailing empty ones, which the API leaves out of its responses"""
+    end = len(rows)
+    while end and not rows[end - 1]:
+        end -= 1
+    return list(rows[:end])
@@ -348,16 +348,66 @@
                 
     #     return filtered_transactions
 
+import hashlib
+import json
 import os
-from datetime import datetime
-from typing import Dict, Any, List, Tuple
+import re
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Any, Iterable, List, Optional, Tuple
 from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Max, Q
+from django.utils import timezone
 from google.oauth2 import service_account
+from google_auth_httplib2 import AuthorizedHttp
 from googleapiclient.discovery import build
+from googleapiclient.http import HttpRequest, build_http
 import logging
 
+from counto_app.models import SheetsWrite
+from counto_app.services.sheets_mirror import SheetMirror, read_mirrors
+
 logger = logging.getLogger(__name__)
 
+# SheetsWrite rows logged this long before a mirror last looked are read again, in case
+# their database transaction committed after a row with a higher id had been read
+WRITE_LOG_GRACE = timedelta(seconds=60)
+# SheetsWrite rows older than this are pruned; a mirror that has not looked for this long is reloaded
+WRITE_LOG_RETENTION = timedelta(days=1)
+
+# Sheets the app writes to, with the header row each one is created with
+SHEET_LAYOUT = {
+    'Transactions': [
+        'Date', 'Description', 'Category', 'Amount', 'Transaction Type',
+        'Customer', 'Vendor', 'Payment Method', 'Reference Number', 'Notes'
+    ],
+    'Customers': [
+        'Name', 'Email', 'Phone', 'GST Number', 'Address', 'Total Receivable', 'Total Received', 'Outstanding Balance', 'Created At'
+    ],
+    'Vendors': [
+        'Name', 'Email', 'Phone', 'GST Number', 'Address', 'Total Payable', 'Total Paid', 'Outstanding Balance', 'Created At'
+    ],
+}
+
+# Keys of the dictionaries get_all_* build from each sheet's columns
+TRANSACTION_FIELDS = [
+    'date', 'description', 'category', 'expected_amount', 'paid_amount',
+    'transaction_type', 'status', 'customer', 'vendor', 'payment_method',
+    'reference_number'
+]
+CUSTOMER_FIELDS = [
+    'name', 'email', 'phone', 'gst_number', 'address',
+    'total_receivable', 'total_received', 'outstanding_balance', 'created_at'
+]
+VENDOR_FIELDS = [
+    'name', 'email', 'phone', 'gst_number', 'address',
+    'total_payable', 'total_paid', 'outstanding_balance', 'created_at'
+]
+
+# First row number of the range an append wrote to, e.g. 'Customers!A12:I13' -> 12
+UPDATED_RANGE_ROW = re.compile(r"![A-Z]+(\d+)")
+
 class GoogleSheetsService:
     def __init__(self):
         # Set up credentials and API client
@@ -377,346 +427,436 @@ class GoogleSheetsService:
             scopes=['https://www.googleapis.com/auth/spreadsheets']
         )
         
-        # Build the service
-        self.service = build('sheets', 'v4', credentials=self.credentials)
+        # Build the service. The service is shared by every request thread, but httplib2
+        # connections are not thread-safe, so each thread sends its requests over its own.
+        self._local = threading.local()
+        self.service = build('sheets', 'v4', credentials=self.credentials, requestBuilder=self._build_request)
         self.sheet = self.service.spreadsheets()
+
+        # Lower-cased name -> row number for the Customers and Vendors sheets, loaded on first upsert,
+        # and the last row number each index knows about
+        self._row_index: Dict[str, Dict[str, int]] = {}
+        self._last_rows: Dict[str, int] = {}
+        self._row_index_lock = threading.Lock()
+
+        # Local copies of the ranges read by get_all_* and search_*, keyed by range, each with
+        # the last SheetsWrite id it has taken in and when it looked
+        self._mirrors: Dict[str, SheetMirror] = {}
+        self._write_cursors: Dict[str, Tuple[int, datetime]] = {}
+        self._mirrors_lock = threading.Lock()
         
         # Ensure all required sheets exist
-        self._ensure_sheet_exists('Transactions', [
-            'Date', 'Description', 'Category', 'Amount', 'Transaction Type',
-            'Customer', 'Vendor', 'Payment Method', 'Reference Number', 'Notes'
-        ])
-        self._ensure_sheet_exists('Customers', [
-            'Name', 'Email', 'Phone', 'GST Number', 'Address', 'Total Receivable', 'Total Received', 'Outstanding Balance', 'Created At'
-        ])
-        self._ensure_sheet_exists('Vendors', [
-            'Name', 'Email', 'Phone', 'GST Number', 'Address', 'Total Payable', 'Total Paid', 'Outstanding Balance', 'Created At'
-        ])
-        
-    def _ensure_sheet_exists(self, sheet_name: str, headers: List[str]):
-        """Ensure that the specified sheet exists with the correct headers"""
+        self._ensure_sheets(SHEET_LAYOUT)
+
+    def _build_request(self, http, *args, **kwargs) -> HttpRequest:
+        """An API request sent over the calling thread's own authorised connection"""
+        return HttpRequest(self._thread_http(), *args, **kwargs)
+
+    def _thread_http(self) -> AuthorizedHttp:
+        http = getattr(self._local, 'http', None)
+        if http is None:
+            http = self._local.http = AuthorizedHttp(self.credentials, http=build_http())
+        return http
+
+    def _ensure_sheets(self, layout: Dict[str, List[str]]):
+        """
+        Make sure every sheet in layout exists, creating missing ones with their headers
+
+        A verified layout is cached per spreadsheet for SHEETS_METADATA_TTL_SECONDS,
+        so a warm start makes no API call. Otherwise one metadata read lists the
+        sheets, and anything missing is added, headers included, in a single
+        batchUpdate.
+        """
+        cache_key = f"sheets_layout:{self.spreadsheet_id}"
+        signature = hashlib.sha1(json.dumps(layout, sort_keys=True).encode()).hexdigest()
+        if cache.get(cache_key) == signature:
+            return
+
         try:
-            # Get the spreadsheet info
-            spreadsheet = self.sheet.get(spreadsheetId=self.spreadsheet_id).execute()
-            sheets = spreadsheet.get('sheets', [])
-            
-            # Check if our sheet exists
-            sheet_exists = False
-            for sheet in sheets:
-                if sheet['properties']['title'] == sheet_name:
-                    sheet_exists = True
-                    break
-            
-            # If the sheet doesn't exist, create it
-            if not sheet_exists:
+            spreadsheet = self.sheet.get(
+                spreadsheetId=self.spreadsheet_id,
+                fields='sheets.properties(sheetId,title)'
+            ).execute()
+            properties = [sheet['properties'] for sheet in spreadsheet.get('sheets', [])]
+            titles = {sheet['title'] for sheet in properties}
+            next_id = max([sheet.get('sheetId', 0) for sheet in properties] + [0]) + 1
+
+            requests = []
+            for sheet_name, headers in layout.items():
+                if sheet_name in titles:
+                    continue
                 logger.info(f"Sheet '{sheet_name}' not found. Creating it.")
-                body = {
-                    'requests': [{
-                        'addSheet': {
-                            'properties': {
-                                'title': sheet_name
-                            }
-                        }
-                    }]
-                }
-                self.sheet.batchUpdate(spreadsheetId=self.spreadsheet_id, body=body).execute()
-                
-                # Add headers to the new sheet
-                self.sheet.values().update(
-                    spreadsheetId=self.spreadsheet_id,
-                    range=f"{sheet_name}!A1:{chr(65 + len(headers) - 1)}1",
-                    valueInputOption='RAW',
-                    body={'values': [headers]}
-                ).execute()
-                
-                logger.info(f"Created sheet '{sheet_name}' with headers: {headers}")
+                requests.append({'addSheet': {'properties': {'sheetId': next_id, 'title': sheet_name}}})
+                requests.append({'updateCells': {
+                    'start': {'sheetId': next_id, 'rowIndex': 0, 'columnIndex': 0},
+                    'rows': [{'values': [{'userEnteredValue': {'stringValue': header}} for header in headers]}],
+                    'fields': 'userEnteredValue',
+                }})
+                next_id += 1
+
+            if requests:
+                self.sheet.batchUpdate(spreadsheetId=self.spreadsheet_id, body={'requests': requests}).execute()
+                logger.info(f"Created sheets: {', '.join(name for name in layout if name not in titles)}")
+            cache.set(cache_key, signature, settings.SHEETS_METADATA_TTL_SECONDS)
         except Exception as e:
-            logger.error(f"Error ensuring sheet '{sheet_name}' exists: {e}")
+            logger.error(f"Error ensuring sheets {', '.join(layout)} exist: {e}")
     
     def get_all_transactions(self) -> List[Dict[str, Any]]:
         """Retrieve all transactions from the Google Sheet"""
-        result = self.sheet.values().get(
-            spreadsheetId=self.spreadsheet_id,
-            range=self.transactions_range
-        ).execute()
-        
-        values = result.get('values', [])
-        
-        # If no data, return empty list
-        if not values:
-            return []
-        
-        # Column headers for transactions
-        headers = [
-            'date', 'description', 'category', 'expected_amount', 'paid_amount', 
-            'transaction_type', 'status', 'customer', 'vendor', 'payment_method', 
-            'reference_number'
-        ]
-        
-        # Convert to list of dictionaries
-        transactions = []
-        for row in values:
-            # Pad row with empty strings if it's shorter than headers
-            padded_row = row + [''] * (len(headers) - len(row))
-            transaction = dict(zip(headers, padded_row))
-            transactions.append(transaction)
-        
-        return transactions
+        return _records(self._mirrored_values(self.transactions_range), TRANSACTION_FIELDS)
     
     def get_all_customers(self) -> List[Dict[str, Any]]:
         """Retrieve all customers from the Google Sheet"""
-        result = self.sheet.values().get(
-            spreadsheetId=self.spreadsheet_id,
-            range=self.customers_range
-        ).execute()
-        
-        values = result.get('values', [])
-        
-        # If no data, return empty list
-        if not values:
-            return []
-        
-        # Column headers for customers with financial fields
-        headers = [
-            'name', 'email', 'phone', 'gst_number', 'address', 
-            'total_receivable', 'total_received', 'outstanding_balance', 'created_at'
-        ]
-        
-        # Convert to list of dictionaries
-        customers = []
-        for row in values:
-            # Pad row with empty strings if it's shorter than headers
-            padded_row = row + [''] * (len(headers) - len(row))
-            customer = dict(zip(headers, padded_row))
-            customers.append(customer)
-        
-        return customers
+        return _records(self._mirrored_values(self.customers_range), CUSTOMER_FIELDS)
     
     def get_all_vendors(self) -> List[Dict[str, Any]]:
         """Retrieve all vendors from the Google Sheet"""
-        result = self.sheet.values().get(
+        return _records(self._mirrored_values(self.vendors_range), VENDOR_FIELDS)
+
+    def get_all_records(self) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Transactions, customers and vendors together, as get_all_* return them
+
+        The three mirrors are refreshed with one batchGet between them instead
+        of a request per sheet, so a query needing all three makes at most one
+        round trip, and none while the mirrors are fresh.
+        """
+        sources = {
+            'transactions': (self.transactions_range, TRANSACTION_FIELDS),
+            'customers': (self.customers_range, CUSTOMER_FIELDS),
+            'vendors': (self.vendors_range, VENDOR_FIELDS),
+        }
+        values = self._mirrored_values_many([range_name for range_name, _ in sources.values()])
+        return {
+            kind: _records(rows, headers)
+            for (kind, (_, headers)), rows in zip(sources.items(), values)
+        }
+
+    def _mirrored_values(self, range_name: str) -> List[List[Any]]:
+        """
+        Rows of range_name, served from the local mirror
+
+        The mirror is refreshed once it is SHEETS_MIRROR_MAX_AGE_SECONDS old, by
+        fetching the new rows at the end, the blocks any process has overwritten
+        since, and one block to check. Ranges the mirror cannot follow are read
+        directly.
+        """
+        return self._mirrored_values_many([range_name])[0]
+
+    def _mirrored_values_many(self, range_names: List[str]) -> List[List[List[Any]]]:
+        """Rows of each range, with every mirror that needs it refreshed in the same batchGet"""
+        mirrors: Dict[str, Optional[SheetMirror]] = {}
+        with self._mirrors_lock:
+            for range_name in range_names:
+                mirror = self._mirrors.get(range_name)
+                if mirror is None:
+                    try:
+                        mirror = SheetMirror(range_name, settings.SHEETS_MIRROR_MAX_AGE_SECONDS)
+                    except ValueError as e:
+                        logger.warning(str(e))
+                    else:
+                        # The first read loads the whole range, so earlier writes are already in it
+                        self._write_cursors[range_name] = (self._last_write_id(mirror.sheet_name), timezone.now())
+                        self._mirrors[range_name] = mirror
+                mirrors[range_name] = mirror
+            mirrored = [mirror for mirror in mirrors.values() if mirror is not None]
+            self._catch_up_writes([mirror for mirror in mirrored if mirror.stale()])
+
+        rows = dict(zip(
+            (mirror.range_name for mirror in mirrored),
+            read_mirrors(mirrored, self._get_values, self.get_ranges)
+        ))
+        return [rows[range_name] if range_name in rows else self._get_values(range_name) for range_name in range_names]
+
+    def _expire_mirrors(self, sheet_name: str, row_numbers=()):
+        """Refresh mirrors of this sheet on their next read, re-fetching the given rows"""
+        row_numbers = list(row_numbers)
+        for mirror in list(self._mirrors.values()):
+            if mirror.sheet_name == sheet_name:
+                mirror.expire(row_numbers)
+
+    def _log_row_writes(self, sheet_name: str, row_numbers: Iterable[int]):
+        """
+        Record rows overwritten in place, so mirrors in every process re-fetch them
+
+        Writes run in the sync worker, so _expire_mirrors() alone would never
+        reach the web processes' mirrors. Appended rows need no entry: every
+        refresh fetches the rows past the end of the copy.
+        """
+        row_numbers = sorted(set(row_numbers))
+        if not row_numbers:
+            return
+        SheetsWrite.objects.create(spreadsheet_id=self.spreadsheet_id, sheet_name=sheet_name, row_numbers=row_numbers)
+        SheetsWrite.objects.filter(created_at__lt=timezone.now() - WRITE_LOG_RETENTION).delete()
+
+    def _last_write_id(self, sheet_name: str) -> int:
+        return SheetsWrite.objects.filter(
+            spreadsheet_id=self.spreadsheet_id, sheet_name=sheet_name
+        ).aggregate(last=Max('id'))['last'] or 0
+
+    def _catch_up_writes(self, mirrors: List[SheetMirror]):
+        """
+        Mark the rows logged as overwritten since each mirror last looked, for its refresh to re-fetch
+
+        One query covers all the mirrors; call with _mirrors_lock held, for stale mirrors only.
+        """
+        if not mirrors:
+            return
+        now = timezone.now()
+        cursors = {mirror.range_name: self._write_cursors[mirror.range_name] for mirror in mirrors}
+        writes = list(
+            SheetsWrite.objects.filter(
+                spreadsheet_id=self.spreadsheet_id, sheet_name__in={mirror.sheet_name for mirror in mirrors}
+            ).filter(
+                Q(id__gt=min(cursor for cursor, _ in cursors.values()))
+                | Q(created_at__gte=min(looked_at for _, looked_at in cursors.values()) - WRITE_LOG_GRACE)
+            ).values_list('id', 'sheet_name', 'row_numbers', 'created_at')
+        )
+        for mirror in mirrors:
+            cursor, looked_at = cursors[mirror.range_name]
+            if now - looked_at > WRITE_LOG_RETENTION:
+                # Entries it has not seen may have been pruned
+                mirror.invalidate()
+                self._write_cursors[mirror.range_name] = (self._last_write_id(mirror.sheet_name), now)
+                continue
+            new = [
+                (write_id, row_numbers) for write_id, sheet_name, row_numbers, created_at in writes
+                if sheet_name == mirror.sheet_name and (write_id > cursor or created_at >= looked_at - WRITE_LOG_GRACE)
+            ]
+            if new:
+                mirror.expire(row for _, row_numbers in new for row in row_numbers)
+            self._write_cursors[mirror.range_name] = (max([cursor] + [write_id for write_id, _ in new]), now)
+
+    def get_ranges(self, ranges: List[str]) -> List[List[List[Any]]]:
+        """
+        Values of several ranges in one values().batchGet, in the order asked for
+
+        Cells come back unformatted, so amounts arrive as numbers rather than
+        display strings like '₹1,250.00'; dates keep their displayed form. The
+        field mask trims the response to just the values.
+        """
+        if not ranges:
+            return []
+        result = self.sheet.values().batchGet(
             spreadsheetId=self.spreadsheet_id,
-            range=self.vendors_range
+            ranges=ranges,
+            valueRenderOption='UNFORMATTED_VALUE',
+            dateTimeRenderOption='FORMATTED_STRING',
+            fields='valueRanges(values)'
         ).execute()
-        
-        values = result.get('values', [])
-        
-        # If no data, return empty list
-        if not values:
-            return []
-        
-        # Column headers for vendors with financial fields
-        headers = [
-            'name', 'email', 'phone', 'gst_number', 'address', 
-            'total_payable', 'total_paid', 'outstanding_balance', 'created_at'
-        ]
-        
-        # Convert to list of dictionaries
-        vendors = []
-        for row in values:
-            # Pad row with empty strings if it's shorter than headers
-            padded_row = row + [''] * (len(headers) - len(row))
-            vendor = dict(zip(headers, padded_row))
-            vendors.append(vendor)
-        
-        return vendors
-    
+        value_ranges = result.get('valueRanges', [])
+        return [value_range.get('values', []) for value_range in value_ranges] + [[]] * (len(ranges) - len(value_ranges))
+
+    def _get_values(self, range_name: str) -> List[List[Any]]:
+        return self.get_ranges([range_name])[0]
+
+    def append_rows(self, sheet_name: str, rows: List[List[Any]]) -> Dict[str, Any]:
+        """Append rows to the end of a sheet in a single API call"""
+        if not rows:
+            return {}
+        return self.sheet.values().append(
+            spreadsheetId=self.spreadsheet_id,
+            range=f'{sheet_name}!A1',
+            valueInputOption='USER_ENTERED',
+            insertDataOption='INSERT_ROWS',
+            body={'values': rows}
+        ).execute()
+
+    def update_rows(self, updates: List[Tuple[str, List[Any]]]):
+        """Overwrite several (range, row) pairs in a single API call"""
+        if not updates:
+            return
+        self.sheet.values().batchUpdate(
+            spreadsheetId=self.spreadsheet_id,
+            body={
+                'valueInputOption': 'USER_ENTERED',
+                'data': [{'range': cell_range, 'values': [row]} for cell_range, row in updates]
+            }
+        ).execute()
+
     def add_transaction(self, transaction_data: Dict[str, Any]) -> bool:
         """Add a new transaction to the Google Sheet"""
+        return self.add_transactions([transaction_data])
+
+    def add_transactions(self, transactions: List[Dict[str, Any]]) -> bool:
+        """Add several transactions to the Google Sheet with one append"""
         try:
-            # Format the data as a row with proper type conversion
-            row = [
-                # Convert date to string if it's a date/datetime object
-                transaction_data.get('date').strftime('%Y-%m-%d') 
-                if hasattr(transaction_data.get('date'), 'strftime')
-                else str(transaction_data.get('date', '')),
-                str(transaction_data.get('description', '')),
-                str(transaction_data.get('category', '')),
-                # Convert amount to float, then to string
-                float(transaction_data.get('amount', 0)) if transaction_data.get('amount') is not None else '',
-                str(transaction_data.get('transaction_type', '')),
-                str(transaction_data.get('customer', '')),
-                str(transaction_data.get('vendor', '')),
-                str(transaction_data.get('payment_method', '')),
-                str(transaction_data.get('reference_number', '')),
-                str(transaction_data.get('notes', ''))
-            ]
-            
-            # Append the row to the sheet with USER_ENTERED to handle different data types properly
-            result = self.sheet.values().append(
-                spreadsheetId=self.spreadsheet_id,
-                range='Transactions!A1',
-                valueInputOption='USER_ENTERED',  # Changed from RAW to USER_ENTERED
-                insertDataOption='INSERT_ROWS',
-                body={'values': [row]}
-            ).execute()
-            
-            logger.info(f"Added new transaction: {transaction_data}")
+            self.append_rows('Transactions', [self._transaction_row(data) for data in transactions])
+            self._expire_mirrors('Transactions')
+            logger.info(f"Added {len(transactions)} transaction(s)")
             return True
         except Exception as e:
-            logger.error(f"Error adding transaction: {e}", exc_info=True)
+            logger.error(f"Error adding transactions: {e}", exc_info=True)
             return False
-    
+
+    def _transaction_row(self, transaction_data: Dict[str, Any]) -> List[Any]:
+        return [
+            # Convert date to string if it's a date/datetime object
+            transaction_data.get('date').strftime('%Y-%m-%d')
+            if hasattr(transaction_data.get('date'), 'strftime')
+            else str(transaction_data.get('date', '')),
+            str(transaction_data.get('description', '')),
+            str(transaction_data.get('category', '')),
+            float(transaction_data.get('amount', 0)) if transaction_data.get('amount') is not None else '',
+            str(transaction_data.get('transaction_type', '')),
+            str(transaction_data.get('customer', '')),
+            str(transaction_data.get('vendor', '')),
+            str(transaction_data.get('payment_method', '')),
+            str(transaction_data.get('reference_number', '')),
+            str(transaction_data.get('notes', ''))
+        ]
+
     def add_customer(self, customer_data: Dict[str, Any], update_existing: bool = True) -> bool:
         """
         Add or update a customer in the Google Sheet
-        
+
         Args:
             customer_data: Dictionary containing customer data
             update_existing: If True, updates existing customer if found by name
         """
-        try:
-            # Get financial data from the Customer model if available
-            name = customer_data.get('name', '').strip()
-            if not name:
-                logger.error("Cannot add customer: Name is required")
-                return False
-                
-            total_receivable = float(customer_data.get('total_receivable', 0.0) or 0.0)
-            total_received = float(customer_data.get('total_received', 0.0) or 0.0)
-            outstanding_balance = float(customer_data.get('outstanding_balance', total_receivable - total_received) or 0.0)
-            
-            # Check if customer already exists
-            if update_existing:
-                existing_customers = self.search_customers({'name': name})
-                if existing_customers:
-                    # Update existing customer
-                    customer_range = f"Customers!A{existing_customers[0]['_row']}:I{existing_customers[0]['_row']}"
-                    
-                    # Format the updated data as a row
-                    row = [
-                        name,
-                        customer_data.get('email', ''),
-                        customer_data.get('phone', ''),
-                        customer_data.get('gst_number', ''),
-                        customer_data.get('address', ''),
-                        total_receivable,
-                        total_received,
-                        outstanding_balance,
-                        existing_customers[0].get('created_at') or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                    ]
-                    
-                    # Update the row in the sheet
-                    self.sheet.values().update(
-                        spreadsheetId=self.spreadsheet_id,
-                        range=customer_range,
-                        valueInputOption='USER_ENTERED',
-                        body={'values': [row]}
-                    ).execute()
-                    
-                    logger.info(f"Updated existing customer: {name}")
-                    return True
-            
-            # If we get here, either we're not updating or customer doesn't exist
-            # Format the data as a new row
-            row = [
-                name,
-                customer_data.get('email', ''),
-                customer_data.get('phone', ''),
-                customer_data.get('gst_number', ''),
-                customer_data.get('address', ''),
-                total_receivable,
-                total_received,
-                outstanding_balance,
-                customer_data.get('created_at') or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            ]
-            
-            # Append the row to the sheet
-            self.sheet.values().append(
-                spreadsheetId=self.spreadsheet_id,
-                range='Customers!A1',
-                valueInputOption='USER_ENTERED',
-                insertDataOption='INSERT_ROWS',
-                body={'values': [row]}
-            ).execute()
-            
-            logger.info(f"Added new customer: {name}")
-            return True
-            
-        except Exception as e:
-            logger.error(f"Error adding/updating customer {customer_data.get('name', '')}: {e}", exc_info=True)
-            return False
-    
+        return self.add_customers([customer_data], update_existing)
+
+    def add_customers(self, customers: List[Dict[str, Any]], update_existing: bool = True) -> bool:
+        """Add or update several customers with at most one read, one batchUpdate and one append"""
+        return self._upsert_parties('Customers', customers, ('total_receivable', 'total_received'), update_existing)
+
     def add_vendor(self, vendor_data: Dict[str, Any], update_existing: bool = True) -> bool:
         """
         Add or update a vendor in the Google Sheet
-        
+
         Args:
             vendor_data: Dictionary containing vendor data
             update_existing: If True, updates existing vendor if found by name
         """
-        try:
-            # Get financial data from the Vendor model if available
-            name = vendor_data.get('name', '').strip()
+        return self.add_vendors([vendor_data], update_existing)
+
+    def add_vendors(self, vendors: List[Dict[str, Any]], update_existing: bool = True) -> bool:
+        """Add or update several vendors with at most one read, one batchUpdate and one append"""
+        return self._upsert_parties('Vendors', vendors, ('total_payable', 'total_paid'), update_existing)
+
+    def _upsert_parties(self, sheet_name: str, parties: List[Dict[str, Any]], amount_fields: Tuple[str, str],
+                        update_existing: bool) -> bool:
+        """
+        Write customer or vendor rows, updating the row of any name already on the sheet
+
+        Rows are found through the name index instead of downloading the sheet.
+        Records sharing a name are coalesced, the last one winning, so a batch
+        never appends the same party twice. Updates rewrite columns A:H and leave
+        Created At as it is.
+        """
+        label = sheet_name[:-1].lower()
+        ok = True
+        latest: Dict[str, Dict[str, Any]] = {}
+        for data in parties:
+            name = (data.get('name') or '').strip()
             if not name:
-                logger.error("Cannot add vendor: Name is required")
-                return False
-                
-            total_payable = float(vendor_data.get('total_payable', 0.0) or 0.0)
-            total_paid = float(vendor_data.get('total_paid', 0.0) or 0.0)
-            outstanding_balance = float(vendor_data.get('outstanding_balance', total_payable - total_paid) or 0.0)
-            
-            # Check if vendor already exists
-            if update_existing:
-                existing_vendors = self.search_vendors({'name': name})
-                if existing_vendors:
-                    # Update existing vendor
-                    vendor_range = f"Vendors!A{existing_vendors[0]['_row']}:I{existing_vendors[0]['_row']}"
-                    
-                    # Format the updated data as a row
-                    row = [
-                        name,
-                        vendor_data.get('email', ''),
-                        vendor_data.get('phone', ''),
-                        vendor_data.get('gst_number', ''),
-                        vendor_data.get('address', ''),
-                        total_payable,
-                        total_paid,
-                        outstanding_balance,
-                        existing_vendors[0].get('created_at') or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                    ]
-                    
-                    # Update the row in the sheet
-                    self.sheet.values().update(
-                        spreadsheetId=self.spreadsheet_id,
-                        range=vendor_range,
-                        valueInputOption='USER_ENTERED',
-                        body={'values': [row]}
-                    ).execute()
-                    
-                    logger.info(f"Updated existing vendor: {name}")
-                    return True
-            
-            # If we get here, either we're not updating or vendor doesn't exist
-            # Format the data as a new row
-            row = [
-                name,
-                vendor_data.get('email', ''),
-                vendor_data.get('phone', ''),
-                vendor_data.get('gst_number', ''),
-                vendor_data.get('address', ''),
-                total_payable,
-                total_paid,
-                outstanding_balance,
-                vendor_data.get('created_at') or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            ]
-            
-            # Append the row to the sheet
-            self.sheet.values().append(
-                spreadsheetId=self.spreadsheet_id,
-                range='Vendors!A1',
-                valueInputOption='USER_ENTERED',
-                insertDataOption='INSERT_ROWS',
-                body={'values': [row]}
-            ).execute()
-            
-            logger.info(f"Added new vendor: {name}")
-            return True
-            
+                logger.error(f"Cannot add {label}: Name is required")
+                ok = False
+                continue
+            latest[name.lower()] = dict(data, name=name)
+        if not latest:
+            return ok
+
+        try:
+            rows = self._existing_rows(sheet_name, list(latest)) if update_existing else {}
+            updates, appends, appended = [], [], []
+            for key, data in latest.items():
+                if key in rows:
+                    # Columns A:H only, so the row keeps its Created At
+                    row = self._party_row(data, amount_fields, '')[:-1]
+                    updates.append((f"{sheet_name}!A{rows[key]}:H{rows[key]}", row))
+                else:
+                    created_at = data.get('created_at') or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                    appends.append(self._party_row(data, amount_fields, created_at))
+                    appended.append(key)
+
+            self.update_rows(updates)
+            result = self.append_rows(sheet_name, appends)
+            self._expire_mirrors(sheet_name, rows.values())
+            self._log_row_writes(sheet_name, rows.values())
+            self._index_appended(sheet_name, appended, result)
+            logger.info(f"Synced {label}s: {len(updates)} updated, {len(appends)} added")
+            return ok
         except Exception as e:
-            logger.error(f"Error adding/updating vendor {vendor_data.get('name', '')}: {e}", exc_info=True)
+            names = ', '.join(data['name'] for data in latest.values())
+            logger.error(f"Error adding/updating {label}s {names}: {e}", exc_info=True)
             return False
-    
+
+    def _existing_rows(self, sheet_name: str, keys: List[str]) -> Dict[str, int]:
+        """
+        Row numbers of the given lower-cased names that are on the sheet
+
+        Rows taken from the index are checked by reading just their name cells.
+        A name the index does not know is taken to be new once the cell below
+        the last indexed row is found empty, read in the same batchGet. If a
+        row has moved, or that cell is filled (rows were added by hand or by
+        another worker), the index is rebuilt from column A before answering.
+        """
+        with self._row_index_lock:
+            index = self._row_index.get(sheet_name)
+            last_row = self._last_rows.get(sheet_name)
+        if index is None:
+            index = self._load_row_index(sheet_name)
+            return {key: index[key] for key in keys if key in index}
+
+        rows = {key: index[key] for key in keys if key in index}
+        probes = [f"{sheet_name}!A{row}" for row in rows.values()]
+        has_misses = len(rows) < len(keys)
+        if has_misses:
+            probes.append(f"{sheet_name}!A{last_row + 1}")
+        names = [str((values or [['']])[0][0]).strip().lower() for values in self.get_ranges(probes)]
+        if names[:len(rows)] != list(rows) or (has_misses and names[-1]):
+            logger.info(f"Name index for '{sheet_name}' is out of date; reloading it")
+            index = self._load_row_index(sheet_name)
+            return {key: index[key] for key in keys if key in index}
+        return rows
+
+    def _load_row_index(self, sheet_name: str) -> Dict[str, int]:
+        """Read column A of the sheet and rebuild its name -> row index"""
+        index: Dict[str, int] = {}
+        values = self._get_values(f"{sheet_name}!A2:A")
+        for row_number, row in enumerate(values, start=2):
+            if row and str(row[0]).strip():
+                index.setdefault(str(row[0]).strip().lower(), row_number)
+        with self._row_index_lock:
+            self._row_index[sheet_name] = index
+            self._last_rows[sheet_name] = len(values) + 1
+        return index
+
+    def _index_appended(self, sheet_name: str, keys: List[str], result: Dict[str, Any]):
+        """Record where appended names landed, or drop the index if the response does not say"""
+        if not keys:
+            return
+        match = UPDATED_RANGE_ROW.search(result.get('updates', {}).get('updatedRange', ''))
+        with self._row_index_lock:
+            index: Optional[Dict[str, int]] = self._row_index.get(sheet_name)
+            if index is None:
+                return
+            if match is None:
+                del self._row_index[sheet_name]
+                return
+            first_row = int(match.group(1))
+            for offset, key in enumerate(keys):
+                index.setdefault(key, first_row + offset)
+            self._last_rows[sheet_name] = max(self._last_rows[sheet_name], first_row + len(keys) - 1)
+
+    def _party_row(self, data: Dict[str, Any], amount_fields: Tuple[str, str], created_at: str) -> List[Any]:
+        """A Customers or Vendors row; amount_fields names the billed and settled totals"""
+        total = float(data.get(amount_fields[0], 0.0) or 0.0)
+        settled = float(data.get(amount_fields[1], 0.0) or 0.0)
+        outstanding_balance = float(data.get('outstanding_balance', total - settled) or 0.0)
+        return [
+            data['name'],
+            data.get('email', ''),
+            data.get('phone', ''),
+            data.get('gst_number', ''),
+            data.get('address', ''),
+            total,
+            settled,
+            outstanding_balance,
+            created_at
+        ]
+
     def search_transactions(self, query_params: Dict[str, Any]) -> List[Dict[str, Any]]:
         """Search transactions based on query parameters"""
         transactions = self.get_all_transactions()
@@ -745,12 +885,7 @@ class GoogleSheetsService:
         """
         try:
             # Get all customers with their row numbers
-            result = self.sheet.values().get(
-                spreadsheetId=self.spreadsheet_id,
-                range='Customers!A2:I'  # Include all customer data columns
-            ).execute()
-            
-            values = result.get('values', [])
+            values = self._mirrored_values('Customers!A2:I')  # Include all customer data columns
             
             # If no data, return empty list
             if not values:
@@ -810,12 +945,7 @@ class GoogleSheetsService:
         """
         try:
             # Get all vendors with their row numbers
-            result = self.sheet.values().get(
-                spreadsheetId=self.spreadsheet_id,
-                range='Vendors!A2:I'  # Include all vendor data columns
-            ).execute()
-            
-            values = result.get('values', [])
+            values = self._mirrored_values('Vendors!A2:I')  # Include all vendor data columns
             
             # If no data, return empty list
             if not values:
@@ -864,4 +994,8 @@ class GoogleSheetsService:
             
         except Exception as e:
             logger.error(f"Error searching vendors: {e}", exc_info=True)
-            return []
\ No newline at end of file
+            return []
+
+def _records(values: List[List[Any]], headers: List[str]) -> List[Dict[str, Any]]:
+    """Sheet rows as dictionaries keyed by headers, short rows padded with empty strings"""
+    return [dict(zip(headers, row + [''] * (len(headers) - len(row)))) for row in values]
@@ -0,0 +1,366 @@
+import logging
+from collections import defaultdict
+from datetime import timedelta
+from typing import Any, Dict, List
+
+from django.conf import settings
+from django.db import transaction as db_transaction
+from django.utils import timezone
+
+from counto_app.models import Conversation, Customer, SyncOutbox, Transaction, Vendor
+from counto_app.services.registry import get_gemini_service, get_sheets_service, get_tally_service
+
+logger = logging.getLogger(__name__)
+
+# Retry schedule: 30s, 1m, 2m, 4m ... capped at one hour
+BACKOFF_BASE_SECONDS = 30
+BACKOFF_MAX_SECONDS = 3600
+DEFAULT_MAX_ATTEMPTS = 8
+# Rows stuck in PROCESSING longer than this are assumed to belong to a dead worker
+STALE_LOCK_SECONDS = 600
+
+
+class SyncError(Exception):
+    """Raised when an external service rejects a sync"""
+
+
+class RecordMissing(Exception):
+    """Raised when the record to sync was deleted before the outbox was drained"""
+
+
+# ---------------------------------------------------------------------------
+# Enqueueing - call these inside the same atomic block that writes the record
+# ---------------------------------------------------------------------------
+
+def enqueue_transaction_sync(transaction: Transaction, tally: bool = True, sheets: bool = True) -> List[SyncOutbox]:
+    """Queue Tally vouchers and a Sheets row for a newly recorded transaction"""
+    entries = []
+    if tally:
+        if transaction.transaction_type == 'INCOME' and transaction.customer_id:
+            entries.append(_entry(transaction.user_id, 'TALLY', 'customer_ledger', customer_id=transaction.customer_id))
+            entries.append(_entry(transaction.user_id, 'TALLY', 'sales', transaction_id=transaction.id))
+        elif transaction.transaction_type == 'EXPENSE' and transaction.vendor_id:
+            entries.append(_entry(transaction.user_id, 'TALLY', 'vendor_ledger', vendor_id=transaction.vendor_id))
+            entries.append(_entry(transaction.user_id, 'TALLY', 'purchase', transaction_id=transaction.id))
+    if sheets:
+        entries.append(_entry(transaction.user_id, 'SHEETS', 'transaction', transaction_id=transaction.id))
+        if transaction.customer_id:
+            entries.append(_entry(transaction.user_id, 'SHEETS', 'customer', customer_id=transaction.customer_id))
+        elif transaction.vendor_id:
+            entries.append(_entry(transaction.user_id, 'SHEETS', 'vendor', vendor_id=transaction.vendor_id))
+    return SyncOutbox.objects.bulk_create(entries)
+
+
+def enqueue_customer_sync(customer: Customer, tally: bool = True, sheets: bool = True) -> List[SyncOutbox]:
+    """Queue the customer's Sheets row and Tally ledger"""
+    entries = []
+    if sheets:
+        entries.append(_entry(customer.user_id, 'SHEETS', 'customer', customer_id=customer.id))
+    if tally:
+        entries.append(_entry(customer.user_id, 'TALLY', 'customer_ledger', customer_id=customer.id))
+    return SyncOutbox.objects.bulk_create(entries)
+
+
+def enqueue_vendor_sync(vendor: Vendor, tally: bool = True, sheets: bool = True) -> List[SyncOutbox]:
+    """Queue the vendor's Sheets row and Tally ledger"""
+    entries = []
+    if sheets:
+        entries.append(_entry(vendor.user_id, 'SHEETS', 'vendor', vendor_id=vendor.id))
+    if tally:
+        entries.append(_entry(vendor.user_id, 'TALLY', 'vendor_ledger', vendor_id=vendor.id))
+    return SyncOutbox.objects.bulk_create(entries)
+
+
+def enqueue_history_summary(conversation: Conversation) -> List[SyncOutbox]:
+    """Queue folding a conversation's older messages into its summary, unless it is already queued"""
+    queued = SyncOutbox.objects.filter(
+        target='GEMINI', operation='history_summary', status__in=['PENDING', 'PROCESSING'],
+        payload__conversation_id=conversation.id
+    )
+    if queued.exists():
+        return []
+    return SyncOutbox.objects.bulk_create([
+        _entry(conversation.user_id, 'GEMINI', 'history_summary', conversation_id=conversation.id)
+    ])
+
+
+def _entry(user_id: int, target: str, operation: str, **payload) -> SyncOutbox:
+    return SyncOutbox(user_id=user_id, target=target, operation=operation, payload=payload)
+
+
+# ---------------------------------------------------------------------------
+# Sheets payload builders
+# ---------------------------------------------------------------------------
+
+def transaction_sheets_data(transaction: Transaction) -> Dict[str, Any]:
+    return {
+        'date': transaction.date,
+        'description': transaction.description,
+        'category': transaction.category,
+        'transaction_type': transaction.transaction_type,
+        'amount': float(transaction.amount),
+        'payment_method': transaction.payment_method or '',
+        'reference_number': transaction.reference_number or '',
+        'customer': transaction.customer.name if transaction.customer else '',
+        'vendor': transaction.vendor.name if transaction.vendor else '',
+        'notes': transaction.notes or ''
+    }
+
+
+def customer_sheets_data(customer: Customer) -> Dict[str, Any]:
+    return {
+        'name': customer.name,
+        'email': customer.email or '',
+        'phone': customer.phone or '',
+        'gst_number': customer.gst_number or '',
+        'address': customer.address or '',
+        'total_receivable': float(customer.total_receivable or 0),
+        'total_received': float(customer.total_received or 0),
+        'outstanding_balance': float(customer.outstanding_balance or 0),
+        'created_at': customer.created_at.strftime('%Y-%m-%d %H:%M:%S') if customer.created_at else ''
+    }
+
+
+def vendor_sheets_data(vendor: Vendor) -> Dict[str, Any]:
+    return {
+        'name': vendor.name,
+        'email': vendor.email or '',
+        'phone': vendor.phone or '',
+        'gst_number': vendor.gst_number or '',
+        'address': vendor.address or '',
+        'total_payable': float(vendor.total_payable or 0),
+        'total_paid': float(vendor.total_paid or 0),
+        'outstanding_balance': float(vendor.outstanding_balance or 0),
+        'created_at': vendor.created_at.strftime('%Y-%m-%d %H:%M:%S') if vendor.created_at else ''
+    }
+
+
+# ---------------------------------------------------------------------------
+# Draining
+# ---------------------------------------------------------------------------
+
+def process_outbox(batch_size: int = 50, max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+                   flush_sheets: bool = False) -> Dict[str, int]:
+    """
+    Claim up to ``batch_size`` due entries and push them to their target.
+
+    Entries are claimed with SKIP LOCKED so several workers can drain the
+    outbox concurrently. Failed entries are rescheduled with exponential
+    backoff and marked FAILED after ``max_attempts``. Sheets entries are
+    written behind: they wait in the outbox until a flush is due, then each
+    operation's entries go to Sheets in one call. ``flush_sheets`` sends them
+    straight away, whether or not a flush is due.
+    """
+    entries = _claim_batch(batch_size, flush_sheets)
+    stats = {'claimed': len(entries), 'done': 0, 'retried': 0, 'failed': 0}
+
+    sheets_batches = defaultdict(list)
+    for entry in entries:
+        if entry.target == 'SHEETS' and entry.operation in _SHEETS_BATCHES:
+            sheets_batches[entry.operation].append(entry)
+            continue
+        try:
+            _dispatch(entry)
+        except RecordMissing as e:
+            logger.info(f"Skipping outbox entry {entry.id}: {e}")
+            _mark_done(entry)
+            stats['done'] += 1
+        except Exception as e:
+            if _mark_failed(entry, str(e), max_attempts):
+                stats['failed'] += 1
+            else:
+                stats['retried'] += 1
+        else:
+            _mark_done(entry)
+            stats['done'] += 1
+
+    for operation, batch in sheets_batches.items():
+        _flush_sheets_batch(operation, batch, max_attempts, stats)
+
+    return stats
+
+
+def _flush_sheets_batch(operation: str, entries: List[SyncOutbox], max_attempts: int, stats: Dict[str, int]):
+    """Send one operation's Sheets entries in a single call, splitting it on failure so only bad rows fail"""
+    model, key, build_data, method = _SHEETS_BATCHES[operation]
+    records = {}
+    for entry in entries:
+        pk = entry.payload[key]
+        if pk not in records:
+            try:
+                records[pk] = (_load(model, pk), [])
+            except RecordMissing as e:
+                logger.info(f"Skipping outbox entry {entry.id}: {e}")
+                _mark_done(entry)
+                stats['done'] += 1
+                continue
+        records[pk][1].append(entry)
+    if not records:
+        return
+
+    try:
+        write = getattr(_sheets(), method)
+    except Exception as e:
+        _settle_entries([entry for _, batch in records.values() for entry in batch], str(e), max_attempts, stats)
+        return
+    _write_sheets_rows(operation, write, build_data, list(records.values()), max_attempts, stats)
+
+
+def _write_sheets_rows(operation, write, build_data, records, max_attempts: int, stats: Dict[str, int]):
+    """
+    Write (record, entries) pairs in one call, halving the batch when it is rejected
+
+    A single bad row then costs about log2(batch size) extra calls and fails
+    alone instead of taking every other user's rows down with it.
+    """
+    try:
+        _check_sheets(write([build_data(record) for record, _ in records]), f'{len(records)} {operation} rows')
+    except Exception as e:
+        if len(records) > 1:
+            middle = len(records) // 2
+            _write_sheets_rows(operation, write, build_data, records[:middle], max_attempts, stats)
+            _write_sheets_rows(operation, write, build_data, records[middle:], max_attempts, stats)
+        else:
+            _settle_entries(records[0][1], str(e), max_attempts, stats)
+    else:
+        for _, entries in records:
+            for entry in entries:
+                _mark_done(entry)
+            stats['done'] += len(entries)
+
+
+def _settle_entries(entries: List[SyncOutbox], error: str, max_attempts: int, stats: Dict[str, int]):
+    for entry in entries:
+        if _mark_failed(entry, error, max_attempts):
+            stats['failed'] += 1
+        else:
+            stats['retried'] += 1
+
+
+def _claim_batch(batch_size: int, flush_sheets: bool = False) -> List[SyncOutbox]:
+    now = timezone.now()
+    stale_before = now - timedelta(seconds=STALE_LOCK_SECONDS)
+    with db_transaction.atomic():
+        pending = SyncOutbox.objects.select_for_update(skip_locked=True).filter(
+            status='PENDING', next_attempt_at__lte=now
+        )
+        if not flush_sheets and not _sheets_flush_due(now):
+            pending = pending.exclude(target='SHEETS')
+        stale = SyncOutbox.objects.select_for_update(skip_locked=True).filter(
+            status='PROCESSING', locked_at__lt=stale_before
+        )
+        entries = list(pending.order_by('id')[:batch_size])
+        if len(entries) < batch_size:
+            entries += list(stale.order_by('id')[:batch_size - len(entries)])
+        SyncOutbox.objects.filter(id__in=[e.id for e in entries]).update(status='PROCESSING', locked_at=now)
+    return entries
+
+
+def _sheets_flush_due(now) -> bool:
+    """Whether enough Sheets entries are due, or the oldest has waited long enough, to flush"""
+    due = SyncOutbox.objects.filter(target='SHEETS', status='PENDING', next_attempt_at__lte=now)
+    oldest = due.order_by('next_attempt_at').values_list('next_attempt_at', flat=True).first()
+    if oldest is None:
+        return False
+    if oldest <= now - timedelta(seconds=settings.SHEETS_FLUSH_INTERVAL_SECONDS):
+        return True
+    return due.count() >= settings.SHEETS_FLUSH_MAX_ROWS
+
+
+def _mark_done(entry: SyncOutbox):
+    SyncOutbox.objects.filter(id=entry.id).update(
+        status='DONE', attempts=entry.attempts + 1, locked_at=None, last_error=None, updated_at=timezone.now()
+    )
+
+
+def _mark_failed(entry: SyncOutbox, error: str, max_attempts: int) -> bool:
+    """Reschedule the entry with backoff; returns True once it has given up"""
+    attempts = entry.attempts + 1
+    gave_up = attempts >= max_attempts
+    delay = min(BACKOFF_BASE_SECONDS * (2 ** (attempts - 1)), BACKOFF_MAX_SECONDS)
+    SyncOutbox.objects.filter(id=entry.id).update(
+        status='FAILED' if gave_up else 'PENDING',
+        attempts=attempts,
+        next_attempt_at=timezone.now() + timedelta(seconds=delay),
+        locked_at=None,
+        last_error=error[:2000],
+        updated_at=timezone.now()
+    )
+    logger.warning(f"Outbox entry {entry.id} ({entry.target} {entry.operation}) failed attempt {attempts}: {error}")
+    return gave_up
+
+
+def _dispatch(entry: SyncOutbox):
+    handler = _HANDLERS.get((entry.target, entry.operation))
+    if handler is None:
+        raise SyncError(f"Unknown outbox operation {entry.target}/{entry.operation}")
+    handler(entry.payload)
+
+
+def _load(model, pk):
+    try:
+        return model.objects.get(pk=pk)
+    except model.DoesNotExist:
+        raise RecordMissing(f"{model.__name__} {pk} no longer exists")
+
+
+def _tally():
+    service = get_tally_service()
+    if service is None:
+        raise SyncError("Tally integration is not available")
+    return service
+
+
+def _sheets():
+    service = get_sheets_service()
+    if service is None:
+        raise SyncError("Google Sheets is not configured")
+    return service
+
+
+def _check_tally(result: Dict[str, Any]):
+    if not result.get('success'):
+        raise SyncError(result.get('error', 'Unknown error syncing to Tally'))
+
+
+def _check_sheets(ok: bool, what: str):
+    if not ok:
+        raise SyncError(f"Google Sheets rejected {what}")
+
+
+def _tally_customer_ledger(payload):
+    _check_tally(_tally().sync_customer_to_ledger(_load(Customer, payload['customer_id'])))
+
+
+def _tally_vendor_ledger(payload):
+    _check_tally(_tally().sync_vendor_to_ledger(_load(Vendor, payload['vendor_id'])))
+
+
+def _tally_sales(payload):
+    _check_tally(_tally().sync_sales_transaction(_load(Transaction, payload['transaction_id'])))
+
+
+def _tally_purchase(payload):
+    _check_tally(_tally().sync_purchase_transaction(_load(Transaction, payload['transaction_id'])))
+
+
+def _gemini_history_summary(payload):
+    # Only import here to avoid circular imports
+    from counto_app.services.conversation_history import fold_slid_out_messages
+    fold_slid_out_messages(_load(Conversation, payload['conversation_id']), get_gemini_service())
+
+
+_HANDLERS = {
+    ('TALLY', 'customer_ledger'): _tally_customer_ledger,
+    ('TALLY', 'vendor_ledger'): _tally_vendor_ledger,
+    ('TALLY', 'sales'): _tally_sales,
+    ('TALLY', 'purchase'): _tally_purchase,
+    ('GEMINI', 'history_summary'): _gemini_history_summary,
+}
+
+# Sheets operations flushed in batches: (model, payload key, row data builder, GoogleSheetsService method)
+_SHEETS_BATCHES = {
+    'transaction': (Transaction, 'transaction_id', transaction_sheets_data, 'add_transactions'),
+    'customer': (Customer, 'customer_id', customer_sheets_data, 'add_customers'),
+    'vendor': (Vendor, 'vendor_id', vendor_sheets_data, 'add_vendors'),
+}
@@ -0,0 +1,114 @@
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from counto_app.money import to_decimal
+from counto_app.models import Bill, Customer, Invoice, Transaction, Vendor
+from counto_app.services.data_version import bump_data_version
+from counto_app.services.ledger_rollup import apply_rollup_delta, rollup_key
+from counto_app.services.olap_store import record_ledger_changes
+
+# Models whose writes change what the user's dashboards show
+VERSIONED_MODELS = (Transaction, Customer, Vendor, Invoice, Bill)
+
+
+def _amount(value) -> Decimal:
+    return to_decimal(value) or Decimal('0.00')
+
+
+@receiver(pre_save, sender=Transaction)
+def remember_stored_transaction(sender, instance, raw=False, **kwargs):
+    """Keep the row as stored before an update so post_save can move it between rollup rows"""
+    instance._rollup_previous = None
+    if raw or instance.pk is None:
+        return
+    stored = Transaction.objects.filter(pk=instance.pk).values(
+        'user_id', 'date', 'transaction_type', 'category', 'amount'
+    ).first()
+    if stored:
+        instance._rollup_previous = (
+            rollup_key(stored['user_id'], stored['date'], stored['transaction_type'], stored['category']),
+            stored['amount'],
+        )
+
+
+@receiver(post_save, sender=Transaction)
+def update_rollup_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    key = rollup_key(instance.user_id, instance.date, instance.transaction_type, instance.category)
+    amount = _amount(instance.amount)
+    previous = getattr(instance, '_rollup_previous', None)
+    instance._rollup_previous = None
+
+    if previous is None:
+        apply_rollup_delta(key, amount, 1)
+        return
+
+    previous_key, previous_amount = previous
+    if previous_key == key:
+        if amount != previous_amount:
+            apply_rollup_delta(key, amount - previous_amount, 0)
+        return
+    apply_rollup_delta(previous_key, -previous_amount, -1)
+    apply_rollup_delta(key, amount, 1)
+
+
+@receiver(post_delete, sender=Transaction)
+def update_rollup_on_delete(sender, instance, **kwargs):
+    key = rollup_key(instance.user_id, instance.date, instance.transaction_type, instance.category)
+    apply_rollup_delta(key, -_amount(instance.amount), -1)
+
+
+@receiver(post_save, sender=Transaction)
+def log_change_on_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        record_ledger_changes(instance.user_id, [instance.pk])
+
+
+def _deleting_owner(instance, origin) -> bool:
+    """Whether this delete cascades from deleting the instance's own user"""
+    if isinstance(origin, User):
+        return origin.pk == instance.user_id
+    if isinstance(origin, QuerySet) and issubclass(origin.model, User):
+        return origin.filter(pk=instance.user_id).exists()
+    return False
+
+
+@receiver(post_delete, sender=Transaction)
+def log_change_on_delete(sender, instance, origin=None, **kwargs):
+    # Change rows for a user being deleted would reference the deleted user
+    if not _deleting_owner(instance, origin):
+        record_ledger_changes(instance.user_id, [instance.pk])
+
+
+def log_party_delete(sender, instance, origin=None, **kwargs):
+    if _deleting_owner(instance, origin):
+        return
+    # The party's transactions lose their customer or vendor through a queryset update, without signals
+    party_field = 'customer' if sender is Customer else 'vendor'
+    transaction_ids = Transaction.objects.filter(**{party_field: instance}).values_list('id', flat=True)
+    record_ledger_changes(instance.user_id, list(transaction_ids))
+
+
+pre_delete.connect(log_party_delete, sender=Customer, dispatch_uid='log_party_delete_Customer')
+pre_delete.connect(log_party_delete, sender=Vendor, dispatch_uid='log_party_delete_Vendor')
+
+
+def bump_version_on_save(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    bump_data_version(instance.user_id, rewrite=sender is Transaction and not created)
+
+
+def bump_version_on_delete(sender, instance, **kwargs):
+    # Deleting a customer or vendor nulls the party on their transactions without signals
+    bump_data_version(instance.user_id, rewrite=sender in (Transaction, Customer, Vendor))
+
+
+for model in VERSIONED_MODELS:
+    post_save.connect(bump_version_on_save, sender=model, dispatch_uid=f'bump_version_save_{model.__name__}')
+    post_delete.connect(bump_version_on_delete, sender=model, dispatch_uid=f'bump_version_delete_{model.__name__}')
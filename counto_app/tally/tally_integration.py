@@ -1,7 +1,6 @@
 import requests
 import json
 from datetime import datetime
-from decimal import Decimal
 from django.conf import settings
 from counto_app.models import Customer, Vendor, Transaction, Invoice, Bill
 
@@ -44,10 +43,7 @@ class TallyIntegrationService:
     
     def sync_customer_to_ledger(self, customer):
         """Sync customer to Tally as a ledger master"""
-        # Convert to Decimal for consistent numeric operations
-        total_receivable = Decimal(str(customer.total_receivable))
-        total_received = Decimal(str(customer.total_received))
-        opening_balance = total_receivable - total_received
+        opening_balance = customer.outstanding_balance
         opening_absolute = abs(opening_balance)
         
         data = {
@@ -77,10 +73,7 @@ class TallyIntegrationService:
     
     def sync_vendor_to_ledger(self, vendor):
         """Sync vendor to Tally as a ledger master"""
-        # Convert to Decimal for consistent numeric operations
-        total_payable = Decimal(str(vendor.total_payable))
-        total_paid = Decimal(str(vendor.total_paid))
-        opening_balance = total_payable - total_paid
+        opening_balance = vendor.outstanding_balance
         opening_absolute = abs(opening_balance)
         
         data = {
@@ -128,7 +121,7 @@ class TallyIntegrationService:
                 # "GSTIN": transaction.customer.gst_number if transaction.customer else "",
                 # "GST Registration Type": "Regular" if transaction.customer and transaction.customer.gst_number else "",
                 "Credit Ledger 1": "Sales",
-                "Credit Ledger 1 Amount": float(Decimal(str(transaction.amount))),  # Ensure proper Decimal conversion
+                "Credit Ledger 1 Amount": float(transaction.amount),
                 "Ledger 1 Description": transaction.description,
                 "Payment Method": transaction.payment_method or "Cash",
                 "Reference Number": transaction.reference_number or "",
@@ -158,7 +151,7 @@ class TallyIntegrationService:
                 # "GSTIN": transaction.vendor.gst_number if transaction.vendor else "",
                 # "GST Registration Type": "Regular" if transaction.vendor and transaction.vendor.gst_number else "",
                 "Debit Ledger 1": "Purchase",
-                "Debit Ledger 1 Amount": float(Decimal(str(transaction.amount))),  # Ensure proper Decimal conversion
+                "Debit Ledger 1 Amount": float(transaction.amount),
                 "Ledger 1 Description": transaction.description,
                 "Payment Method": transaction.payment_method or "Cash",
                 "Reference Number": transaction.reference_number or "",
@@ -172,8 +165,7 @@ class TallyIntegrationService:
         """Sync general transaction as journal entry"""
         voucher_type = "Receipt" if transaction.transaction_type == 'INCOME' else "Payment"
         
-        # Convert amount to Decimal to ensure consistent numeric operations
-        amount = Decimal(str(transaction.amount))
+        amount = transaction.amount
         
         # Create journal entries
         entries = []
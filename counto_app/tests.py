@@ -1,3 +1,1381 @@
-from django.test import TestCase
+import io
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from counto_app.money import Money, to_decimal
+from counto_app.models import (
+    Bill, Conversation, Customer, DailyLedgerRollup, Invoice, LedgerChange, Message, PendingTransaction,
+    PeriodLedgerRollup, SheetsWrite, SyncOutbox, Transaction, Vendor
+)
+from counto_app.services import gemini_services, ledger_engine, registry, sheets_services, sync_outbox
+from counto_app.services.conversation_history import load_history
+from counto_app.services.fast_path import parse_transaction_message
+from counto_app.services.forecasting import fit_projection, forecast_for_user
+from counto_app.services.intent_classifier import (
+    CUSTOMER_KEYWORDS, ENTRY_KEYWORDS, QUERY_KEYWORDS, TRANSACTION_KEYWORDS, VENDOR_KEYWORDS, classify_intent,
+    keyword_counts
+)
+from counto_app.services.ledger_engine import clear_ledgers, get_ledger
+from counto_app.services.ledger_periods import Segment, bucket_ranges, period_end, period_start, plan_range
+from counto_app.services.ledger_rollup import rebuild_ledger_rollup
+from counto_app.services.olap_store import OlapStore, olap_store
+from counto_app.services.query_context import _mentioned_names, build_query_context
+from counto_app.services.query_engine import answer_query
+from counto_app.services.sheets_mirror import SheetMirror
+
+
+class ClientRegistryTests(SimpleTestCase):
+    def setUp(self):
+        registry.reset_clients()
+        self.addCleanup(registry.reset_clients)
+        self.created = []
+
+    def factory(self):
+        self.created.append(mock.Mock(healthy=True, checked_at=time.monotonic()))
+        return self.created[-1]
+
+    def test_client_is_created_once_per_process(self):
+        with mock.patch.object(registry, '_create_tally_service', self.factory):
+            threads = [threading.Thread(target=registry.get_tally_service) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertIs(registry.get_tally_service(), self.created[0])
+        self.assertEqual(len(self.created), 1)
+
+    def test_failed_creation_is_retried_only_after_a_pause(self):
+        factory = mock.Mock(side_effect=FileNotFoundError('credentials.json'))
+        with mock.patch.object(registry, '_create_sheets_service', factory):
+            self.assertIsNone(registry.get_sheets_service())
+            self.assertIsNone(registry.get_sheets_service())
+            self.assertEqual(factory.call_count, 1)
+
+            later = time.monotonic() + registry.RETRY_AFTER_SECONDS + 1
+            with mock.patch.object(registry.time, 'monotonic', return_value=later):
+                self.assertIsNone(registry.get_sheets_service())
+            self.assertEqual(factory.call_count, 2)
+
+    def test_gemini_service_is_rebuilt_after_a_failed_probe(self):
+        with mock.patch.object(registry, '_create_gemini_service', self.factory):
+            first = registry.get_gemini_service()
+            first.healthy = False
+            self.assertIs(registry.get_gemini_service(), first)
+
+            first.checked_at -= registry.RETRY_AFTER_SECONDS
+            second = registry.get_gemini_service()
+        self.assertIsNot(second, first)
+        self.assertIs(second, self.created[1])
+
+
+class LedgerChangeLogTests(TestCase):
+    def setUp(self):
+        self.data_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.data_dir.cleanup)
+        override = override_settings(OLAP_DATA_DIR=self.data_dir.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.user = User.objects.create_user('olap', password='x')
+
+    def _transaction(self, **fields):
+        return Transaction.objects.create(**dict({
+            'user': self.user, 'date': date(2025, 4, 1), 'description': 'Sale',
+            'category': 'Sales', 'transaction_type': 'INCOME', 'amount': Decimal('100.00'),
+        }, **fields))
+
+    def test_transaction_delete_is_logged(self):
+        transaction = self._transaction()
+        transaction_id = transaction.pk
+        transaction.delete()
+        self.assertEqual(
+            list(LedgerChange.objects.filter(user=self.user).values_list('transaction_id', flat=True)),
+            [transaction_id, transaction_id]
+        )
+
+    def test_deleting_user_logs_nothing(self):
+        customer = Customer.objects.create(user=self.user, name='Raju')
+        self._transaction(customer=customer)
+        self._transaction(transaction_type='EXPENSE')
+        user_id = self.user.pk
+
+        self.user.delete()
+
+        self.assertFalse(User.objects.filter(pk=user_id).exists())
+        self.assertFalse(LedgerChange.objects.filter(user_id=user_id).exists())
+
+    def test_deleting_users_queryset_logs_nothing(self):
+        other = User.objects.create_user('other', password='x')
+        self._transaction()
+        kept = Transaction.objects.create(
+            user=other, date=date(2025, 4, 1), description='Rent', transaction_type='EXPENSE', amount=50
+        )
+        LedgerChange.objects.all().delete()
+
+        User.objects.filter(pk=self.user.pk).delete()
+        kept.delete()
+
+        self.assertFalse(LedgerChange.objects.filter(user_id=self.user.pk).exists())
+        self.assertEqual(LedgerChange.objects.filter(user=other).count(), 1)
+
+    # Without the grace window, a refresh right after a change would re-read it anyway
+    @mock.patch('counto_app.services.olap_store.CHANGE_GRACE', timedelta(0))
+    def test_sidecar_is_built_and_then_recopies_only_changed_rows(self):
+        customer = Customer.objects.create(user=self.user, name='Raju')
+        sale = self._transaction(customer=customer)
+        rent = self._transaction(transaction_type='EXPENSE', category='Rent', amount=Decimal('40.25'))
+
+        store = olap_store(self.user)
+        self.assertTrue(os.path.exists(store.path))
+        self.assertEqual(store.count(), 2)
+        self.assertEqual(store.refresh(), 0)
+
+        sale.amount = Decimal('250.00')
+        sale.save()
+        rent.delete()
+        self.assertEqual(store.refresh(), 2)
+        summary = store.summarize(customer_ids=[customer.pk])
+        self.assertEqual((summary['income'], summary['expenses'], summary['count']), (Decimal('250.00'), None, 1))
+        self.assertEqual(store.count(), 1)
+
+    def test_ledger_engine_reads_the_sidecar(self):
+        clear_ledgers()
+        self.addCleanup(clear_ledgers)
+        self._transaction()
+        with mock.patch.object(OlapStore, 'ledger_rows', autospec=True, side_effect=OlapStore.ledger_rows) as rows:
+            self.assertEqual(get_ledger(self.user).totals()['income'], 10000)
+        rows.assert_called_once()
+
+    def test_damaged_sidecar_is_rebuilt(self):
+        self._transaction()
+        store = olap_store(self.user)
+        with open(store.path, 'wb') as damaged:
+            damaged.write(b'not a database')
+        self.assertEqual(olap_store(self.user).count(), 1)
+
+    def test_unusable_data_dir_falls_back_to_the_main_database(self):
+        clear_ledgers()
+        self.addCleanup(clear_ledgers)
+        self._transaction()
+        with tempfile.NamedTemporaryFile() as not_a_dir, override_settings(OLAP_DATA_DIR=not_a_dir.name):
+            self.assertIsNone(olap_store(self.user))
+            self.assertEqual(get_ledger(self.user).totals()['income'], 10000)
+
+    def test_refresh_command(self):
+        self._transaction()
+        output = io.StringIO()
+        call_command('refresh_olap_store', '--username', 'olap', '--prune', stdout=output)
+        self.assertIn('olap: 1 transactions updated', output.getvalue())
+        self.assertIn('Pruned 0 change log rows.', output.getvalue())
+        self.assertEqual(OlapStore(self.user.pk).count(), 1)
+
+
+class FastPathParserTests(SimpleTestCase):
+    today = date(2025, 5, 10)
+
+    def parse(self, message):
+        return parse_transaction_message(message, today=self.today)
+
+    def test_simple_expense(self):
+        data = self.parse("paid 500 to Raju for cogs via UPI")
+        self.assertEqual(data['vendor'], 'Raju')
+        self.assertEqual(data['category'], 'COGS')
+        self.assertEqual(data['payment_method'], 'UPI')
+        self.assertEqual(data['amount'], 500)
+
+    def test_honorific_keeps_full_name(self):
+        self.assertEqual(self.parse("received 1000 from Mr. Sharma")['customer'], 'Mr. Sharma')
+        self.assertEqual(self.parse("received 1000 from Dr. Mehta yesterday")['customer'], 'Dr. Mehta')
+
+    def test_initials_keep_full_name(self):
+        data = self.parse("paid 200 to A. K. Traders for cogs")
+        self.assertEqual(data['vendor'], 'A. K. Traders')
+        self.assertEqual(data['category'], 'COGS')
+
+    def test_lowercase_names_are_title_cased(self):
+        self.assertEqual(self.parse("received 500 from ravi kumar")['customer'], 'Ravi Kumar')
+        self.assertEqual(self.parse("received 500 from mr. sharma")['customer'], 'Mr. Sharma')
+        self.assertEqual(self.parse("paid 200 to a. k. traders")['vendor'], 'A. K. Traders')
+
+    def test_final_full_stop_ends_the_name(self):
+        self.assertEqual(self.parse("paid 500 to Raju.")['vendor'], 'Raju')
+        self.assertEqual(self.parse("received 1000 from Mr. Sharma.")['customer'], 'Mr. Sharma')
+
+    def test_name_running_into_next_sentence_is_left_to_gemini(self):
+        self.assertIsNone(self.parse("paid 500 to Raju. Thanks for the lunch"))
+        self.assertIsNone(self.parse("received 1000 from Sharma. It was for rent"))
+
+    def test_periods_longer_than_a_day_are_left_to_gemini(self):
+        for message in ("paid 500 to Raju for cogs last month", "paid 500 to Raju for cogs last week",
+                        "received 2000 from Prakash this year", "paid 300 to Raju 2 weeks ago"):
+            with self.subTest(message=message):
+                self.assertIsNone(self.parse(message))
+        self.assertEqual(self.parse("paid 500 to Raju last monday")['date'], '2025-05-05')
+
+    def test_negations_are_left_to_gemini(self):
+        for message in ("didn't pay 500 to Raju", "did not pay 500 to Raju", "never received 500 from Prakash",
+                        "paid no 500 to Raju for cogs"):
+            with self.subTest(message=message):
+                self.assertIsNone(self.parse(message))
+
+    def test_unrecognised_words_are_left_to_gemini(self):
+        for message in ("paid 50000 to Rahul as loan", "paid Raju 500 for cogs", "paid 500 to Raju for cogs as advance",
+                        "received 2000 from Prakash against invoice"):
+            with self.subTest(message=message):
+                self.assertIsNone(self.parse(message))
+        self.assertEqual(self.parse("I paid Rs 500 cash to Raju for cogs")['vendor'], 'Raju')
+
+
+A1_RANGE = re.compile(r"^(?P<sheet>[^!]+)!(?P<first>[A-Z])(?P<start>\d+)(?::(?P<last>[A-Z])(?P<end>\d*))?$")
+
+
+class FakeSheetsApi:
+    """The parts of the Sheets values API GoogleSheetsService uses, over in-memory sheets"""
+
+    def __init__(self, sheets):
+        # sheet name -> rows, the first being the header row
+        self.sheets = sheets
+        self.calls = []
+
+    def values(self):
+        return self
+
+    def batchGet(self, spreadsheetId, ranges, **kwargs):
+        self.calls.append(('batchGet', list(ranges)))
+        return _Executed({'valueRanges': [{'values': self.read(cell_range)} for cell_range in ranges]})
+
+    def batchUpdate(self, spreadsheetId, body):
+        self.calls.append(('batchUpdate', [data['range'] for data in body['data']]))
+        for data in body['data']:
+            rows, first_row, first_column, _ = self._locate(data['range'])
+            for offset, values in enumerate(data['values']):
+                row = rows[first_row + offset]
+                row.extend([''] * (first_column + len(values) - len(row)))
+                row[first_column:first_column + len(values)] = values
+        return _Executed({})
+
+    def append(self, spreadsheetId, range, body, **kwargs):
+        self.calls.append(('append', range))
+        rows = self.sheets[range.split('!')[0]]
+        first = len(rows) + 1
+        rows.extend([list(values) for values in body['values']])
+        return _Executed({'updates': {'updatedRange': f"{range.split('!')[0]}!A{first}:I{len(rows)}"}})
+
+    def read(self, cell_range):
+        rows, first_row, first_column, last = self._locate(cell_range)
+        last_row, last_column = last
+        values = [list(row[first_column:last_column + 1]) for row in rows[first_row:last_row]]
+        for row in values:
+            while row and row[-1] in ('', None):
+                row.pop()
+        while values and not values[-1]:
+            values.pop()
+        return values
+
+    def _locate(self, cell_range):
+        match = A1_RANGE.match(cell_range)
+        rows = self.sheets[match['sheet']]
+        first_row, first_column = int(match['start']) - 1, ord(match['first']) - ord('A')
+        if match['last'] is None:
+            return rows, first_row, first_column, (first_row + 1, first_column)
+        last_row = int(match['end']) if match['end'] else len(rows)
+        return rows, first_row, first_column, (last_row, ord(match['last']) - ord('A'))
+
+
+class _Executed:
+    def __init__(self, result):
+        self.result = result
+
+    def execute(self):
+        return self.result
+
+
+def customer_rows(count):
+    header = ['Name', 'Email', 'Phone', 'GST Number', 'Address', 'Total Receivable', 'Total Received',
+              'Outstanding Balance', 'Created At']
+    return [header] + [[f'Customer {n}', '', '', '', '', 0, 0, 0, '2025-01-01'] for n in range(count)]
+
+
+def sheets_service(api):
+    """A GoogleSheetsService talking to api instead of Google"""
+    credentials = mock.Mock(universe_domain='googleapis.com')
+    with mock.patch.object(sheets_services.os.path, 'exists', return_value=True), \
+            mock.patch.object(sheets_services.service_account.Credentials, 'from_service_account_file',
+                              return_value=credentials), \
+            mock.patch.object(sheets_services.GoogleSheetsService, '_ensure_sheets'):
+        service = sheets_services.GoogleSheetsService()
+    service.sheet = api
+    return service
+
+
+class SheetMirrorTests(SimpleTestCase):
+    def setUp(self):
+        self.api = FakeSheetsApi({'Customers': customer_rows(1000)})
+
+    def read(self, mirror):
+        return mirror.read(lambda cell_range: self.api.batchGet('', [cell_range]).execute()['valueRanges'][0]['values'],
+                           lambda ranges: [r['values'] for r in self.api.batchGet('', ranges).execute()['valueRanges']])
+
+    def test_fresh_copy_is_served_from_memory(self):
+        mirror = SheetMirror('Customers!A2:I', max_age=60)
+        self.assertEqual(len(self.read(mirror)), 1000)
+        self.api.sheets['Customers'][5][0] = 'Renamed'
+        self.assertEqual(self.read(mirror)[4][0], 'Customer 4')
+        self.assertEqual(len(self.api.calls), 1)
+
+    def test_refresh_adds_appended_rows(self):
+        mirror = SheetMirror('Customers!A2:I', max_age=0)
+        self.read(mirror)
+        self.api.sheets['Customers'].append(['New', '', '', '', '', 1, 0, 1, '2025-02-01'])
+        rows = self.read(mirror)
+        self.assertEqual(rows[-1][0], 'New')
+        self.assertEqual(len(rows), 1001)
+        # The tail and one checked block in a single batchGet, no reload
+        self.assertEqual(self.api.calls[-1], ('batchGet', ['Customers!A1002:I', 'Customers!A2:I201']))
+
+    def test_expired_rows_are_fetched_without_reload(self):
+        mirror = SheetMirror('Customers!A2:I', max_age=60)
+        self.read(mirror)
+        self.api.sheets['Customers'][901][5] = 250
+        mirror.expire([902])
+        self.assertEqual(self.read(mirror)[900][5], 250)
+        self.assertEqual(self.api.calls[-1][0], 'batchGet')
+        self.assertIn('Customers!A802:I1001', self.api.calls[-1][1])
+        self.assertEqual(len(self.api.calls), 2)
+
+    def test_checked_block_edited_by_hand_reloads_range(self):
+        mirror = SheetMirror('Customers!A2:I', max_age=0)
+        self.read(mirror)
+        self.api.sheets['Customers'][10][0] = 'Edited by hand'
+        self.assertEqual(self.read(mirror)[9][0], 'Edited by hand')
+        self.assertEqual(self.api.calls[-1], ('batchGet', ['Customers!A2:I']))
+
+    def test_invalidate_reloads_range(self):
+        mirror = SheetMirror('Customers!A2:I', max_age=60)
+        self.read(mirror)
+        self.api.sheets['Customers'][10][0] = 'Edited by hand'
+        mirror.invalidate()
+        self.assertEqual(self.read(mirror)[9][0], 'Edited by hand')
+        self.assertEqual(self.api.calls[-1], ('batchGet', ['Customers!A2:I']))
+
+
+@override_settings(SHEETS_MIRROR_MAX_AGE_SECONDS=0)
+class SheetsWriteLogTests(TestCase):
+    def setUp(self):
+        self.api = FakeSheetsApi({'Customers': customer_rows(1000)})
+        self.reader = sheets_service(self.api)
+        self.writer = sheets_service(self.api)
+
+    def test_overwritten_row_reaches_other_process_mirror_at_next_refresh(self):
+        self.assertEqual(self.reader.search_customers({'name': 'Customer 900'})[0]['total_receivable'], 0)
+
+        self.assertTrue(self.writer.add_customer({'name': 'Customer 900', 'total_receivable': 500}))
+        self.assertEqual(list(SheetsWrite.objects.values_list('sheet_name', 'row_numbers')), [('Customers', [902])])
+
+        customer = self.reader.search_customers({'name': 'Customer 900'})[0]
+        self.assertEqual(customer['_row'], 902)
+        self.assertEqual(customer['total_receivable'], 500)
+
+    def test_appends_are_not_logged(self):
+        self.assertTrue(self.writer.add_customer({'name': 'Brand New'}))
+        self.assertFalse(SheetsWrite.objects.exists())
+        self.assertEqual(self.reader.search_customers({'name': 'Brand New'})[0]['_row'], 1002)
+
+    def test_mirror_that_has_not_looked_within_retention_is_reloaded(self):
+        self.reader.search_customers({})
+        cursor, looked_at = self.reader._write_cursors['Customers!A2:I']
+        self.reader._write_cursors['Customers!A2:I'] = (cursor, looked_at - sheets_services.WRITE_LOG_RETENTION * 2)
+        self.api.sheets['Customers'][10][0] = 'Edited by hand'
+
+        self.assertEqual(self.reader.search_customers({'name': 'Edited by hand'})[0]['_row'], 11)
+        self.assertEqual(self.api.calls[-1], ('batchGet', ['Customers!A2:I']))
+
+
+class SheetsRowIndexTests(TestCase):
+    def setUp(self):
+        self.api = FakeSheetsApi({'Customers': customer_rows(1000)})
+        self.service = sheets_service(self.api)
+        self.assertTrue(self.service.add_customer({'name': 'Customer 5', 'total_receivable': 10}))
+        self.api.calls.clear()
+
+    def names(self):
+        return [row[0] for row in self.api.sheets['Customers'][1:]]
+
+    def test_new_names_are_appended_without_reloading(self):
+        self.assertTrue(self.service.add_customer({'name': 'Brand New'}))
+        self.assertTrue(self.service.add_customers([{'name': 'Customer 7'}, {'name': 'Second New'}]))
+
+        self.assertEqual(self.api.calls, [
+            ('batchGet', ['Customers!A1002']), ('append', 'Customers!A1'),
+            ('batchGet', ['Customers!A9', 'Customers!A1003']), ('batchUpdate', ['Customers!A9:H9']),
+            ('append', 'Customers!A1'),
+        ])
+        self.assertEqual(self.names()[-2:], ['Brand New', 'Second New'])
+
+    def test_rows_added_elsewhere_reload_the_index(self):
+        self.api.sheets['Customers'].append(['Added By Hand', '', '', '', '', 0, 0, 0, '2025-02-01'])
+        self.assertTrue(self.service.add_customer({'name': 'Added by hand', 'total_receivable': 75}))
+
+        self.assertIn(('batchGet', ['Customers!A2:A']), self.api.calls)
+        self.assertEqual(len(self.names()), 1001)
+        self.assertEqual(self.api.sheets['Customers'][1001][5], 75)
+
+    def test_moved_row_reloads_the_index(self):
+        del self.api.sheets['Customers'][2]
+        self.assertTrue(self.service.add_customer({'name': 'Customer 5', 'total_receivable': 20}))
+        self.assertEqual(self.api.sheets['Customers'][5][:6], ['Customer 5', '', '', '', '', 20.0])
+        self.assertEqual(len(self.names()), 999)
+
+
+class SheetsBootstrapTests(SimpleTestCase):
+    layout = {'Transactions': ['Date', 'Amount'], 'Customers': ['Name'], 'Vendors': ['Name']}
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def bootstrap(self, *titles):
+        service = sheets_service(FakeSheetsApi({}))
+        service.sheet = mock.Mock()
+        service.sheet.get.return_value.execute.return_value = {'sheets': [
+            {'properties': {'sheetId': sheet_id, 'title': title}} for sheet_id, title in enumerate(titles)
+        ]}
+        service._ensure_sheets(self.layout)
+        return service.sheet
+
+    def test_missing_sheets_and_headers_are_created_in_one_batch_update(self):
+        api = self.bootstrap('Transactions')
+        api.get.assert_called_once()
+        api.batchUpdate.assert_called_once()
+        requests = api.batchUpdate.call_args.kwargs['body']['requests']
+        self.assertEqual(
+            [request['addSheet']['properties'] for request in requests if 'addSheet' in request],
+            [{'sheetId': 1, 'title': 'Customers'}, {'sheetId': 2, 'title': 'Vendors'}],
+        )
+        self.assertEqual(
+            [request['updateCells']['start']['sheetId'] for request in requests if 'updateCells' in request], [1, 2]
+        )
+
+    def test_verified_layout_is_cached_per_spreadsheet(self):
+        api = self.bootstrap('Transactions', 'Customers', 'Vendors')
+        api.batchUpdate.assert_not_called()
+        self.assertEqual(self.bootstrap('Transactions', 'Customers', 'Vendors').mock_calls, [])
+
+        self.layout = dict(self.layout, Vendors=['Name', 'Email'])
+        self.bootstrap('Transactions', 'Customers', 'Vendors').get.assert_called_once()
+
+    def test_failed_bootstrap_is_retried(self):
+        service = sheets_service(FakeSheetsApi({}))
+        service.sheet = mock.Mock()
+        service.sheet.get.return_value.execute.side_effect = OSError('timed out')
+        service._ensure_sheets(self.layout)
+        self.bootstrap('Transactions', 'Customers', 'Vendors').get.assert_called_once()
+
+
+class SheetsBatchReadTests(TestCase):
+    def setUp(self):
+        self.api = FakeSheetsApi({
+            'Transactions': [
+                sheets_services.SHEET_LAYOUT['Transactions'], ['2025-05-01', 'Stock', 'COGS', 500, 'EXPENSE']
+            ],
+            'Customers': customer_rows(2),
+            'Vendors': [sheets_services.SHEET_LAYOUT['Vendors'], ['Raju', 'raju@example.com']],
+        })
+        self.service = sheets_service(self.api)
+
+    def test_ranges_are_read_unformatted_in_one_batch_get(self):
+        self.service.sheet = mock.Mock()
+        batch_get = self.service.sheet.values.return_value.batchGet
+        batch_get.return_value.execute.return_value = {'valueRanges': [{'values': [[1250.5]]}, {}]}
+
+        self.assertEqual(self.service.get_ranges(['Customers!F2:F', 'Vendors!A2:A', 'Extra!A1']), [[[1250.5]], [], []])
+        batch_get.assert_called_once_with(
+            spreadsheetId=self.service.spreadsheet_id, ranges=['Customers!F2:F', 'Vendors!A2:A', 'Extra!A1'],
+            valueRenderOption='UNFORMATTED_VALUE', dateTimeRenderOption='FORMATTED_STRING',
+            fields='valueRanges(values)',
+        )
+        self.assertEqual(self.service.get_ranges([]), [])
+
+    def test_all_records_come_from_one_round_trip(self):
+        records = self.service.get_all_records()
+        self.assertEqual(self.api.calls, [('batchGet', [
+            self.service.transactions_range, self.service.customers_range, self.service.vendors_range
+        ])])
+        self.assertEqual(records['transactions'][0]['expected_amount'], 500)
+        self.assertEqual([customer['name'] for customer in records['customers']], ['Customer 0', 'Customer 1'])
+        self.assertEqual(records['vendors'][0]['email'], 'raju@example.com')
+        self.assertEqual(records['vendors'][0]['created_at'], '')
+
+        self.assertEqual(self.service.get_all_records(), records)
+        self.assertEqual(len(self.api.calls), 1)
+
+
+class QueryEngineTests(TestCase):
+    today = date(2025, 5, 10)
+
+    def setUp(self):
+        self.user = User.objects.create_user('asker', password='x')
+        for day, kind, amount in ((date(2025, 5, 2), 'EXPENSE', 300), (date(2025, 5, 6), 'EXPENSE', 200),
+                                  (date(2025, 5, 7), 'INCOME', 1000)):
+            Transaction.objects.create(user=self.user, date=day, description='x', category='Groceries',
+                                       transaction_type=kind, amount=amount)
+
+    def ask(self, message):
+        return answer_query(self.user, message, today=self.today)
+
+    def test_total_questions_are_answered(self):
+        for message in ("what is the total I spent this month", "total spent this month",
+                        "show me total expenses this month", "how much did I spend this month?",
+                        "expenses this month total?"):
+            with self.subTest(message=message):
+                self.assertEqual(self.ask(message).total, Decimal('500.00'))
+
+    def test_entries_mentioning_total_are_not_answered(self):
+        for message in ("paid 500 total for groceries", "spent 1200 in total on fuel today",
+                        "received 2000 total from Raju"):
+            with self.subTest(message=message):
+                self.assertIsNone(self.ask(message))
+
+    def test_questions_with_parts_it_cannot_resolve_fall_back(self):
+        Customer.objects.create(user=self.user, name='Prakash')
+        for message in ("how much did Prakash pay me this month?", "Prakash paid how much this month?",
+                        "How much GST did I pay this month?", "how many customers paid me",
+                        "how many vendors did I pay", "how much did I spend today or yesterday",
+                        "how much did I spend the day before yesterday",
+                        "paid 500 to Raju for cogs, what's my total now?"):
+            with self.subTest(message=message):
+                self.assertIsNone(self.ask(message))
+
+    def test_category_party_and_period_questions_are_answered(self):
+        Vendor.objects.create(user=self.user, name='Raju')
+        Transaction.objects.filter(amount=300).update(vendor=Vendor.objects.get(name='Raju'))
+        self.assertEqual(self.ask("how much did I spend on groceries this month?").total, Decimal('500.00'))
+        self.assertEqual(self.ask("how much have I paid to Raju in May?").total, Decimal('300.00'))
+        self.assertEqual(self.ask("how many expenses last 3 months").count, 2)
+
+
+class QueryContextTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('context', password='x')
+        for name, amount in (('Raj', 100), ('Raju', 250), ('Prakash Traders', 400)):
+            customer = Customer.objects.create(user=self.user, name=name)
+            Transaction.objects.create(user=self.user, date=date(2025, 5, 2), description='Sale', category='Sales',
+                                       transaction_type='INCOME', amount=amount, customer=customer)
+
+    def test_names_match_whole_words_only(self):
+        self.assertEqual(_mentioned_names(Customer, self.user, "what did raj pay me"), ['Raj'])
+        self.assertEqual(_mentioned_names(Customer, self.user, "what did raju pay me"), ['Raju'])
+        self.assertEqual(_mentioned_names(Customer, self.user, "does prakash traders owe me?"), ['Prakash Traders'])
+        self.assertEqual(_mentioned_names(Customer, self.user, "what does prakash owe?"), [])
+
+    def test_context_is_filtered_to_the_mentioned_party(self):
+        context = build_query_context(self.user, "TRANSACTION", "how much income from Raj?")
+        self.assertIn("mentioned customer/vendor only", context)
+        self.assertIn("Totals: 1 transactions, income 100.00", context)
+
+
+KEYWORD_LISTS = {
+    'TRANSACTION': TRANSACTION_KEYWORDS, 'CUSTOMER': CUSTOMER_KEYWORDS, 'VENDOR': VENDOR_KEYWORDS,
+    'QUERY': QUERY_KEYWORDS, 'ENTRY': ENTRY_KEYWORDS,
+}
+
+
+def substring_counts(message):
+    """The keyword scans classify_intent replaced: one substring test per keyword"""
+    text = message.lower()
+    return {label: sum(1 for keyword in keywords if keyword in text) for label, keywords in KEYWORD_LISTS.items()}
+
+
+class IntentClassifierTests(SimpleTestCase):
+    def test_overlapping_keywords_all_count(self):
+        self.assertEqual(keyword_counts("add vendor list")['VENDOR'], 3)
+        self.assertEqual(classify_intent("add new customer list for vendor supplier").intent, 'CUSTOMER')
+
+    def test_counts_match_substring_scans(self):
+        keywords = [keyword for keywords in KEYWORD_LISTS.values() for keyword in keywords]
+        pieces = keywords + [keyword[:len(keyword) // 2] for keyword in keywords] + \
+            [keyword[len(keyword) // 2:] for keyword in keywords] + [' ', ' ', 'new ', 'list', '?', '500']
+        rng = random.Random(20251016)
+        for _ in range(5000):
+            message = ''.join(rng.choice(pieces) for _ in range(rng.randint(1, 8)))
+            if rng.random() < 0.3:
+                message = message.upper()
+            self.assertEqual(keyword_counts(message), substring_counts(message), message)
+
+
+class GeminiModelMixin:
+    def setUp(self):
+        patcher = mock.patch.multiple(gemini_services, GEMINI_AVAILABLE=True, genai=mock.DEFAULT)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.service = gemini_services.GeminiService()
+
+    def process(self, message, *replies):
+        self.service.model.generate_content.side_effect = [mock.Mock(text=reply) for reply in replies]
+        return self.service.process_message(message, [])
+
+
+@override_settings(GEMINI_STRUCTURED_OUTPUT=False)
+class GeminiResponseTests(GeminiModelMixin, SimpleTestCase):
+    def test_untagged_reply_to_a_confident_entry_is_not_recorded(self):
+        result = self.process("I paid Raju", "How much did you pay Raju?", "How much did you pay Raju?")
+        self.assertEqual(result, ("How much did you pay Raju?", {}, "UNKNOWN", True))
+        self.assertIn("DATA_ENTRY_TRANSACTION", self.service.model.generate_content.call_args_list[0].args[0])
+
+    def test_gemini_tag_is_kept_over_the_local_classification(self):
+        result = self.process("paid 500 to Raju for cogs", "QUERY_TRANSACTION: You have paid Raju ₹500 so far.")
+        self.assertEqual(result, ("You have paid Raju ₹500 so far.", {}, "TRANSACTION", True))
+
+    def stream(self, message, *chunks):
+        self.service.model.generate_content.return_value = iter([mock.Mock(text=chunk) for chunk in chunks])
+        return list(self.service.stream_message(message, []))
+
+    def test_untagged_stream_is_kept_as_the_answer(self):
+        events = self.stream("what is depreciation?", "Depreciation spreads ", "an asset's cost.")
+        self.assertEqual(events, [
+            ("token", "Depreciation spreads "), ("token", "an asset's cost."),
+            ("result", ("Depreciation spreads an asset's cost.", {}, "UNKNOWN", True)),
+        ])
+        self.assertEqual(self.service.model.generate_content.call_count, 1)
+
+    def test_tagged_stream_strips_the_tag(self):
+        events = self.stream("how much did I spend?", "QUERY_TRAN", "SACTION: You spent ", "₹500.")
+        self.assertEqual(events, [
+            ("token", "You spent "), ("token", "₹500."),
+            ("result", ("You spent ₹500.", {}, "TRANSACTION", True)),
+        ])
+
+
+@override_settings(GEMINI_STRUCTURED_OUTPUT=True)
+class StructuredGeminiResponseTests(GeminiModelMixin, SimpleTestCase):
+
+    def test_structured_entry_is_parsed_from_a_single_call(self):
+        reply = json.dumps({
+            "tag": "DATA_ENTRY_TRANSACTION", "reply": "Recorded ₹500 paid to Raju.",
+            "data": {"date": "2024-05-02", "transaction_type": "EXPENSE", "amount": 500,
+                     "vendor": "Raju", "category": "Cost of Goods Sold", "payment_method": ""},
+        })
+        message, data, intent, is_query = self.process("paid 500 to Raju for cogs", reply)
+        self.assertEqual((message, intent, is_query), ("Recorded ₹500 paid to Raju.", "TRANSACTION", False))
+        self.assertEqual(
+            {key: data[key] for key in ('date', 'amount', 'vendor', 'payment_method', 'description')},
+            {'date': '2024-05-02', 'amount': 500.0, 'vendor': 'Raju', 'payment_method': 'Cash',
+             'description': 'No description'},
+        )
+        self.assertEqual(self.service.model.generate_content.call_count, 1)
+        schema = gemini_services.genai.GenerationConfig.call_args.kwargs['response_schema']
+        self.assertEqual(schema['properties']['tag']['enum'], ["DATA_ENTRY_TRANSACTION", "GENERAL"])
+
+    def test_general_structured_reply_is_the_answer(self):
+        result = self.process("what is depreciation?", json.dumps({"tag": "GENERAL", "reply": "It spreads an asset's cost."}))
+        self.assertEqual(result, ("It spreads an asset's cost.", {}, "UNKNOWN", True))
+        self.assertEqual(self.service.model.generate_content.call_count, 1)
+
+    def test_invalid_structured_reply_falls_back_to_the_text_format(self):
+        for invalid in (
+            "not json",
+            json.dumps({"tag": "DATA_ENTRY_TRANSACTION", "reply": "Done.",
+                        "data": {"transaction_type": "EXPENSE", "amount": -5}}),
+            json.dumps({"tag": "DATA_ENTRY_VENDOR", "reply": "Done.", "data": {"name": ""}}),
+            json.dumps({"tag": "SOMETHING_ELSE", "reply": "Done."}),
+        ):
+            with self.subTest(invalid=invalid):
+                result = self.process("how much did I spend?", invalid, "QUERY_TRANSACTION: You spent ₹500.")
+                self.assertEqual(result, ("You spent ₹500.", {}, "TRANSACTION", True))
+                self.assertEqual(self.service.model.generate_content.call_count, 2)
+                self.service.model.generate_content.reset_mock()
+
+    def test_unsure_intent_schema_offers_every_tag_and_entity(self):
+        schema = gemini_services.response_schema("UNKNOWN")
+        self.assertEqual(schema['properties']['tag']['enum'], list(gemini_services.RESPONSE_TAGS) + ["GENERAL"])
+        self.assertEqual(set(schema['properties']), {'tag', 'reply', 'transaction', 'party'})
+        self.assertEqual(gemini_services.response_schema("VENDOR")['properties']['data']['required'], ["name"])
+
+
+class LedgerRollupTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('rollup', password='x')
+        self.other = User.objects.create_user('bystander', password='x')
+        Transaction.objects.create(user=self.other, date=date(2025, 3, 31), description='Rent',
+                                   category='Rent', transaction_type='EXPENSE', amount=900)
+
+    def _transaction(self, **fields):
+        return Transaction.objects.create(**dict({
+            'user': self.user, 'date': date(2025, 3, 31), 'description': 'Sale',
+            'category': 'Sales', 'transaction_type': 'INCOME', 'amount': Decimal('100.50'),
+        }, **fields))
+
+    def rollups(self):
+        daily = set(DailyLedgerRollup.objects.values_list(
+            'user_id', 'date', 'transaction_type', 'category', 'total_amount', 'txn_count'
+        ))
+        periods = set(PeriodLedgerRollup.objects.values_list(
+            'user_id', 'granularity', 'period_start', 'transaction_type', 'category', 'total_amount', 'txn_count'
+        ))
+        return daily, periods
+
+    def assertMatchesRecomputation(self):
+        maintained = self.rollups()
+        rebuild_ledger_rollup()
+        self.assertEqual(maintained, self.rollups())
+
+    def test_create(self):
+        self._transaction()
+        self._transaction(amount=Decimal('20.25'))
+        self._transaction(transaction_type='EXPENSE', category='Fuel', date=date(2025, 4, 1))
+        self.assertMatchesRecomputation()
+        self.assertEqual(
+            DailyLedgerRollup.objects.get(user=self.user, date=date(2025, 3, 31)).total_amount, Decimal('120.75')
+        )
+
+    def test_edit_amount(self):
+        transaction = self._transaction()
+        self._transaction()
+        transaction.amount = Decimal('75.00')
+        transaction.save()
+        self.assertMatchesRecomputation()
+
+    def test_edit_date_across_week_month_and_year(self):
+        transaction = self._transaction(date=date(2024, 12, 31))
+        self._transaction(date=date(2024, 12, 30))
+        transaction.date = date(2025, 1, 6)
+        transaction.save()
+        self.assertMatchesRecomputation()
+
+    def test_edit_type_and_category(self):
+        transaction = self._transaction()
+        transaction.transaction_type = 'EXPENSE'
+        transaction.category = 'Refunds'
+        transaction.save()
+        self.assertMatchesRecomputation()
+        self.assertFalse(DailyLedgerRollup.objects.filter(user=self.user, transaction_type='INCOME').exists())
+
+    def test_delete(self):
+        transaction = self._transaction()
+        kept = self._transaction(date=date(2025, 3, 3))
+        transaction.delete()
+        self.assertMatchesRecomputation()
+        kept.delete()
+        self.assertMatchesRecomputation()
+        self.assertFalse(PeriodLedgerRollup.objects.filter(user=self.user).exists())
+
+
+class PlanRangeTests(SimpleTestCase):
+    def assertCoversExactly(self, start, end):
+        days = []
+        for segment in plan_range(start, end):
+            if segment.level != 'DAY':
+                granularity = segment.level.lower()
+                self.assertEqual(period_start(segment.start, granularity), segment.start, segment)
+                self.assertEqual(period_end(period_start(segment.end, granularity), granularity), segment.end, segment)
+            days += [segment.start + timedelta(days=n) for n in range((segment.end - segment.start).days + 1)]
+        self.assertEqual(days, [start + timedelta(days=n) for n in range((end - start).days + 1)], (start, end))
+
+    def test_whole_months_use_month_rows(self):
+        self.assertEqual(plan_range(date(2025, 1, 1), date(2025, 3, 31)),
+                         [Segment('MONTH', date(2025, 1, 1), date(2025, 3, 31))])
+
+    def test_fiscal_year_spans_calendar_years_in_months(self):
+        self.assertEqual(plan_range(date(2024, 4, 1), date(2025, 3, 31)),
+                         [Segment('MONTH', date(2024, 4, 1), date(2025, 3, 31))])
+
+    def test_partial_range_uses_every_level(self):
+        self.assertEqual(plan_range(date(2023, 12, 20), date(2025, 2, 12)), [
+            Segment('DAY', date(2023, 12, 20), date(2023, 12, 24)),
+            Segment('WEEK', date(2023, 12, 25), date(2023, 12, 31)),
+            Segment('YEAR', date(2024, 1, 1), date(2024, 12, 31)),
+            Segment('MONTH', date(2025, 1, 1), date(2025, 1, 31)),
+            Segment('DAY', date(2025, 2, 1), date(2025, 2, 2)),
+            Segment('WEEK', date(2025, 2, 3), date(2025, 2, 9)),
+            Segment('DAY', date(2025, 2, 10), date(2025, 2, 12)),
+        ])
+        self.assertCoversExactly(date(2023, 12, 20), date(2025, 2, 12))
+
+    def test_single_day_and_empty_range(self):
+        self.assertEqual(plan_range(date(2025, 2, 28), date(2025, 2, 28)),
+                         [Segment('DAY', date(2025, 2, 28), date(2025, 2, 28))])
+        self.assertEqual(plan_range(date(2025, 3, 1), date(2025, 2, 28)), [])
+
+    def test_chart_buckets_are_covered_exactly(self):
+        for granularity in ('week', 'month', 'quarter', 'year', 'fiscal_year'):
+            for _, first, last in bucket_ranges(date(2023, 2, 15), date(2025, 11, 3), granularity):
+                with self.subTest(granularity=granularity, first=first):
+                    self.assertCoversExactly(first, last)
+
+    def test_random_ranges_are_covered_exactly(self):
+        rng = random.Random(413)
+        for _ in range(300):
+            start = date(2023, 1, 1) + timedelta(days=rng.randrange(900))
+            self.assertCoversExactly(start, start + timedelta(days=rng.randrange(800)))
+
+
+class MoneyTests(SimpleTestCase):
+    def test_of_reads_every_amount_form(self):
+        self.assertEqual(Money.of(12).paise, 1200)
+        self.assertEqual(Money.of(Decimal('12.5')).paise, 1250)
+        self.assertEqual(Money.of('₹1,250.50').paise, 125050)
+        self.assertEqual(Money.of('Rs. 99').paise, 9900)
+        self.assertEqual(Money.of(None).paise, 0)
+        self.assertEqual(Money.of('').paise, 0)
+
+    def test_of_rounds_half_up(self):
+        self.assertEqual(Money.of('0.125').paise, 13)
+        self.assertEqual(Money.of(Decimal('0.124')).paise, 12)
+        self.assertEqual(Money.of('-0.125').paise, -13)
+
+    def test_floats_round_like_their_repr(self):
+        for value in (0.125, 1.005, 2.675, 0.1 + 0.2, 1e-3):
+            with self.subTest(value=value):
+                self.assertEqual(Money.of(value), Money.of(repr(value)))
+
+    def test_rejects_bools_and_non_amounts(self):
+        for value in (True, False, 'abc', float('nan'), float('inf'), Decimal('NaN')):
+            with self.subTest(value=value):
+                with self.assertRaises(ValueError):
+                    Money.of(value)
+        self.assertNotEqual(Money(100), True)
+
+    def test_arithmetic_and_display(self):
+        total = Money.of('10.10') + Money.of('0.20') - 1
+        self.assertEqual(total, Money(930))
+        self.assertEqual((-total).format(), '-₹9.30')
+        self.assertEqual(to_decimal(0.1 + 0.2), Decimal('0.30'))
+
+    def test_money_field_normalises_assignment(self):
+        transaction = Transaction(amount=Money(12345))
+        self.assertEqual(transaction.amount, Decimal('123.45'))
+        transaction.amount = 0.1 + 0.2
+        self.assertEqual(transaction.amount, Decimal('0.30'))
+
+    def test_balances_are_plain_decimal_arithmetic(self):
+        customer = Customer(total_receivable='₹1,250.50', total_received=0.1)
+        customer.total_receivable += Decimal('0.20')
+        self.assertEqual(customer.outstanding_balance, Decimal('1250.60'))
+        self.assertEqual(customer.outstanding_balance.as_tuple().exponent, -2)
+
+
+class RecordingSheetsService:
+    """Stands in for GoogleSheetsService, recording each batch write"""
+
+    def __init__(self, ok=True):
+        self.ok = ok
+        self.calls = []
+        # Transaction rows with these amounts make the whole call fail
+        self.rejected_amounts = set()
+        self.written_transactions = []
+
+    def add_transactions(self, rows):
+        self.calls.append(('add_transactions', rows))
+        accepted = self.ok and not any(row['amount'] in self.rejected_amounts for row in rows)
+        if accepted:
+            self.written_transactions.extend(rows)
+        return accepted
+
+    def add_customers(self, rows):
+        self.calls.append(('add_customers', rows))
+        return self.ok
+
+    def add_vendors(self, rows):
+        self.calls.append(('add_vendors', rows))
+        return self.ok
+
+
+@override_settings(SHEETS_FLUSH_INTERVAL_SECONDS=0)
+class SyncOutboxTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('syncer', password='x')
+        self.customer = Customer.objects.create(user=self.user, name='Raju')
+        self.sheets = RecordingSheetsService()
+        patcher = mock.patch.object(sync_outbox, 'get_sheets_service', lambda: self.sheets)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _sale(self, amount):
+        transaction = Transaction.objects.create(
+            user=self.user, date=date(2025, 5, 1), description='Sale', category='Sales',
+            transaction_type='INCOME', amount=amount, customer=self.customer
+        )
+        sync_outbox.enqueue_transaction_sync(transaction, tally=False)
+        return transaction
+
+    def test_entries_are_coalesced_into_one_call_per_operation(self):
+        self._sale(100)
+        self._sale(250)
+        sync_outbox.enqueue_customer_sync(self.customer, tally=False)
+
+        stats = sync_outbox.process_outbox()
+
+        self.assertEqual(stats, {'claimed': 5, 'done': 5, 'retried': 0, 'failed': 0})
+        self.assertEqual(sorted(name for name, _ in self.sheets.calls), ['add_customers', 'add_transactions'])
+        calls = dict(self.sheets.calls)
+        self.assertEqual([row['amount'] for row in calls['add_transactions']], [100.0, 250.0])
+        self.assertEqual([row['name'] for row in calls['add_customers']], ['Raju'])
+        self.assertFalse(SyncOutbox.objects.exclude(status='DONE').exists())
+
+    def test_deleted_record_is_skipped(self):
+        self._sale(100).delete()
+        stats = sync_outbox.process_outbox()
+        self.assertEqual(stats['done'], 2)
+        self.assertEqual([name for name, _ in self.sheets.calls], ['add_customers'])
+
+    @override_settings(SHEETS_FLUSH_INTERVAL_SECONDS=3600, SHEETS_FLUSH_MAX_ROWS=50)
+    def test_sheets_entries_wait_for_a_flush(self):
+        self._sale(100)
+        self.assertEqual(sync_outbox.process_outbox()['claimed'], 0)
+        self.assertEqual(SyncOutbox.objects.filter(status='PENDING').count(), 2)
+
+    def test_rejected_batch_is_retried_with_backoff_then_failed(self):
+        self.sheets.ok = False
+        self._sale(100)
+
+        stats = sync_outbox.process_outbox(max_attempts=2)
+
+        self.assertEqual(stats, {'claimed': 2, 'done': 0, 'retried': 2, 'failed': 0})
+        entries = list(SyncOutbox.objects.all())
+        for entry in entries:
+            self.assertEqual((entry.status, entry.attempts), ('PENDING', 1))
+            self.assertGreater(entry.next_attempt_at, timezone.now() + timedelta(seconds=20))
+            self.assertIn('rejected', entry.last_error)
+        # Not due again until the backoff has passed
+        self.assertEqual(sync_outbox.process_outbox(max_attempts=2)['claimed'], 0)
+
+        SyncOutbox.objects.update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+        stats = sync_outbox.process_outbox(max_attempts=2)
+        self.assertEqual(stats, {'claimed': 2, 'done': 0, 'retried': 0, 'failed': 2})
+        self.assertEqual(set(SyncOutbox.objects.values_list('status', 'attempts')), {('FAILED', 2)})
+
+        self.sheets.ok = True
+        self.assertEqual(sync_outbox.process_outbox()['claimed'], 0)
+
+    def test_tally_entries_are_dispatched_and_retried_one_by_one(self):
+        tally = mock.Mock()
+        tally.sync_customer_to_ledger.return_value = {'success': True}
+        tally.sync_sales_transaction.return_value = {'success': False, 'error': 'Tally is offline'}
+        transaction = Transaction.objects.create(
+            user=self.user, date=date(2025, 5, 1), description='Sale', category='Sales',
+            transaction_type='INCOME', amount=100, customer=self.customer
+        )
+        sync_outbox.enqueue_transaction_sync(transaction, sheets=False)
+
+        with mock.patch.object(sync_outbox, 'get_tally_service', lambda: tally):
+            stats = sync_outbox.process_outbox()
+
+        self.assertEqual(stats, {'claimed': 2, 'done': 1, 'retried': 1, 'failed': 0})
+        tally.sync_sales_transaction.assert_called_once_with(transaction)
+        retried = SyncOutbox.objects.get(status='PENDING')
+        self.assertEqual((retried.operation, retried.last_error), ('sales', 'Tally is offline'))
+
+    def test_entries_locked_by_a_dead_worker_are_reclaimed(self):
+        self._sale(100)
+        locked_at = timezone.now() - timedelta(seconds=sync_outbox.STALE_LOCK_SECONDS + 1)
+        SyncOutbox.objects.update(status='PROCESSING', locked_at=locked_at)
+        self.assertEqual(sync_outbox.process_outbox()['done'], 2)
+
+        SyncOutbox.objects.update(status='PROCESSING', locked_at=timezone.now())
+        self.assertEqual(sync_outbox.process_outbox()['claimed'], 0)
+
+    def test_rejected_row_fails_alone(self):
+        self.sheets.rejected_amounts = {250.0}
+        sales = [self._sale(amount) for amount in (100, 250, 300, 400)]
+
+        stats = sync_outbox.process_outbox(max_attempts=1)
+
+        self.assertEqual(stats, {'claimed': 8, 'done': 7, 'retried': 0, 'failed': 1})
+        failed = SyncOutbox.objects.get(status='FAILED')
+        self.assertEqual(failed.payload, {'transaction_id': sales[1].id})
+        self.assertEqual(sorted(row['amount'] for row in self.sheets.written_transactions), [100.0, 300.0, 400.0])
+
+    @override_settings(SHEETS_FLUSH_INTERVAL_SECONDS=3600, SHEETS_FLUSH_MAX_ROWS=50)
+    def test_once_flushes_waiting_sheets_entries(self):
+        self._sale(100)
+        call_command('process_sync_outbox', '--once', stdout=io.StringIO())
+        self.assertFalse(SyncOutbox.objects.exclude(status='DONE').exists())
+        self.assertEqual(sorted(name for name, _ in self.sheets.calls), ['add_customers', 'add_transactions'])
+
+
+@mock.patch('counto_app.views.get_tally_service', lambda: None)
+@mock.patch('counto_app.views.get_sheets_service', lambda: RecordingSheetsService())
+class ConfirmationFlowTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('confirmer', password='x')
+        self.client.force_login(self.user)
+
+    def send(self, content, conversation_id=None):
+        data = {'content': content}
+        if conversation_id:
+            data['conversation_id'] = conversation_id
+        return self.client.post('/api/messages/', data, content_type='application/json').json()
+
+    def propose(self):
+        reply = self.send("paid 500 to Raju for cogs")
+        self.assertIn("Would you like me to record this transaction?", reply['message'])
+        return reply['conversation_id']
+
+    def test_entry_is_recorded_once_after_yes(self):
+        conversation_id = self.propose()
+        self.assertFalse(Transaction.objects.exists())
+
+        reply = self.send("yes", conversation_id)
+        self.assertEqual(reply['intent_type'], 'TRANSACTION_CONFIRMED')
+        transaction = Transaction.objects.get()
+        self.assertEqual((transaction.amount, transaction.vendor.name), (Decimal('500.00'), 'Raju'))
+        self.assertEqual(set(SyncOutbox.objects.values_list('operation', flat=True)), {'transaction', 'vendor'})
+        self.assertFalse(PendingTransaction.objects.exists())
+
+        self.send("yes", conversation_id)
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    def test_no_discards_the_entry(self):
+        conversation_id = self.propose()
+        self.assertEqual(self.send("no", conversation_id)['intent_type'], 'TRANSACTION_CANCELLED')
+        self.assertFalse(Transaction.objects.exists())
+        self.assertFalse(PendingTransaction.objects.exists())
+
+    def confirm(self, pending):
+        return self.client.post('/api/transactions/confirm/', {'pending_transaction_id': pending.id, 'confirm': True},
+                                content_type='application/json')
+
+    def test_confirm_endpoint_uses_the_chat_handlers(self):
+        self.propose()
+        pending = PendingTransaction.objects.get()
+
+        response = self.confirm(pending)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['intent_type'], 'TRANSACTION_CONFIRMED')
+        self.assertEqual(Transaction.objects.get().amount, Decimal('500.00'))
+        self.assertTrue(SyncOutbox.objects.filter(operation='transaction').exists())
+        self.assertEqual(self.confirm(pending).status_code, 404)
+
+    def test_confirm_endpoint_rejects_an_expired_proposal(self):
+        self.propose()
+        pending = PendingTransaction.objects.get()
+        PendingTransaction.objects.update(created_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(self.confirm(pending).status_code, 409)
+        self.assertFalse(Transaction.objects.exists())
+
+
+@override_settings(CHAT_HISTORY_MAX_MESSAGES=4, CHAT_HISTORY_TOKEN_BUDGET=100, CHAT_SUMMARY_BATCH_SIZE=2)
+class ConversationHistoryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('chatter', password='x')
+        self.conversation = Conversation.objects.create(user=self.user)
+        self.gemini = mock.Mock()
+        self.gemini.summarize_history.side_effect = lambda summary, messages: (
+            f"{summary} {' '.join(m['content'][:3] for m in messages)}".strip()
+        )
+        patcher = mock.patch.object(sync_outbox, 'get_gemini_service', lambda: self.gemini)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def say(self, *contents):
+        return [Message.objects.create(conversation=self.conversation, sender='USER', content=content)
+                for content in contents]
+
+    def test_summary_is_queued_instead_of_generated_on_the_request(self):
+        self.say('m01', 'm02', 'm03', 'm04', 'm05')
+        summary, window = load_history(self.conversation)
+        self.assertEqual((summary, [m['content'] for m in window]), ('', ['m02', 'm03', 'm04', 'm05']))
+        self.assertFalse(SyncOutbox.objects.filter(target='GEMINI').exists())
+
+        self.say('m06')
+        load_history(self.conversation)
+        load_history(self.conversation)
+        self.gemini.summarize_history.assert_not_called()
+        self.assertEqual(SyncOutbox.objects.filter(target='GEMINI', operation='history_summary').count(), 1)
+
+        sync_outbox.process_outbox()
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.summary, 'm01 m02')
+
+    def test_messages_trimmed_by_the_token_budget_are_all_folded(self):
+        first = self.say('m01', 'm02', 'm03')[0]
+        self.say('x' * 400, 'short')
+        self.conversation.summarized_through_id = first.id
+        self.conversation.save()
+
+        summary, window = load_history(self.conversation)
+        self.assertEqual([m['content'] for m in window], ['short'])
+        sync_outbox.process_outbox()
+
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.summary, 'm02 m03 xxx')
+        self.assertEqual(self.conversation.summarized_through_id, window[0]['id'] - 1)
+
+
+class ForecastTests(TestCase):
+    today = date(2025, 6, 30)
+
+    def setUp(self):
+        caches['analytics'].clear()
+        self.user = User.objects.create_user('forecaster', password='x')
+
+    def test_trend_is_extended(self):
+        projection = fit_projection(np.arange(100, dtype=float) + 10, date(2025, 1, 1), 30)
+        np.testing.assert_allclose(projection, np.arange(100, 130) + 10, atol=1e-6)
+
+    def test_weekly_pattern_repeats(self):
+        history_start = date(2025, 1, 6)  # a Monday
+        series = np.array([700.0 if day % 7 == 0 else 0.0 for day in range(364)])
+        projection = fit_projection(series, history_start, 14)
+        np.testing.assert_allclose(projection[[0, 7]], 700, atol=10)
+        np.testing.assert_allclose(np.delete(projection, [0, 7]), 0, atol=10)
+
+    def test_new_tenant_uses_the_average_of_its_active_days(self):
+        series = np.zeros(365)
+        series[-10:] = 50
+        np.testing.assert_allclose(fit_projection(series, date(2025, 1, 1), 30), 50)
+        self.assertFalse(fit_projection(np.zeros(365), date(2025, 1, 1), 30).any())
+
+    def test_open_documents_due_inside_the_horizon_are_added(self):
+        customer = Customer.objects.create(user=self.user, name='Asha')
+        vendor = Vendor.objects.create(user=self.user, name='Raju')
+        for number, due_date, received in (
+            ('INV-1', date(2025, 7, 10), 200),  # 300 still to come in the next 30 days
+            ('INV-2', date(2025, 8, 15), 0),    # 500 in days 31-60
+            ('INV-3', date(2025, 6, 20), 0),    # overdue: when it will be paid is unknown
+            ('INV-4', date(2025, 7, 12), 500),  # settled
+            ('INV-5', date(2025, 11, 1), 0),    # beyond the horizon
+        ):
+            Invoice.objects.create(user=self.user, customer=customer, invoice_number=number, date=self.today,
+                                   due_date=due_date, description='Goods', amount_due=500, amount_received=received)
+        Bill.objects.create(user=self.user, vendor=vendor, bill_number='BILL-1', date=self.today,
+                            due_date=date(2025, 9, 20), description='Stock', amount_due=400, amount_paid=0)
+
+        forecast = forecast_for_user(self.user, self.today)
+        self.assertEqual(forecast['income'], [0.0, 300.0, 500.0, 0.0])
+        self.assertEqual(forecast['expenses'], [0.0, 0.0, 0.0, 400.0])
+        self.assertEqual([horizon['net'] for horizon in forecast['horizons']], [300.0, 800.0, 400.0])
+
+    def test_history_drives_the_last_30_days_and_the_projection(self):
+        for offset in range(120):
+            Transaction.objects.create(user=self.user, date=self.today - timedelta(days=offset), description='Sale',
+                                       category='Sales', transaction_type='INCOME', amount=100)
+        forecast = forecast_for_user(self.user, self.today)
+        self.assertEqual(forecast['income'][:2], [3000.0, 3000.0])
+        self.assertEqual(forecast['horizons'][2]['income'], 9000.0)
+
+    def test_forecast_is_cached_until_the_data_changes(self):
+        self.assertEqual(forecast_for_user(self.user, self.today)['income'][0], 0.0)
+        # Written directly, so the data version does not move
+        DailyLedgerRollup.objects.create(user=self.user, date=self.today, transaction_type='INCOME',
+                                         category='Sales', total_amount=100, txn_count=1)
+        self.assertEqual(forecast_for_user(self.user, self.today)['income'][0], 0.0)
+        self.assertEqual(forecast_for_user(self.user, self.today, use_cache=False)['income'][0], 100.0)
+
+        Customer.objects.create(user=self.user, name='Asha')
+        self.assertEqual(forecast_for_user(self.user, self.today)['income'][0], 100.0)
+
+
+class LedgerEngineTests(TestCase):
+    def setUp(self):
+        clear_ledgers()
+        self.addCleanup(clear_ledgers)
+        self.user = User.objects.create_user('engine', password='x')
+        self.asha = Customer.objects.create(user=self.user, name='Asha')
+        self.raju = Vendor.objects.create(user=self.user, name='Raju')
+        Transaction.objects.create(user=User.objects.create_user('bystander', password='x'), date=date(2025, 3, 1),
+                                   description='Rent', category='Rent', transaction_type='EXPENSE', amount=900)
+        self.sale = self._transaction(date(2025, 1, 15), 'INCOME', 'Sales', '1000.50', customer=self.asha)
+        self._transaction(date(2025, 2, 3), 'EXPENSE', 'Fuel', '120.25', vendor=self.raju)
+        self._transaction(date(2025, 3, 31), 'EXPENSE', 'Rent', '500.00')
+        self._transaction(date(2025, 4, 1), 'INCOME', 'sales', '200.00', customer=self.asha)
+
+    def _transaction(self, day, transaction_type, category, amount, **fields):
+        return Transaction.objects.create(user=self.user, date=day, description=category, category=category,
+                                          transaction_type=transaction_type, amount=Decimal(amount), **fields)
+
+    def test_aggregates_are_exact_paise(self):
+        ledger = get_ledger(self.user)
+        self.assertEqual(ledger.totals(), {'income': 120050, 'expenses': 62025, 'net': 58025, 'count': 4})
+        first_quarter = ledger.mask(date(2025, 1, 1), date(2025, 3, 31))
+        self.assertEqual(ledger.totals(first_quarter & ledger.mask(transaction_type='EXPENSE'))['expenses'], 62025)
+        self.assertEqual(ledger.totals(ledger.category_mask('SALES'))['income'], 120050)
+        self.assertEqual(ledger.totals(ledger.party_mask(customer_ids=[self.asha.pk]))['count'], 2)
+        self.assertEqual(
+            ledger.compare(date(2025, 4, 1), date(2025, 6, 30), date(2025, 1, 1), date(2025, 3, 31)),
+            {'current': {'income': 20000, 'expenses': 0, 'net': 20000, 'count': 1},
+             'previous': {'income': 100050, 'expenses': 62025, 'net': 38025, 'count': 3}},
+        )
+
+    def test_group_by_top_k_and_time_buckets(self):
+        ledger = get_ledger(self.user)
+        self.assertEqual(ledger.group_by('party'), {
+            ('CUSTOMER', self.asha.pk): (120050, 2), ('VENDOR', self.raju.pk): (12025, 1),
+        })
+        self.assertEqual(ledger.top_k('category', 2), [('Sales', 100050), ('Rent', 50000)])
+        buckets, income, expenses = ledger.time_buckets('fiscal_year')
+        self.assertEqual((buckets, income.tolist(), expenses.tolist()),
+                         ([date(2024, 4, 1), date(2025, 4, 1)], [100050, 20000], [62025, 0]))
+        buckets, _, expenses = ledger.time_buckets('week', ledger.mask(transaction_type='EXPENSE'))
+        self.assertEqual((buckets, expenses.tolist()), ([date(2025, 2, 3), date(2025, 3, 31)], [12025, 50000]))
+
+    def test_unchanged_data_reuses_the_snapshot(self):
+        ledger = get_ledger(self.user)
+        with mock.patch('counto_app.services.ledger_engine._ledger_rows') as rows:
+            self.assertIs(get_ledger(self.user), ledger)
+        rows.assert_not_called()
+
+    def test_new_transactions_are_appended_to_a_new_snapshot(self):
+        ledger = get_ledger(self.user)
+        self._transaction(date(2025, 4, 2), 'EXPENSE', 'Fuel', '10.00')
+        with mock.patch('counto_app.services.ledger_engine._ledger_rows', wraps=ledger_engine._ledger_rows) as rows:
+            appended = get_ledger(self.user)
+        self.assertEqual(rows.call_args.args[2], ledger.last_id)
+        self.assertEqual((len(ledger), len(appended)), (4, 5))
+        self.assertEqual(appended.totals()['expenses'], 63025)
+
+    def test_edits_and_party_deletes_reload_the_ledger(self):
+        get_ledger(self.user)
+        self.sale.amount = Decimal('1.00')
+        self.sale.save()
+        self.assertEqual(get_ledger(self.user).totals()['income'], 20100)
+
+        self.raju.delete()
+        self.assertEqual(list(get_ledger(self.user).group_by('party')), [('CUSTOMER', self.asha.pk)])
+
+    @override_settings(LEDGER_ENGINE_MAX_USERS=1)
+    def test_least_recently_used_ledger_is_evicted(self):
+        ledger = get_ledger(self.user)
+        get_ledger(User.objects.get(username='bystander'))
+        self.assertIsNot(get_ledger(self.user), ledger)
+
+
+class PartyQuerySetTests(TestCase):
+    today = date(2025, 5, 10)
+
+    def setUp(self):
+        self.user = User.objects.create_user('parties', password='x')
+        old, recent = self.today - timedelta(days=40), self.today - timedelta(days=5)
+        for n, (day, due, settled) in enumerate(((old, 100, 50), (old, 100, 100), (recent, 100, 0))):
+            customer = Customer.objects.create(user=self.user, name=f'Customer {n}', total_receivable=due * (n + 1))
+            Invoice.objects.create(user=self.user, customer=customer, invoice_number=f'INV-{n}', date=day,
+                                   description='Goods', amount_due=due, amount_received=settled)
+            vendor = Vendor.objects.create(user=self.user, name=f'Vendor {n}', total_payable=due * (n + 1))
+            Bill.objects.create(user=self.user, vendor=vendor, bill_number=f'BILL-{n}', date=day,
+                                description='Stock', amount_due=due, amount_paid=settled)
+
+    def test_unsettled_old_documents_make_a_party_overdue(self):
+        for model in (Customer, Vendor):
+            with self.subTest(model=model.__name__):
+                parties = model.objects.filter(user=self.user).with_overdue(today=self.today).order_by('name')
+                self.assertEqual([party.has_overdue for party in parties], [True, False, False])
+
+    def test_top_outstanding_is_ordered_in_the_database(self):
+        top = Customer.objects.filter(user=self.user).top_outstanding(limit=2)
+        self.assertEqual([(c.name, c.outstanding) for c in top], [('Customer 2', 300), ('Customer 1', 200)])
+
+
+class AnalyticsDataViewTests(TestCase):
+    url = '/api/analytics-data/?start=2025-02-01&end=2025-03-31&granularity=month'
+
+    def setUp(self):
+        caches['analytics'].clear()
+        self.user = User.objects.create_user('analyst', password='x')
+        self.client.force_login(self.user)
+        other = User.objects.create_user('bystander', password='x')
+        Transaction.objects.create(user=other, date=date(2025, 3, 1), description='Rent',
+                                   category='Rent', transaction_type='EXPENSE', amount=900)
+        for day, transaction_type, category, amount in (
+            (date(2025, 1, 15), 'INCOME', 'Sales', 800),
+            (date(2025, 1, 20), 'EXPENSE', 'Rent', 400),
+            (date(2025, 2, 10), 'INCOME', 'Sales', 1000),
+            (date(2025, 2, 12), 'EXPENSE', 'Rent', 300),
+            (date(2025, 3, 5), 'INCOME', 'Consulting', 500),
+            (date(2025, 3, 10), 'EXPENSE', 'Fuel', 100),
+            (date(2025, 3, 25), 'EXPENSE', 'Fuel', 250),
+        ):
+            Transaction.objects.create(user=self.user, date=day, description=category, category=category,
+                                       transaction_type=transaction_type, amount=amount)
+
+    def test_summary_compares_with_the_previous_range(self):
+        summary = self.client.get(self.url).json()['summary']
+        self.assertEqual(
+            {key: summary[key] for key in ('total_income', 'total_expenses', 'net_balance', 'income_change', 'expense_change')},
+            {'total_income': 1500.0, 'total_expenses': 650.0, 'net_balance': 850.0,
+             'income_change': 87.5, 'expense_change': -62.5},
+        )
+        self.assertAlmostEqual(summary['savings_rate'], 56.6667, places=4)
+
+    def test_series_categories_and_recent_transactions(self):
+        data = self.client.get(self.url).json()
+        self.assertEqual(data['monthly_data'], {
+            'labels': ['Feb 2025', 'Mar 2025'], 'income': [1000.0, 500.0], 'expenses': [300.0, 350.0],
+        })
+        self.assertEqual((data['categories'], data['category_totals']), (['Fuel', 'Rent'], [350.0, 300.0]))
+        self.assertEqual(
+            [(row['date'], row['amount'], row['type']) for row in data['recent_transactions']],
+            [('2025-03-25', 250.0, 'expense'), ('2025-03-10', 100.0, 'expense'), ('2025-03-05', 500.0, 'income'),
+             ('2025-02-12', 300.0, 'expense'), ('2025-02-10', 1000.0, 'income')],
+        )
+
+    def test_query_count_header_only_in_debug(self):
+        self.assertNotIn('X-DB-Query-Count', self.client.get(self.url))
+        caches['analytics'].clear()
+        with override_settings(DEBUG=True), CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-DB-Query-Count'], str(len(queries)))
+
+    def test_response_is_cached_until_the_users_data_changes(self):
+        self.assertEqual(self.client.get(self.url).json()['summary']['total_income'], 1500.0)
+        # A queryset update sends no signals, so only the cache can explain a stale answer
+        Transaction.objects.filter(user=self.user, category='Consulting').update(amount=700)
+        rebuild_ledger_rollup()
+        Transaction.objects.create(user=User.objects.get(username='bystander'), date=date(2025, 3, 2),
+                                   description='Sale', category='Sales', transaction_type='INCOME', amount=50)
+        self.assertEqual(self.client.get(self.url).json()['summary']['total_income'], 1500.0)
+
+        Customer.objects.create(user=self.user, name='Asha')
+        self.assertEqual(self.client.get(self.url).json()['summary']['total_income'], 1700.0)
+
+
+class DataVersionETagTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('poller', password='x')
+        self.client.force_login(self.user)
+
+    def test_unchanged_poll_is_answered_with_304(self):
+        first = self.client.get('/api/customers/')
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first['Cache-Control'], 'private, no-cache')
+
+        with mock.patch('counto_app.views.CustomerSerializer') as serializer:
+            repeat = self.client.get('/api/customers/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual((repeat.status_code, repeat['ETag']), (304, first['ETag']))
+        serializer.assert_not_called()
+
+    def test_write_changes_the_tag(self):
+        etag = self.client.get('/api/customers/')['ETag']
+        self.client.post('/api/customers/', {'name': 'Asha'}, content_type='application/json')
+        response = self.client.get('/api/customers/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual([customer['name'] for customer in response.json()], ['Asha'])
+
+    def test_tag_depends_on_the_path_and_errors_are_not_tagged(self):
+        self.assertNotEqual(self.client.get('/api/customers/')['ETag'], self.client.get('/api/vendors/')['ETag'])
+        self.assertFalse(self.client.get('/api/customers/999/').has_header('ETag'))
+
+    def test_analytics_tag_changes_with_the_date(self):
+        etag = self.client.get('/api/analytics-data/')['ETag']
+        tomorrow = timezone.now() + timedelta(days=1)
+        with mock.patch('counto_app.etags.timezone.now', return_value=tomorrow):
+            self.assertNotEqual(
+                self.client.get('/api/analytics-data/', HTTP_IF_NONE_MATCH=etag).status_code, 304
+            )
@@ -1,7 +1,7 @@
 from django.urls import path
 from .views import (
-    ConversationView, MessageView, home, login_view, logout_view, 
-    register_view, dashboard, analytics, CustomerView, VendorView, TransactionView,
+    ConversationView, MessageView, MessageStreamView, home, login_view, logout_view, 
+    register_view, dashboard, analytics, CustomerView, VendorView, TransactionView, TransactionConfirmView,
     AnalyticsDataView, upload_document, financial_summary
 )
 
@@ -20,7 +20,8 @@ urlpatterns = [
     path('conversations/', ConversationView.as_view(), name='conversations'),
     path('conversations/<int:conversation_id>/messages/', MessageView.as_view(), name='conversation_messages'),
     path('messages/', MessageView.as_view(), name='messages'),
-    #path('transactions/confirm/', TransactionConfirmView.as_view(), name='confirm_transaction'),
+    path('messages/stream/', MessageStreamView.as_view(), name='messages-stream'),
+    path('transactions/confirm/', TransactionConfirmView.as_view(), name='confirm_transaction'),
     
     # Customer management
     path('api/customers/', CustomerView.as_view(), name='customer-list'),
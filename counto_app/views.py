@@ -2,10 +2,11 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
+from django.db import transaction as db_transaction
 from django.db.models import Sum, F, Q, Count, Avg, Max, Min
 from django.utils import timezone
 from django.db.models.functions import TruncMonth, TruncYear, TruncDay, TruncWeek
-from decimal import Decimal, InvalidOperation
+from decimal import Decimal
 from datetime import datetime, timedelta
 from typing import List, Dict, Any, Optional, Union
 import logging
@@ -13,13 +14,16 @@ import json
 import os # Already here, but good to confirm
 import uuid
 from django.conf import settings # Already here, but good to confirm
+from django.core.cache import caches
 
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, permissions
 from rest_framework.decorators import api_view, permission_classes
 
+from .etags import conditional_on_data_version
 from .models import Conversation, Message, Transaction, PendingTransaction, Customer, Vendor
+from .money import to_decimal
 from .serializers import (
     ConversationSerializer, 
     MessageSerializer, 
@@ -31,18 +35,37 @@ from .serializers import (
     VendorSerializer,
     TransactionCreateSerializer
 )
-from django.http import JsonResponse
-from .services.gemini_services import GeminiService
-from .services.sheets_services import GoogleSheetsService  # Re-enabled Google Sheets
+from django.http import JsonResponse, StreamingHttpResponse
+from .services.confirmations import open_pending, parse_confirmation, stage_pending, with_confirmation_question
+from .services.analytics_queries import ledger_report, ledger_totals, recent_transactions
+from .services.ledger_periods import legacy_range, parse_range
+from .services.conversation_history import load_history
+from .services.data_version import cache_key, data_version
+from .services.fast_path import confirmation_message, parse_transaction_message
+from .services.forecasting import forecast_for_user
+from .services.query_engine import answer_query
+from .services.registry import get_gemini_service, get_sheets_service, get_tally_service
+from .services.sync_outbox import enqueue_customer_sync, enqueue_transaction_sync, enqueue_vendor_sync
 
 # Create your views here.
 
 # create_sample_data function removed as it's now a management command.
 
+def _parse_date_param(value: Optional[str]):
+    """A YYYY-MM-DD query parameter as a date, or None if it is missing"""
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError(f"Invalid date '{value}', expected YYYY-MM-DD")
+
+
 class AnalyticsDataView(APIView):
     """API endpoint for fetching analytics data for different time periods"""
     permission_classes = [permissions.IsAuthenticated]
     
+    @conditional_on_data_version(dated=True)
     def get(self, request):
         # Sample data creation is now handled by the management command:
         # `python manage.py create_counto_sample_data <username>`
@@ -50,91 +73,38 @@ class AnalyticsDataView(APIView):
         # if not Transaction.objects.filter(user=request.user).exists():
         #     create_sample_data(request.user)
         
-        # Get time period from query parameters
-        period = request.query_params.get('period', 'month')
-        
-        # Calculate date range based on period
-        now = timezone.now().date()
-        
-        if period == 'month':
-            # Current month
-            start_date = now.replace(day=1)
-            end_date = now
-            prev_start = (start_date - timedelta(days=1)).replace(day=1)
-            prev_end = start_date - timedelta(days=1)
-            date_format = '%b %d'
-            trunc_func = TruncDay
-        elif period == 'last_month':
-            # Last month
-            start_date = (now.replace(day=1) - timedelta(days=1)).replace(day=1)
-            end_date = now.replace(day=1) - timedelta(days=1)
-            prev_start = (start_date - timedelta(days=31)).replace(day=1)
-            prev_end = start_date - timedelta(days=1)
-            date_format = '%b %d'
-            trunc_func = TruncDay
-        elif period == 'last_3_months':
-            # Last 3 months
-            start_date = (now.replace(day=1) - timedelta(days=90))
-            end_date = now
-            prev_start = (start_date - timedelta(days=90))
-            prev_end = start_date - timedelta(days=1)
-            date_format = '%b %Y'
-            trunc_func = TruncMonth
-        elif period == 'last_6_months':
-            # Last 6 months
-            start_date = (now.replace(day=1) - timedelta(days=180))
-            end_date = now
-            prev_start = (start_date - timedelta(days=180))
-            prev_end = start_date - timedelta(days=1)
-            date_format = '%b %Y'
-            trunc_func = TruncMonth
-        elif period == 'year':
-            # Current year
-            start_date = now.replace(month=1, day=1)
-            end_date = now
-            prev_start = start_date.replace(year=start_date.year-1)
-            prev_end = end_date.replace(year=end_date.year-1)
-            date_format = '%b %Y'
-            trunc_func = TruncMonth
-        else:
-            # Default to current month
-            start_date = now.replace(day=1)
-            end_date = now
-            prev_start = (start_date - timedelta(days=1)).replace(day=1)
-            prev_end = start_date - timedelta(days=1)
-            date_format = '%b %d'
-            trunc_func = TruncDay
-        
-        # Get transactions for the selected period
-        transactions = Transaction.objects.filter(
-            user=request.user,
-            date__gte=start_date,
-            date__lte=end_date
-        )
-        
-        # Get previous period transactions for comparison
-        prev_transactions = Transaction.objects.filter(
-            user=request.user,
-            date__gte=prev_start,
-            date__lte=prev_end
-        )
-        
-        # Calculate summary statistics
-        total_income = transactions.filter(transaction_type='INCOME').aggregate(Sum('amount'))['amount__sum'] or Decimal('0')
-        total_expenses = transactions.filter(transaction_type='EXPENSE').aggregate(Sum('amount'))['amount__sum'] or Decimal('0')
-        
-        prev_income = prev_transactions.filter(transaction_type='INCOME').aggregate(Sum('amount'))['amount__sum'] or Decimal('0')
-        prev_expenses = prev_transactions.filter(transaction_type='EXPENSE').aggregate(Sum('amount'))['amount__sum'] or Decimal('0')
-        
-        # Ensure consistent decimal types
-        if not isinstance(total_income, Decimal):
-            total_income = Decimal(str(total_income))
-        if not isinstance(total_expenses, Decimal):
-            total_expenses = Decimal(str(total_expenses))
-        if not isinstance(prev_income, Decimal):
-            prev_income = Decimal(str(prev_income))
-        if not isinstance(prev_expenses, Decimal):
-            prev_expenses = Decimal(str(prev_expenses))
+        # Explicit start/end/granularity parameters take precedence over the legacy period choices
+        today = timezone.now().date()
+        params = request.query_params
+        try:
+            if any(params.get(name) for name in ('start', 'end', 'granularity')):
+                report = parse_range(
+                    _parse_date_param(params.get('start')),
+                    _parse_date_param(params.get('end')),
+                    params.get('granularity') or None,
+                    today
+                )
+            else:
+                report = legacy_range(params.get('period', 'month'), today)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        start_date, end_date = report.start, report.end
+
+        # The whole response is cached until the user's data version moves on. Today is part
+        # of the key because overdue flags and open-ended ranges depend on the date.
+        version = getattr(request, 'data_version', None) or data_version(request.user)
+        key = cache_key('analytics', request.user, version, (today, *report))
+        analytics_cache = caches['analytics']
+        cached = analytics_cache.get(key)
+        if cached is not None:
+            return Response(cached)
+
+        # Totals for both periods, chart series and categories from the rollup tables
+        charts = ledger_report(request.user, report)
+        total_income = charts['total_income']
+        total_expenses = charts['total_expenses']
+        prev_income = charts['prev_income']
+        prev_expenses = charts['prev_expenses']
             
         net_balance = total_income - total_expenses
         prev_net_balance = prev_income - prev_expenses
@@ -146,40 +116,18 @@ class AnalyticsDataView(APIView):
         income_change = ((total_income - prev_income) / prev_income * Decimal('100')) if prev_income > 0 else Decimal('0')
         expense_change = ((prev_expenses - total_expenses) / prev_expenses * Decimal('100')) if prev_expenses > 0 else Decimal('0')
         
-        # Get time series data for charts
-        time_series = transactions.annotate(
-            period=trunc_func('date')
-        ).values('period', 'transaction_type').annotate(
-            total=Sum('amount')
-        ).order_by('period')
-        
-        # Prepare time series data for the chart
-        periods = sorted(set([item['period'] for item in time_series]))
-        
-        labels = [period.strftime(date_format) for period in periods]
-        income_data = [0] * len(periods)
-        expense_data = [0] * len(periods)
-        
-        for item in time_series:
-            period_index = periods.index(item['period'])
-            if item['transaction_type'] == 'INCOME':
-                income_data[period_index] = float(item['total'])
-            else:
-                expense_data[period_index] = float(item['total'])
-        
-        # Get expense categories
-        expense_categories = transactions.filter(
-            transaction_type='EXPENSE'
-        ).values('category').annotate(total=Sum('amount')).order_by('-total')
+        labels = charts['labels']
+        income_data = [float(total) for total in charts['income']]
+        expense_data = [float(total) for total in charts['expenses']]
         
         # Prepare category data for the chart
         categories = []
         category_totals = []
         
-        for cat in expense_categories:
-            if cat['category'] and cat['total'] > 0:
-                categories.append(cat['category'])
-                category_totals.append(float(cat['total']))
+        for category, total in charts['categories']:
+            if total > 0:
+                categories.append(category)
+                category_totals.append(float(total))
         
         # Define category colors
         category_colors = [
@@ -187,17 +135,14 @@ class AnalyticsDataView(APIView):
             '#5a5c69', '#3a3b45', '#1cc88a', '#36b9cc', '#f6c23e', '#e74a3b'
         ]
         
-        # Get recent transactions
-        recent_transactions = transactions.order_by('-date')[:5]
-        
         # Serialize recent transactions
         recent_transactions_data = [{
-            'date': transaction.date.strftime('%Y-%m-%d'),
-            'description': transaction.description,
-            'category': transaction.category,
-            'amount': float(transaction.amount),
-            'type': transaction.transaction_type.lower()
-        } for transaction in recent_transactions]
+            'date': transaction['date'].strftime('%Y-%m-%d'),
+            'description': transaction['description'],
+            'category': transaction['category'],
+            'amount': float(transaction['amount']),
+            'type': transaction['transaction_type'].lower()
+        } for transaction in recent_transactions(request.user, start_date, end_date)]
         
         # Prepare response data
         response_data = {
@@ -217,59 +162,50 @@ class AnalyticsDataView(APIView):
             'categories': categories,
             'category_totals': category_totals,
             'category_colors': category_colors[:len(categories)],
-            'recent_transactions': recent_transactions_data
+            'recent_transactions': recent_transactions_data,
+            'range': {
+                'start': start_date.isoformat(),
+                'end': end_date.isoformat(),
+                'granularity': report.granularity
+            }
         }
 
-        # Customer Data - Top 5 by outstanding balance
-        customers_query = Customer.objects.filter(user=request.user, is_active=True)
-        # Order by outstanding_balance. Since outstanding_balance is a property,
-        # we might need to fetch all and sort in Python, or use annotation if it were a direct DB field.
-        # For now, let's fetch all and sort, then limit.
-        all_customers = list(customers_query)
-        # Sort by outstanding_balance in descending order
-        all_customers.sort(key=lambda c: (c.outstanding_balance or Decimal('0')), reverse=True)
+        # Customer Data - Top 5 by outstanding balance, ordered and limited in the database
+        top_customers = Customer.objects.filter(
+            user=request.user, is_active=True
+        ).with_overdue().top_outstanding(5)
         
         customer_data_list = []
-        for customer in all_customers[:5]: # Limit to top 5
+        for customer in top_customers:
             customer_data_list.append({
                 'name': customer.name,
                 'total_receivable': float(customer.total_receivable or 0),
                 'total_received': float(customer.total_received or 0),
-                'outstanding_balance': float(customer.outstanding_balance or 0),
-                'is_overdue': customer.is_overdue 
+                'outstanding_balance': float(customer.outstanding or 0),
+                'is_overdue': customer.has_overdue
             })
         response_data['customer_data'] = customer_data_list
 
         # Vendor Data - Top 5 by outstanding balance
-        vendors_query = Vendor.objects.filter(user=request.user, is_active=True)
-        all_vendors = list(vendors_query)
-        # Sort by outstanding_balance (property) in descending order
-        all_vendors.sort(key=lambda v: (v.outstanding_balance or Decimal('0')), reverse=True)
+        top_vendors = Vendor.objects.filter(
+            user=request.user, is_active=True
+        ).with_overdue().top_outstanding(5)
 
         vendor_data_list = []
-        for vendor in all_vendors[:5]: # Limit to top 5
+        for vendor in top_vendors:
             vendor_data_list.append({
                 'name': vendor.name,
                 'total_payable': float(vendor.total_payable or 0),
                 'total_paid': float(vendor.total_paid or 0),
-                'outstanding_balance': float(vendor.outstanding_balance or 0),
-                'is_overdue': False # Placeholder as Vendor model does not have is_overdue
+                'outstanding_balance': float(vendor.outstanding or 0),
+                'is_overdue': vendor.has_overdue
             })
         response_data['vendor_data'] = vendor_data_list
 
-        # Cash Flow Forecast Data (Placeholder)
-        response_data['cash_flow_forecast'] = {
-            'labels': ['Current', 'Next Month', 'In 2 Months', 'In 3 Months'],
-            'income': [float(total_income), float(total_income * Decimal('1.1')), float(total_income * Decimal('1.15')), float(total_income * Decimal('1.2'))], # Dummy projection
-            'expenses': [float(total_expenses), float(total_expenses * Decimal('1.05')), float(total_expenses * Decimal('1.1')), float(total_expenses * Decimal('1.12'))], # Dummy projection
-            'balance': [
-                float(total_income - total_expenses),
-                float((total_income * Decimal('1.1')) - (total_expenses * Decimal('1.05'))),
-                float((total_income * Decimal('1.15')) - (total_expenses * Decimal('1.1'))),
-                float((total_income * Decimal('1.2')) - (total_expenses * Decimal('1.12')))
-            ]
-        }
+        # Cash flow forecast: last 30 days, then projected 30-day windows
+        response_data['cash_flow_forecast'] = forecast_for_user(request.user, today)
         
+        analytics_cache.set(key, response_data)
         return Response(response_data)
 def home(request):
     """Home page view"""
@@ -464,23 +400,14 @@ class MessageView(APIView):
     
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.gemini_service = GeminiService()
-        # Re-enabled Google Sheets with improved error handling
-        try:
-            self.sheets_service = GoogleSheetsService()
-            self.sheets_enabled = True
-        except Exception as e:
-            logging.error(f"Failed to initialize Google Sheets: {str(e)}")
-            self.sheets_enabled = False
+        # Clients are shared per worker process; see services.registry
+        self.gemini_service = get_gemini_service()
+        self.sheets_service = get_sheets_service()
+        self.sheets_enabled = self.sheets_service is not None
         
         # Initialize Tally Integration
-        try:
-            from .tally.tally_integration import TallyIntegrationService
-            self.tally_service = TallyIntegrationService()
-            self.tally_enabled = True
-        except Exception as e:
-            logging.error(f"Failed to initialize Tally Integration: {str(e)}")
-            self.tally_enabled = False
+        self.tally_service = get_tally_service()
+        self.tally_enabled = self.tally_service is not None
     
     def get(self, request, conversation_id):
         """Get all messages for a specific conversation"""
@@ -492,99 +419,52 @@ class MessageView(APIView):
     def post(self, request):
         """Process a new message from the user"""
         try:
-            # Get or create conversation
-            conversation_id = request.data.get('conversation_id')
-            if conversation_id:
-                conversation = get_object_or_404(Conversation, id=conversation_id, user=request.user)
-            else:
-                conversation = Conversation.objects.create(user=request.user)
+            conversation, user_message, history, history_summary = self._start_turn(request)
             
-            # Store conversation in the instance for use in handler methods
-            self.current_conversation = conversation
-            
-            # Save user message
-            user_message = request.data.get('content', '')
-            Message.objects.create(
-                conversation=conversation,
-                sender='USER',
-                content=user_message
-            )
+            # "yes"/"no" replies to a pending proposal are resolved without calling Gemini
+            confirmation = self._resolve_confirmation(request.user, conversation, user_message)
+            if confirmation is not None:
+                ai_response, intent_type = confirmation
+                return Response({
+                    'conversation_id': conversation.id,
+                    'message': ai_response,
+                    'intent_type': intent_type
+                })
             
-            # Get conversation history
-            history = Message.objects.filter(conversation=conversation).values('sender', 'content')
+            # Aggregate questions are answered from the database without calling Gemini
+            local_answer = self._answer_locally(request.user, conversation, user_message)
+            if local_answer is not None:
+                return Response({
+                    'conversation_id': conversation.id,
+                    'message': local_answer,
+                    'intent_type': 'QUERY_TRANSACTION'
+                })
             
-            # Process message through Gemini
-            try:
-                ai_response, extracted_data, intent_type, is_query = self.gemini_service.process_message(
-                    user_message, 
-                    list(history)
-                )
-                
-                # For UNKNOWN intents, return the AI response directly
-                if intent_type == 'UNKNOWN':
+            # Simple transactions are parsed locally; everything else goes through Gemini
+            result = self._fast_path(user_message)
+            if result is None:
+                try:
+                    result = self.gemini_service.process_message(
+                        user_message, 
+                        history,
+                        history_summary,
+                        user=request.user
+                    )
+                except Exception as e:
+                    logging.error(f"Gemini API error: {str(e)}")
                     return Response({
-                        'conversation_id': conversation.id,
-                        'message': ai_response,
-                        'intent_type': 'GENERAL_RESPONSE'
-                    })
-                    
-                # Convert intent_type to the expected format for known intents
-                if is_query:
-                    intent_type = f'QUERY_{intent_type}'
-                else:
-                    intent_type = f'DATA_ENTRY_{intent_type}'
-            except Exception as e:
-                logging.error(f"Gemini API error: {str(e)}")
-                return Response({
-                    'error': 'Error processing message with AI service',
-                    'detail': str(e)
-                }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+                        'error': 'Error processing message with AI service',
+                        'detail': str(e)
+                    }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            ai_response, extracted_data, intent_type, is_query = result
 
-            # Handle different entity types based on intent
-            try:
-                if intent_type.startswith('DATA_ENTRY_'):
-                    if intent_type == 'DATA_ENTRY_TRANSACTION':
-                        ai_response = self._handle_transaction_data(request.user, extracted_data, ai_response)
-                    elif intent_type == 'DATA_ENTRY_CUSTOMER':
-                        ai_response = self._handle_customer_data(request.user, extracted_data, ai_response)
-                    elif intent_type == 'DATA_ENTRY_VENDOR':
-                        ai_response = self._handle_vendor_data(request.user, extracted_data, ai_response)
-                    else:
-                        logging.warning(f"Unhandled data entry type: {intent_type}")
-                elif intent_type.startswith('QUERY_'):
-                    if intent_type == 'QUERY_TRANSACTION':
-                        ai_response = self._handle_transaction_query(extracted_data, ai_response)
-                    elif intent_type == 'QUERY_CUSTOMER':
-                        ai_response = self._handle_customer_query(extracted_data, ai_response)
-                    elif intent_type == 'QUERY_VENDOR':
-                        ai_response = self._handle_vendor_query(extracted_data, ai_response)
-                    else:
-                        logging.warning(f"Unhandled query type: {intent_type}")
-                else:
-                    logging.warning(f"Unknown intent type: {intent_type}")
-            except Exception as e:
-                error_msg = f"Error handling {intent_type}: {str(e)}"
-                logging.error(error_msg, exc_info=True)
-                ai_response = f"{ai_response}\n\n⚠️ {error_msg}"
-                # If we have a critical error, return a clean error message
-                if not ai_response.strip():
-                    ai_response = f"Sorry, there was an error processing your {intent_type.replace('_', ' ').lower()} request."
-
-            # Save AI response
-            Message.objects.create(
-                conversation=conversation,
-                sender='AI',
-                content=ai_response
+            ai_response, intent_type = self._complete_turn(
+                request.user, conversation, ai_response, extracted_data, intent_type, is_query
             )
-
-            # Update conversation
-            conversation.updated_at = timezone.now()
-            conversation.save()
-
             return Response({
                 'conversation_id': conversation.id,
                 'message': ai_response,
-                'intent_type': intent_type if 'intent_type' in locals() else None
+                'intent_type': intent_type
             })
 
         except Exception as e:
@@ -594,6 +474,174 @@ class MessageView(APIView):
                 'detail': str(e)
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    def _start_turn(self, request):
+        """Resolve the conversation, load its recent history and save the user's message"""
+        # Get or create conversation
+        conversation_id = request.data.get('conversation_id')
+        if conversation_id:
+            conversation = get_object_or_404(Conversation, id=conversation_id, user=request.user)
+        else:
+            conversation = Conversation.objects.create(user=request.user)
+        
+        # Store conversation in the instance for use in handler methods
+        self.current_conversation = conversation
+        
+        # Get the bounded conversation history before adding this message
+        history_summary, history = load_history(conversation)
+        
+        # Save user message
+        user_message = request.data.get('content', '')
+        Message.objects.create(
+            conversation=conversation,
+            sender='USER',
+            content=user_message
+        )
+        
+        return conversation, user_message, history, history_summary
+
+    def _complete_turn(self, user, conversation, ai_response, extracted_data, intent_type, is_query):
+        """
+        Act on the parsed AI response and persist the reply
+
+        Returns the final response text and the intent type reported to the client.
+        """
+        # For UNKNOWN intents, return the AI response directly
+        if intent_type == 'UNKNOWN':
+            return ai_response, 'GENERAL_RESPONSE'
+            
+        # Convert intent_type to the expected format for known intents
+        if is_query:
+            intent_type = f'QUERY_{intent_type}'
+        else:
+            intent_type = f'DATA_ENTRY_{intent_type}'
+
+        # Handle different entity types based on intent
+        try:
+            if intent_type.startswith('DATA_ENTRY_'):
+                entity = intent_type[len('DATA_ENTRY_'):]
+                if entity in self.DATA_ENTRY_HANDLERS:
+                    # Nothing is written until the user confirms; see _resolve_confirmation
+                    stage_pending(user, conversation, entity, extracted_data)
+                    ai_response = with_confirmation_question(entity, ai_response)
+                else:
+                    logging.warning(f"Unhandled data entry type: {intent_type}")
+            elif intent_type.startswith('QUERY_'):
+                if intent_type == 'QUERY_TRANSACTION':
+                    ai_response = self._handle_transaction_query(extracted_data, ai_response)
+                elif intent_type == 'QUERY_CUSTOMER':
+                    ai_response = self._handle_customer_query(extracted_data, ai_response)
+                elif intent_type == 'QUERY_VENDOR':
+                    ai_response = self._handle_vendor_query(extracted_data, ai_response)
+                else:
+                    logging.warning(f"Unhandled query type: {intent_type}")
+            else:
+                logging.warning(f"Unknown intent type: {intent_type}")
+        except Exception as e:
+            error_msg = f"Error handling {intent_type}: {str(e)}"
+            logging.error(error_msg, exc_info=True)
+            ai_response = f"{ai_response}\n\n⚠️ {error_msg}"
+            # If we have a critical error, return a clean error message
+            if not ai_response.strip():
+                ai_response = f"Sorry, there was an error processing your {intent_type.replace('_', ' ').lower()} request."
+
+        self._save_reply(conversation, ai_response)
+        return ai_response, intent_type
+
+    # Handlers that commit a confirmed data entry, by entity
+    DATA_ENTRY_HANDLERS = {
+        'TRANSACTION': '_handle_transaction_data',
+        'CUSTOMER': '_handle_customer_data',
+        'VENDOR': '_handle_vendor_data',
+    }
+
+    def _resolve_confirmation(self, user, conversation, user_message):
+        """
+        Commit or discard the conversation's pending proposal on a "yes" or "no" reply
+
+        Returns (response, intent_type), or None if the message is not a confirmation
+        or nothing is waiting to be confirmed.
+        """
+        answer = parse_confirmation(user_message)
+        if answer is None:
+            return None
+        pending = open_pending(conversation)
+        if pending is None:
+            return None
+        return self._settle_pending(user, conversation, pending, answer)
+
+    def _settle_pending(self, user, conversation, pending, answer):
+        """
+        Commit (answer True) or discard a pending proposal and save the reply
+
+        Returns (response, intent_type), or None if the proposal could not be
+        settled because its intent is unknown or it was already committed.
+        """
+        entity = pending.raw_data.get('intent')
+        extracted_data = pending.raw_data.get('extracted_data') or {}
+        handler = self.DATA_ENTRY_HANDLERS.get(entity)
+        if handler is None:
+            logging.warning(f"Discarding pending entry {pending.id} with unknown intent {entity}")
+            pending.delete()
+            return None
+
+        if not answer:
+            pending.delete()
+            ai_response = f"👍 Okay, I won't record this {entity.lower()}."
+            intent_type = f'{entity}_CANCELLED'
+        else:
+            try:
+                with db_transaction.atomic():
+                    # Lock the proposal so a repeated "yes" cannot record it twice
+                    locked = PendingTransaction.objects.select_for_update().filter(id=pending.id).first()
+                    if locked is None:
+                        return None
+                    ai_response = getattr(self, handler)(user, extracted_data, "")
+                    locked.delete()
+            except Exception as e:
+                logging.error(f"Error committing pending {entity.lower()}: {str(e)}", exc_info=True)
+                ai_response = f"Sorry, there was an error recording your {entity.lower()}: {str(e)}"
+            intent_type = f'{entity}_CONFIRMED'
+
+        ai_response = ai_response.strip()
+        self._save_reply(conversation, ai_response)
+        return ai_response, intent_type
+
+    def _answer_locally(self, user, conversation, user_message):
+        """Answer aggregate transaction questions with a database query; returns None if not recognised"""
+        try:
+            answer = answer_query(user, user_message)
+        except Exception as e:
+            logging.error(f"Local query engine failed: {str(e)}", exc_info=True)
+            return None
+        if answer is None:
+            return None
+
+        self._save_reply(conversation, answer.text)
+        return answer.text
+
+    def _fast_path(self, user_message):
+        """Parse a simple transaction message locally, in the same shape process_message returns"""
+        try:
+            extracted_data = parse_transaction_message(user_message)
+        except Exception as e:
+            logging.error(f"Fast path parser failed: {str(e)}", exc_info=True)
+            return None
+        if extracted_data is None:
+            return None
+        return confirmation_message(extracted_data), extracted_data, 'TRANSACTION', False
+
+    def _save_reply(self, conversation, ai_response):
+        """Save the AI response and bump the conversation"""
+        Message.objects.create(
+            conversation=conversation,
+            sender='AI',
+            content=ai_response
+        )
+
+        # Update conversation
+        conversation.updated_at = timezone.now()
+        conversation.save()
+
     def _handle_transaction_data(self, user, extracted_data, ai_response):
         """Process and save transaction data"""
         # Handle date conversion
@@ -627,210 +675,101 @@ class MessageView(APIView):
         customer_name = extracted_data.get('customer')
         vendor_name = extracted_data.get('vendor')
         
-        # For INCOME transactions, handle customer reference
-        if transaction_type == 'INCOME' and customer_name:
-            try:
-                customer = Customer.objects.get(user=user, name=customer_name)
-            except Customer.DoesNotExist:
-                customer = Customer.objects.create(
-                    user=user,
-                    name=customer_name,
-                    email=extracted_data.get('customer_email', ''),
-                    phone=extracted_data.get('customer_phone', ''),
-                    gst_number=extracted_data.get('customer_gst', ''),
-                    address=extracted_data.get('customer_address', '')
-                )
-        
-        # For EXPENSE transactions, handle vendor reference
-        if transaction_type == 'EXPENSE' and vendor_name:
-            try:
-                vendor = Vendor.objects.get(user=user, name=vendor_name)
-            except Vendor.DoesNotExist:
-                vendor = Vendor.objects.create(
-                    user=user,
-                    name=vendor_name,
-                    email=extracted_data.get('vendor_email', ''),
-                    phone=extracted_data.get('vendor_phone', ''),
-                    gst_number=extracted_data.get('vendor_gst', ''),
-                    address=extracted_data.get('vendor_address', '')
-                )
-
-        # Create transaction record based on new Transaction model
-        transaction = Transaction.objects.create(
-            user=user,
-            date=transaction_date,
-            description=extracted_data.get('description', ''),
-            category=extracted_data.get('category', ''),
-            transaction_type=transaction_type,
-            amount=amount,
-            customer=customer,
-            vendor=vendor,
-            payment_method=extracted_data.get('payment_method', ''),
-            reference_number=extracted_data.get('reference_number', ''),
-            notes=extracted_data.get('notes', '')
-        )
+        sync_queued = False
         
-        # Update customer/vendor balances using Decimal for precision
-        if transaction_type == 'INCOME' and customer:
-            # Ensure total_receivable is a Decimal before adding amount
-            if customer.total_receivable is None:
-                customer.total_receivable = Decimal('0.00')
-            elif not isinstance(customer.total_receivable, Decimal):
-                customer.total_receivable = Decimal(str(customer.total_receivable))
-                
-            customer.total_receivable = (customer.total_receivable + amount).quantize(Decimal('0.00'))
-            # outstanding_balance is a read-only property, no need to set it
-            customer.save()
-        elif transaction_type == 'EXPENSE' and vendor:
-            # Ensure total_payable is a Decimal before adding amount
-            if vendor.total_payable is None:
-                vendor.total_payable = Decimal('0.00')
-            elif not isinstance(vendor.total_payable, Decimal):
-                vendor.total_payable = Decimal(str(vendor.total_payable))
-                
-            vendor.total_payable = (vendor.total_payable + amount).quantize(Decimal('0.00'))
-            # outstanding_balance is a read-only property, no need to set it
-            vendor.save()
-
-        # Create a pending transaction for reference (if needed)
-        pending_transaction = PendingTransaction.objects.create(
-            user=user,
-            conversation=self.current_conversation,  # Use the stored conversation
-            date=transaction_date,
-            description=transaction.description,
-            category=transaction.category,
-            amount=transaction.amount,
-            transaction_type=transaction.transaction_type,
-            payment_method=transaction.payment_method,
-            reference_number=transaction.reference_number,
-            party=customer_name if transaction_type == 'INCOME' else vendor_name
-        )
-
-        # Update AI response
-        if "Would you like me to record this transaction?" in ai_response:
-            ai_response = ai_response.split("Would you like me to record this transaction?")[0]
-            
-            # Prepare transaction details for the response
-            transaction_type = 'Income' if transaction.transaction_type == 'INCOME' else 'Expense'
-            party = customer.name if customer else vendor.name if vendor else 'N/A'
-            
-            # Sync with Tally if enabled
-            tally_success = False
-            tally_error = None
-            if self.tally_enabled:
+        # The transaction, balance updates and outbox entries are committed together
+        with db_transaction.atomic():
+            # For INCOME transactions, handle customer reference
+            if transaction_type == 'INCOME' and customer_name:
                 try:
-                    if transaction.transaction_type == 'INCOME' and customer:
-                        # Sync customer to Tally
-                        result = self.tally_service.sync_customer_to_ledger(customer)
-                        if result.get('success'):
-                            # Sync sales transaction
-                            result = self.tally_service.sync_sales_transaction(transaction)
-                            if result.get('success'):
-                                tally_success = True
-                            else:
-                                tally_error = result.get('error', 'Unknown error syncing transaction to Tally')
-                        else:
-                            tally_error = result.get('error', 'Unknown error syncing customer to Tally')
-                    elif transaction.transaction_type == 'EXPENSE' and vendor:
-                        # Sync vendor to Tally
-                        result = self.tally_service.sync_vendor_to_ledger(vendor)
-                        if result.get('success'):
-                            # Sync purchase transaction
-                            result = self.tally_service.sync_purchase_transaction(transaction)
-                            if result.get('success'):
-                                tally_success = True
-                            else:
-                                tally_error = result.get('error', 'Unknown error syncing transaction to Tally')
-                        else:
-                            tally_error = result.get('error', 'Unknown error syncing vendor to Tally')
-                except Exception as e:
-                    tally_error = str(e)
-                    logging.error(f"Tally sync failed: {tally_error}")
+                    customer = Customer.objects.get(user=user, name=customer_name)
+                except Customer.DoesNotExist:
+                    customer = Customer.objects.create(
+                        user=user,
+                        name=customer_name,
+                        email=extracted_data.get('customer_email', ''),
+                        phone=extracted_data.get('customer_phone', ''),
+                        gst_number=extracted_data.get('customer_gst', ''),
+                        address=extracted_data.get('customer_address', '')
+                    )
             
-            ai_response += f"\n\n✅ {transaction_type} of ₹{amount:,.2f} "
-            ai_response += f"for {party} has been recorded!\n"
-            
-            # Add Tally sync status to response
-            if self.tally_enabled:
-                if tally_success:
-                    ai_response += "\n🔄 Transaction synced with Tally."
-                elif tally_error:
-                    ai_response += f"\n⚠️ Tally sync failed: {tally_error}"
-                else:
-                    ai_response += "\nℹ️ Tally sync not applicable for this transaction."
-            
-            # Add financial summary for customer/vendor
-            if customer:
-                ai_response += f"\n💳 Customer Balance Update for {customer.name}:"
-                ai_response += f"\n• Total Receivable: ₹{customer.total_receivable:,.2f}"
-                ai_response += f"\n• Total Received: ₹{customer.total_received:,.2f}"
-                ai_response += f"\n• Outstanding Balance: ₹{customer.outstanding_balance:,.2f}"
-            elif vendor:
-                ai_response += f"\n💳 Vendor Balance Update for {vendor.name}:"
-                ai_response += f"\n• Total Payable: ₹{vendor.total_payable:,.2f}"
-                ai_response += f"\n• Total Paid: ₹{vendor.total_paid:,.2f}"
-                ai_response += f"\n• Outstanding Balance: ₹{vendor.outstanding_balance:,.2f}"
-            
-            # Sync with Google Sheets
-            sheets_success = False
-            sheets_error = None
-            if self.sheets_enabled:
+            # For EXPENSE transactions, handle vendor reference
+            if transaction_type == 'EXPENSE' and vendor_name:
                 try:
-                    # Sync transaction
-                    sheets_data = {
-                        'date': transaction_date,
-                        'description': transaction.description,
-                        'category': transaction.category,
-                        'transaction_type': transaction.transaction_type,
-                        'amount': float(str(amount)),  # Convert Decimal to string then to float
-                        'payment_method': transaction.payment_method or '',
-                        'reference_number': transaction.reference_number or '',
-                        'customer': customer.name if customer else '',
-                        'vendor': vendor.name if vendor else '',
-                        'notes': transaction.notes or ''
-                    }
-                    sheets_success = self.sheets_service.add_transaction(sheets_data)
-                    
-                    # Update customer/vendor in Google Sheets if this is a new transaction
-                    if customer:
-                        customer_sheets_data = {
-                            'name': customer.name,
-                            'email': customer.email or '',
-                            'phone': customer.phone or '',
-                            'gst_number': customer.gst_number or '',
-                            'address': customer.address or '',
-                            'total_receivable': float(str(customer.total_receivable or '0')),
-                            'total_received': float(str(customer.total_received or '0')),
-                            'outstanding_balance': float(str(customer.outstanding_balance or '0'))
-                        }
-                        self.sheets_service.add_customer(customer_sheets_data)
-                    elif vendor:
-                        vendor_sheets_data = {
-                            'name': vendor.name,
-                            'email': vendor.email or '',
-                            'phone': vendor.phone or '',
-                            'gst_number': vendor.gst_number or '',
-                            'address': vendor.address or '',
-                            'total_payable': float(str(vendor.total_payable or '0')),
-                            'total_paid': float(str(vendor.total_paid or '0')),
-                            'outstanding_balance': float(str(vendor.outstanding_balance or '0'))
-                        }
-                        self.sheets_service.add_vendor(vendor_sheets_data)
-                        
-                except Exception as e:
-                    sheets_error = str(e)
-                    logging.error(f"Google Sheets sync failed: {sheets_error}")
+                    vendor = Vendor.objects.get(user=user, name=vendor_name)
+                except Vendor.DoesNotExist:
+                    vendor = Vendor.objects.create(
+                        user=user,
+                        name=vendor_name,
+                        email=extracted_data.get('vendor_email', ''),
+                        phone=extracted_data.get('vendor_phone', ''),
+                        gst_number=extracted_data.get('vendor_gst', ''),
+                        address=extracted_data.get('vendor_address', '')
+                    )
+
+            # Create transaction record based on new Transaction model
+            transaction = Transaction.objects.create(
+                user=user,
+                date=transaction_date,
+                description=extracted_data.get('description', ''),
+                category=extracted_data.get('category', ''),
+                transaction_type=transaction_type,
+                amount=amount,
+                customer=customer,
+                vendor=vendor,
+                payment_method=extracted_data.get('payment_method', ''),
+                reference_number=extracted_data.get('reference_number', ''),
+                notes=extracted_data.get('notes', '')
+            )
+            
+            # Balance fields are MoneyFields holding two-place Decimals, so the sum is exact
+            if transaction_type == 'INCOME' and customer:
+                customer.total_receivable += amount
+                customer.save()
+            elif transaction_type == 'EXPENSE' and vendor:
+                vendor.total_payable += amount
+                vendor.save()
+
+            # Queue Tally and Google Sheets sync for the outbox worker
+            if self.tally_enabled or self.sheets_enabled:
+                sync_queued = bool(enqueue_transaction_sync(
+                    transaction, tally=self.tally_enabled, sheets=self.sheets_enabled
+                ))
+
+        # Update AI response
+        ai_response = ai_response.split("Would you like me to record this transaction?")[0]
+        
+        # Prepare transaction details for the response
+        transaction_type = 'Income' if transaction.transaction_type == 'INCOME' else 'Expense'
+        party = customer.name if customer else vendor.name if vendor else 'N/A'
+        
+        ai_response += f"\n\n✅ {transaction_type} of ₹{amount:,.2f} "
+        ai_response += f"for {party} has been recorded!\n"
+        
+        # Add financial summary for customer/vendor
+        if customer:
+            ai_response += f"\n💳 Customer Balance Update for {customer.name}:"
+            ai_response += f"\n• Total Receivable: ₹{customer.total_receivable:,.2f}"
+            ai_response += f"\n• Total Received: ₹{customer.total_received:,.2f}"
+            ai_response += f"\n• Outstanding Balance: ₹{customer.outstanding_balance:,.2f}"
+        elif vendor:
+            ai_response += f"\n💳 Vendor Balance Update for {vendor.name}:"
+            ai_response += f"\n• Total Payable: ₹{vendor.total_payable:,.2f}"
+            ai_response += f"\n• Total Paid: ₹{vendor.total_paid:,.2f}"
+            ai_response += f"\n• Outstanding Balance: ₹{vendor.outstanding_balance:,.2f}"
+        
+        # Add sync status to response
+        ai_response += self._sync_status_message(sync_queued)
             
-            # Add sync status to response
-            if sheets_success:
-                ai_response += "\n\n📊 Data synced with Google Sheets."
-            elif sheets_error:
-                ai_response += f"\n\n⚠️ Note: Google Sheets sync failed ({sheets_error})"
-            else:
-                ai_response += "\n\n💾 Data saved locally (Google Sheets not configured)."
-                
         return ai_response
 
+    def _sync_status_message(self, sync_queued):
+        """Describe the queued outbox sync for the chat reply"""
+        if not sync_queued:
+            return "\n\n💾 Data saved locally (Google Sheets not configured)."
+        targets = [name for name, enabled in (("Tally", self.tally_enabled), ("Google Sheets", self.sheets_enabled)) if enabled]
+        return f"\n\n🕒 Sync with {' and '.join(targets)} queued."
+
     def _handle_customer_data(self, user, extracted_data, ai_response):
         """Process and save customer data"""
         # Extract customer data
@@ -842,87 +781,33 @@ class MessageView(APIView):
             'address': extracted_data.get('address', '')
         }
 
-        # Check if customer already exists
-        existing_customer = None
-        try:
-            existing_customer = Customer.objects.get(user=user, name=customer_data['name'])
-        except Customer.DoesNotExist:
-            pass
-
-        if existing_customer:
-            # Update existing customer
-            for key, value in customer_data.items():
-                if value:  # Only update non-empty fields
-                    setattr(existing_customer, key, value)
-            existing_customer.save()
-            customer = existing_customer
-            operation = "updated"
-        else:
-            # Create new customer using the updated Customer model
-            customer = Customer.objects.create(user=user, **customer_data)
-            operation = "created"
-
-        # Sync with Google Sheets
-        sheets_success = False
-        sheets_error = None
-        if self.sheets_enabled:
-            try:
-                # Include financial data for Google Sheets
-                sheets_data = {
-                    'name': customer.name,
-                    'email': customer.email or '',
-                    'phone': customer.phone or '',
-                    'gst_number': customer.gst_number or '',
-                    'address': customer.address or '',
-                    'total_receivable': float(customer.total_receivable or 0),
-                    'total_received': float(customer.total_received or 0),
-                    'outstanding_balance': float(customer.outstanding_balance or 0),
-                    'created_at': customer.created_at.strftime('%Y-%m-%d %H:%M:%S') if customer.created_at else ''
-                }
-                sheets_success = self.sheets_service.add_customer(sheets_data)
-            except Exception as e:
-                sheets_error = str(e)
-                logging.error(f"Google Sheets sync failed: {sheets_error}")
-        
-        # Sync with Tally
-        tally_success = False
-        tally_error = None
-        if self.tally_enabled:
+        with db_transaction.atomic():
+            # Check if customer already exists
+            existing_customer = None
             try:
-                result = self.tally_service.sync_customer_to_ledger(customer)
-                if result.get('success'):
-                    tally_success = True
-                else:
-                    tally_error = result.get('error', 'Unknown error syncing to Tally')
-            except Exception as e:
-                tally_error = str(e)
-                logging.error(f"Tally sync failed: {tally_error}")
-        
-        # Update response with sync status
-        sync_status = []
-        if sheets_success:
-            sync_status.append("Google Sheets")
-        elif sheets_error:
-            sync_status.append(f"Google Sheets sync failed: {sheets_error}")
-            
-        if self.tally_enabled:
-            if tally_success:
-                sync_status.append("Tally")
-            elif tally_error:
-                sync_status.append(f"Tally sync failed: {tally_error}")
-        
-        if sync_status:
-            sync_status_str = ", ".join(sync_status)
-            ai_response = f"✅ Customer {operation} successfully and synced with {sync_status_str}!"
-        else:
-            ai_response = f"✅ Customer {operation} successfully! (No sync services configured)"
-                
-        # Update AI response with financial summary if this is an update
-        if operation == "updated":
-            ai_response += f"\n\n💵 Financial Summary for {customer.name}:"
-            ai_response += f"\n• Total Receivable: ₹{customer.total_receivable:,.2f}"
-            ai_response += f"\n• Total Received: ₹{customer.total_received:,.2f}"
-            ai_response += f"\n• Outstanding Balance: ₹{customer.outstanding_balance:,.2f}"
+                existing_customer = Customer.objects.get(user=user, name=customer_data['name'])
+            except Customer.DoesNotExist:
+                pass
+
+            if existing_customer:
+                # Update existing customer
+                for key, value in customer_data.items():
+                    if value:  # Only update non-empty fields
+                        setattr(existing_customer, key, value)
+                existing_customer.save()
+                customer = existing_customer
+                operation = "updated"
+            else:
+                # Create new customer using the updated Customer model
+                customer = Customer.objects.create(user=user, **customer_data)
+                operation = "created"
+
+            # Queue Google Sheets and Tally sync for the outbox worker
+            sync_queued = False
+            if self.sheets_enabled or self.tally_enabled:
+                sync_queued = bool(enqueue_customer_sync(
+                    customer, tally=self.tally_enabled, sheets=self.sheets_enabled
+                ))
 
         # Update AI response with operation result
         ai_response = f"✅ Customer '{customer.name}' {operation} successfully!\n"
@@ -943,12 +828,7 @@ class MessageView(APIView):
         ai_response += f"\n• Outstanding Balance: ₹{customer.outstanding_balance:,.2f}"
         
         # Add sync status
-        if sheets_success:
-            ai_response += "\n\n📊 Data synced with Google Sheets."
-        elif sheets_error:
-            ai_response += f"\n\n⚠️ Note: Google Sheets sync failed ({sheets_error})"
-        else:
-            ai_response += "\n\n💾 Data saved locally (Google Sheets not configured)."
+        ai_response += self._sync_status_message(sync_queued)
             
         # Add helpful next steps
         ai_response += "\n\n💡 You can now record transactions for this customer or view their transaction history."
@@ -965,103 +845,34 @@ class MessageView(APIView):
             'gst_number': extracted_data.get('gst_number', ''),
             'address': extracted_data.get('address', '')
         }
-        
-        # Sync with Tally if enabled
-        tally_success = False
-        tally_error = None
-        if self.tally_enabled and vendor_data['name']:
-            try:
-                # Create a temporary vendor object for Tally sync
-                from .models import Vendor
-                temp_vendor = Vendor(user=user, **vendor_data)
-                result = self.tally_service.sync_vendor_to_ledger(temp_vendor)
-                if result.get('success'):
-                    tally_success = True
-                else:
-                    tally_error = result.get('error', 'Unknown error syncing to Tally')
-            except Exception as e:
-                tally_error = str(e)
-                logging.error(f"Tally sync failed: {tally_error}")
 
-        # Check if vendor already exists
-        existing_vendor = None
-        try:
-            existing_vendor = Vendor.objects.get(user=user, name=vendor_data['name'])
-        except Vendor.DoesNotExist:
-            pass
-
-        if existing_vendor:
-            # Update existing vendor
-            for key, value in vendor_data.items():
-                if value:  # Only update non-empty fields
-                    setattr(existing_vendor, key, value)
-            existing_vendor.save()
-            vendor = existing_vendor
-            operation = "updated"
-        else:
-            # Create new vendor using the updated Vendor model
-            vendor = Vendor.objects.create(user=user, **vendor_data)
-            operation = "created"
-
-        # Sync with Google Sheets
-        sheets_success = False
-        sheets_error = None
-        if self.sheets_enabled:
-            try:
-                # Include financial data for Google Sheets
-                sheets_data = {
-                    'name': vendor.name,
-                    'email': vendor.email or '',
-                    'phone': vendor.phone or '',
-                    'gst_number': vendor.gst_number or '',
-                    'address': vendor.address or '',
-                    'total_payable': float(vendor.total_payable or 0),
-                    'total_paid': float(vendor.total_paid or 0),
-                    'outstanding_balance': float(vendor.outstanding_balance or 0),
-                    'created_at': vendor.created_at.strftime('%Y-%m-%d %H:%M:%S') if vendor.created_at else ''
-                }
-                sheets_success = self.sheets_service.add_vendor(sheets_data)
-            except Exception as e:
-                sheets_error = str(e)
-                logging.error(f"Google Sheets sync failed: {sheets_error}")
-        
-        # Sync with Tally
-        if self.tally_enabled and not tally_success:  # Only sync if not already synced earlier
+        with db_transaction.atomic():
+            # Check if vendor already exists
+            existing_vendor = None
             try:
-                result = self.tally_service.sync_vendor_to_ledger(vendor)
-                if result.get('success'):
-                    tally_success = True
-                else:
-                    tally_error = result.get('error', 'Unknown error syncing to Tally')
-            except Exception as e:
-                tally_error = str(e)
-                logging.error(f"Tally sync failed: {tally_error}")
-        
-        # Update response with sync status
-        sync_status = []
-        if sheets_success:
-            sync_status.append("Google Sheets")
-        elif sheets_error:
-            sync_status.append(f"Google Sheets sync failed: {sheets_error}")
-            
-        if self.tally_enabled:
-            if tally_success:
-                sync_status.append("Tally")
-            elif tally_error:
-                sync_status.append(f"Tally sync failed: {tally_error}")
-        
-        if sync_status:
-            sync_status_str = ", ".join(sync_status)
-            ai_response = f"✅ Vendor {operation} successfully and synced with {sync_status_str}!"
-        else:
-            ai_response = f"✅ Vendor {operation} successfully! (No sync services configured)"
-                
-        # Update AI response with financial summary if this is an update
-        if operation == "updated":
-            ai_response += f"\n\n💵 Financial Summary for {vendor.name}:"
-            ai_response += f"\n• Total Payable: ₹{vendor.total_payable:,.2f}"
-            ai_response += f"\n• Total Paid: ₹{vendor.total_paid:,.2f}"
-            ai_response += f"\n• Outstanding Balance: ₹{vendor.outstanding_balance:,.2f}"
+                existing_vendor = Vendor.objects.get(user=user, name=vendor_data['name'])
+            except Vendor.DoesNotExist:
+                pass
+
+            if existing_vendor:
+                # Update existing vendor
+                for key, value in vendor_data.items():
+                    if value:  # Only update non-empty fields
+                        setattr(existing_vendor, key, value)
+                existing_vendor.save()
+                vendor = existing_vendor
+                operation = "updated"
+            else:
+                # Create new vendor using the updated Vendor model
+                vendor = Vendor.objects.create(user=user, **vendor_data)
+                operation = "created"
+
+            # Queue Google Sheets and Tally sync for the outbox worker
+            sync_queued = False
+            if self.sheets_enabled or self.tally_enabled:
+                sync_queued = bool(enqueue_vendor_sync(
+                    vendor, tally=self.tally_enabled, sheets=self.sheets_enabled
+                ))
 
         # Update AI response with operation result
         ai_response = f"✅ Vendor '{vendor.name}' {operation} successfully!\n"
@@ -1082,12 +893,7 @@ class MessageView(APIView):
         ai_response += f"\n• Outstanding Balance: ₹{vendor.outstanding_balance:,.2f}"
         
         # Add sync status
-        if sheets_success:
-            ai_response += "\n\n📊 Data synced with Google Sheets."
-        elif sheets_error:
-            ai_response += f"\n\n⚠️ Note: Google Sheets sync failed ({sheets_error})"
-        else:
-            ai_response += "\n\n💾 Data saved locally (Google Sheets not configured)."
+        ai_response += self._sync_status_message(sync_queued)
             
         # Add helpful next steps
         ai_response += "\n\n💡 You can now record expenses for this vendor or view their transaction history."
@@ -1178,31 +984,104 @@ class MessageView(APIView):
         return ai_response
 
     def _parse_amount(self, amount_str):
-        """Helper method to parse amount strings"""
+        """Helper method to parse amount strings such as '₹1,250.50'"""
         if not amount_str or str(amount_str).strip().upper() == '[OPTIONAL]':
             return Decimal('0.00')
-        
-        # Handle string representation of numbers
-        if isinstance(amount_str, str):
-            # Remove currency symbols, commas, and any whitespace
-            amount_str = amount_str.replace('$', '').replace('€', '').replace('£', '').replace('₹', '').replace(',', '').strip()
-            
-            # If empty after cleaning, return 0
-            if not amount_str:
-                return Decimal('0.00')
-                
+
         try:
-            # Convert to Decimal with 2 decimal places for currency
-            return Decimal(amount_str).quantize(Decimal('0.00'))
-        except (ValueError, TypeError, InvalidOperation):
+            return to_decimal(amount_str)
+        except (ValueError, TypeError):
             logging.warning(f"Could not convert amount '{amount_str}' to decimal, using 0")
             return Decimal('0.00')
 
 
+class MessageStreamView(MessageView):
+    """Endpoint for chat messages that streams the AI reply as Server-Sent Events"""
+    
+    def post(self, request):
+        """
+        Process a new message and stream the reply
+
+        Emits a "start" event with the conversation id, "token" events as Gemini
+        produces text, and a final "done" event with the processed message once
+        the response has been parsed and saved.
+        """
+        try:
+            conversation, user_message, history, history_summary = self._start_turn(request)
+        except Exception as e:
+            logging.error(f"Unexpected error: {str(e)}", exc_info=True)
+            return Response({
+                'error': 'An unexpected error occurred',
+                'detail': str(e)
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        response = StreamingHttpResponse(
+            self._event_stream(request.user, conversation, user_message, history, history_summary),
+            content_type='text/event-stream'
+        )
+        response['Cache-Control'] = 'no-cache'
+        # Stop nginx from buffering the stream
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    def _event_stream(self, user, conversation, user_message, history, history_summary):
+        yield _sse_event('start', {'conversation_id': conversation.id})
+        try:
+            confirmation = self._resolve_confirmation(user, conversation, user_message)
+            if confirmation is not None:
+                ai_response, intent_type = confirmation
+                yield _sse_event('done', {
+                    'conversation_id': conversation.id,
+                    'message': ai_response,
+                    'intent_type': intent_type
+                })
+                return
+
+            local_answer = self._answer_locally(user, conversation, user_message)
+            if local_answer is not None:
+                yield _sse_event('token', {'text': local_answer})
+                yield _sse_event('done', {
+                    'conversation_id': conversation.id,
+                    'message': local_answer,
+                    'intent_type': 'QUERY_TRANSACTION'
+                })
+                return
+
+            result = self._fast_path(user_message)
+            if result is None:
+                for kind, value in self.gemini_service.stream_message(user_message, history, history_summary, user=user):
+                    if kind == 'token':
+                        yield _sse_event('token', {'text': value})
+                    else:
+                        result = value
+
+            ai_response, extracted_data, intent_type, is_query = result
+            ai_response, intent_type = self._complete_turn(
+                user, conversation, ai_response, extracted_data, intent_type, is_query
+            )
+            yield _sse_event('done', {
+                'conversation_id': conversation.id,
+                'message': ai_response,
+                'intent_type': intent_type
+            })
+        except Exception as e:
+            logging.error(f"Error streaming message: {str(e)}", exc_info=True)
+            yield _sse_event('error', {
+                'error': 'An unexpected error occurred',
+                'detail': str(e)
+            })
+
+
+def _sse_event(event, data):
+    """Format a single Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
 class CustomerView(APIView):
     """API endpoint for managing customers"""
     permission_classes = [permissions.IsAuthenticated]
     
+    @conditional_on_data_version()
     def get(self, request, customer_id=None):
         """Get all customers or a specific customer"""
         if customer_id:
@@ -1242,6 +1121,7 @@ class VendorView(APIView):
     """API endpoint for managing vendors"""
     permission_classes = [permissions.IsAuthenticated]
     
+    @conditional_on_data_version()
     def get(self, request, vendor_id=None):
         """Get all vendors or a specific vendor"""
         if vendor_id:
@@ -1281,6 +1161,7 @@ class TransactionView(APIView):
     """API endpoint for managing transactions"""
     permission_classes = [permissions.IsAuthenticated]
     
+    @conditional_on_data_version()
     def get(self, request, transaction_id=None):
         """Get all transactions or a specific transaction"""
         if transaction_id:
@@ -1319,22 +1200,12 @@ class TransactionView(APIView):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class TransactionConfirmView(APIView):
-    """Endpoint for confirming pending transactions"""
-    permission_classes = [permissions.IsAuthenticated]
-    
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        # Re-enabled Google Sheets with improved error handling
-        try:
-            self.sheets_service = GoogleSheetsService()
-            self.sheets_enabled = True
-        except Exception as e:
-            logging.error(f"Failed to initialize Google Sheets: {str(e)}")
-            self.sheets_enabled = False
+class TransactionConfirmView(MessageView):
+    """Endpoint for confirming pending proposals from a button instead of a "yes" reply"""
+    http_method_names = ['post', 'options']
     
     def post(self, request):
-        """Confirm or reject a pending transaction"""
+        """Confirm or reject a pending proposal through the same handlers as the chat flow"""
         serializer = TransactionConfirmSerializer(data=request.data)
         
         if not serializer.is_valid():
@@ -1343,96 +1214,28 @@ class TransactionConfirmView(APIView):
         pending_id = serializer.validated_data['pending_transaction_id']
         confirm = serializer.validated_data['confirm']
         
-        # Get the pending transaction
-        pending_transaction = get_object_or_404(
-            PendingTransaction, 
-            id=pending_id, 
-            user=request.user
-        )
+        pending = get_object_or_404(PendingTransaction, id=pending_id, user=request.user)
+        # Only the conversation's latest, unexpired proposal can be confirmed, as in the chat
+        if open_pending(pending.conversation) != pending:
+            return Response({
+                'status': 'error',
+                'message': 'This entry is no longer waiting for confirmation'
+            }, status=status.HTTP_409_CONFLICT)
         
-        if confirm:
-            # Prepare transaction data
-            transaction_data = {
-                'date': pending_transaction.date,
-                'description': pending_transaction.description,
-                'category': pending_transaction.category,
-                'transaction_type': pending_transaction.transaction_type,
-                'expected_amount': pending_transaction.expected_amount,
-                'paid_amount': pending_transaction.paid_amount,
-                'status': pending_transaction.status,
-                'payment_method': pending_transaction.payment_method,
-                'reference_number': pending_transaction.reference_number,
-                'customer': pending_transaction.customer,
-                'vendor': pending_transaction.vendor
-            }
-            
-            # Try to save to Google Sheets if enabled
-            sheets_success = False
-            if hasattr(self, 'sheets_enabled') and self.sheets_enabled:
-                try:
-                    sheets_data = transaction_data.copy()
-                    # Convert model instances to names for sheets
-                    if transaction_data.get('customer'):
-                        sheets_data['customer'] = transaction_data['customer'].name
-                    if transaction_data.get('vendor'):
-                        sheets_data['vendor'] = transaction_data['vendor'].name
-                        
-                    sheets_success = self.sheets_service.add_transaction(sheets_data)
-                except Exception as e:
-                    logging.error(f"Failed to add to Google Sheets: {str(e)}")
-            
-            # Always succeed locally even if Google Sheets fails
-            success = True
-            
-            if success:
-                # Create a Transaction record in our database
-                transaction = Transaction.objects.create(
-                    user=request.user,
-                    **transaction_data
-                )
-                
-                # Add confirmation message to conversation
-                conversation = pending_transaction.conversation
-                Message.objects.create(
-                    conversation=conversation,
-                    sender='AI',
-                    content=f"✅ Transaction confirmed and added to your records:\n\n"
-                            f"• {pending_transaction.date}: {pending_transaction.description}\n"
-                            f"• Expected Amount: {pending_transaction.expected_amount}\n"
-                            f"• Paid Amount: {pending_transaction.paid_amount}\n"
-                            f"• Category: {pending_transaction.category or 'Uncategorized'}"
-                )
-                
-                # Delete the pending transaction
-                pending_transaction.delete()
-                
-                return Response({
-                    'status': 'success',
-                    'message': 'Transaction added successfully',
-                    'transaction_id': transaction.id
-                })
-            else:
-                return Response({
-                    'status': 'error',
-                    'message': 'Failed to add transaction to your records'
-                }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        else:
-            # User rejected the transaction
-            conversation = pending_transaction.conversation
-            Message.objects.create(
-                conversation=conversation,
-                sender='AI',
-                content="Transaction cancelled. Is there anything else you'd like to do?"
-            )
-            
-            # Delete the pending transaction
-            pending_transaction.delete()
-            
+        result = self._settle_pending(request.user, pending.conversation, pending, confirm)
+        if result is None:
             return Response({
-                'status': 'success',
-                'message': 'Transaction cancelled'
-            })
-
+                'status': 'error',
+                'message': 'This entry is no longer waiting for confirmation'
+            }, status=status.HTTP_409_CONFLICT)
+        
+        ai_response, intent_type = result
+        return Response({
+            'status': 'success',
+            'conversation_id': pending.conversation_id,
+            'message': ai_response,
+            'intent_type': intent_type
+        })
 
 
 @login_required
@@ -1509,16 +1312,18 @@ def financial_summary(request):
     print("\n" + "="*80 + "\n")
     
     # Generate insights
-    gemini_service = GeminiService()
+    gemini_service = get_gemini_service()
     insights = gemini_service.generate_actionable_insights(
         transaction_data,
         customer_data,
         vendor_data
     )
     
+    totals = ledger_totals(request.user, thirty_days_ago)
+
     return render(request, 'summary.html', {
         'insights': insights,
-        'total_income': sum(t.amount for t in transactions if t.transaction_type == 'INCOME'),
-        'total_expenses': sum(t.amount for t in transactions if t.transaction_type == 'EXPENSE'),
+        'total_income': totals['total_income'],
+        'total_expenses': totals['total_expenses'],
         'recent_transactions': transactions[:10]  # Show last 10 transactions
     })
\ No newline at end of file
@@ -56,6 +56,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "counto_app.middleware.QueryCountHeaderMiddleware",
 ]
 
 CORS_ALLOW_ALL_ORIGINS = True
@@ -189,6 +190,51 @@ GOOGLE_SHEETS_TRANSACTIONS_RANGE = os.getenv('GOOGLE_SHEETS_TRANSACTIONS_RANGE',
 GOOGLE_SHEETS_CUSTOMERS_RANGE = os.getenv('GOOGLE_SHEETS_CUSTOMERS_RANGE', 'Customers!A2:F')
 GOOGLE_SHEETS_VENDORS_RANGE = os.getenv('GOOGLE_SHEETS_VENDORS_RANGE', 'Vendors!A2:F')
 
+# Queued Sheets writes are held in the sync outbox and flushed together once this many are
+# due or the oldest has waited this long, so each sheet costs one API call per flush
+SHEETS_FLUSH_MAX_ROWS = int(os.getenv('SHEETS_FLUSH_MAX_ROWS', '50'))
+SHEETS_FLUSH_INTERVAL_SECONDS = int(os.getenv('SHEETS_FLUSH_INTERVAL_SECONDS', '10'))
+# Sheets reads are served from a per-process local mirror at most this many seconds old.
+# Rows the sync worker overwrites are logged in SheetsWrite and re-fetched at the next
+# refresh; hand edits on the sheet wait for a rotating check of one 200-row block per refresh.
+SHEETS_MIRROR_MAX_AGE_SECONDS = float(os.getenv('SHEETS_MIRROR_MAX_AGE_SECONDS', '30'))
+# How long a spreadsheet's verified sheet layout is trusted before it is checked again
+SHEETS_METADATA_TTL_SECONDS = int(os.getenv('SHEETS_METADATA_TTL_SECONDS', '3600'))
+
+# Chat history sent to Gemini: the last N messages within a token budget, plus a rolling summary
+CHAT_HISTORY_MAX_MESSAGES = int(os.getenv('CHAT_HISTORY_MAX_MESSAGES', '12'))
+CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv('CHAT_HISTORY_TOKEN_BUDGET', '1500'))
+CHAT_SUMMARY_BATCH_SIZE = int(os.getenv('CHAT_SUMMARY_BATCH_SIZE', '6'))
+
+# Approximate token budget for ledger data included in query prompts
+QUERY_CONTEXT_TOKEN_BUDGET = int(os.getenv('QUERY_CONTEXT_TOKEN_BUDGET', '2000'))
+
+# Ask Gemini for schema-constrained JSON instead of tagged free text (streaming always uses text)
+GEMINI_STRUCTURED_OUTPUT = os.getenv('GEMINI_STRUCTURED_OUTPUT', 'True').lower() in ('true', '1', 'yes')
+
+# Analytics responses are cached per user and data version. A file-based cache is shared
+# by every worker process on the host without running a cache server.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'analytics': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('ANALYTICS_CACHE_DIR', str(BASE_DIR / 'cache' / 'analytics')),
+        'TIMEOUT': 60 * 60 * 24,
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+}
+
+# Users whose transactions are kept in memory as NumPy columns, per worker process
+LEDGER_ENGINE_MAX_USERS = int(os.getenv('LEDGER_ENGINE_MAX_USERS', '16'))
+
+# Per-user SQLite copies of the ledger for analytical reads, kept off the main database.
+# Leave OLAP_DATA_DIR empty to disable them; every read then goes to the main database.
+OLAP_DATA_DIR = os.getenv('OLAP_DATA_DIR', '')
+# LedgerChange rows older than this are pruned; a sidecar not refreshed for this long is rebuilt
+OLAP_CHANGE_RETENTION_DAYS = int(os.getenv('OLAP_CHANGE_RETENTION_DAYS', '7'))
+
 # Logging Configuration
 LOGGING = {
     'version': 1,